@@ -2,6 +2,7 @@ from collections import defaultdict
 from itertools import chain, product
 from typing import Any, Callable, Iterable, Mapping, NamedTuple, Tuple, Union
 
+from .graphval import GraphVal
 from .utils import addi, muli
 from .vtypes import Ptr, VType, int32_
 
@@ -100,8 +101,8 @@ class CumPos(defaultdict):
 
 
 class OrdDims(Tuple[Dimension]):
-    def __init__(self, dims: Iterable[Dimension]):
-        super().__init__(dims)
+    def __new__(cls, dims: Iterable[Dimension]):
+        return super().__new__(cls, dims)
 
     def get_idx(self, pos: CumPos):
         pos = pos.copy()
@@ -235,7 +236,7 @@ class ArrayDescr:
             start_pos = 0
 
         items = IndexesArray(
-            dims=self.dims,
+            dims=(),
             items=(start_pos,)
         )
         shift = 1
@@ -264,19 +265,29 @@ class StoredArray(ArrayDescr):
 
     @property
     def arr_node(self):
-        return Ptr(self._t)(self._arr)
+        return Ptr(self._t).var(self._arr)
+
+    def index_nodes(self, ddims: Mapping[str, int], start=0) -> 'MemArray':
+        # int32_ nodes `start + offset`, so that equal accesses get equal nodes
+        if not isinstance(start, GraphVal):
+            return self.block_indexes(ddims, start).map(int32_.from_const)
+        return self.block_indexes(ddims).map(
+            lambda off: start + int32_.from_const(off) if off else start
+        )
 
     def load(self, ddims: Mapping[str, int], start=0):
-        return self.block_indexes(ddims, start).map(
-            lambda idx: self._t.load(self.arr_node, idx)
+        arr = self.arr_node
+        return self.index_nodes(ddims, start).map(
+            lambda idx: self._t.load(arr, idx)
         )
 
     def store(self, a: 'MemArray', start=0):
-        idxs = self.block_indexes(a.ddims, start)
+        arr = self.arr_node
+        idxs = self.index_nodes(a.ddims, start)
         a = a.reshape(idxs.dims)
         a.map2(
             idxs,
-            lambda v, idx: v.store(self.arr_node, idx)
+            lambda v, idx: v.store(arr, idx)
         )
 
 
@@ -356,9 +367,9 @@ class IndexesArray(MemArray):
         shifted = [self._items]
         cur_shift = shift
         for i in range(1, dim.size):
-            shifted.append(
-                addi(v, shift) for v in self._items
-            )
+            shifted.append([
+                addi(v, cur_shift) for v in self._items
+            ])
             cur_shift = addi(cur_shift, shift)
         return IndexesArray(
             dims=chain(self.dims, (dim,)),
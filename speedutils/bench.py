@@ -0,0 +1,418 @@
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List
+
+from .graph import optim
+from .graphio import dump_graph, load_graph
+from .proc_ctx import new_graph, proc
+from .proc_descr import Op, ProcDescr, SignOp, SimpleLoadOp, SimpleStoreOp, TypedNoargOp
+from .sched import estimate_cycles, list_schedule
+from .shader.types import ConcatOp
+from .slp import slp_vectorize
+from .vtypes import float_, int32_, v4f
+
+bench_pd = ProcDescr(
+    name='benchproc',
+    mem_levels=(
+        ('regs', 16, 0, 0.0),
+        ('L1', 3200, 1, 7.0)
+    ),
+    ops=(
+        SimpleLoadOp(ret_t=float_, exec_t=7.0, ports=(6, 1)),
+        SimpleLoadOp(ret_t=int32_, exec_t=7.0, ports=(6, 1)),
+        SimpleStoreOp(float_, exec_t=7.0, ports=(6, 1)),
+        SignOp('add', '+', (float_, float_), ret_t=float_, exec_t=4.0, ports=(4,), args_ordered=False),
+        SignOp('sub', '-', (float_, float_), ret_t=float_, exec_t=4.0, ports=(4,)),
+        SignOp('mul', '*', (float_, float_), ret_t=float_, exec_t=5.5, ports=(5,), args_ordered=False),
+        SignOp('neg', '-', (float_,), ret_t=float_, exec_t=1.0, ports=(4,)),
+        SignOp('add', '+', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), args_ordered=False),
+        TypedNoargOp(name='zero', ret_t=float_, exec_t=1.0, ports=(4,)),
+        TypedNoargOp(name='const', ret_t=float_, exec_t=1.0, ports=(3,)),
+        TypedNoargOp(name='const', ret_t=int32_, exec_t=1.0, ports=(3,)),
+        SimpleLoadOp(ret_t=v4f, exec_t=8.0, ports=(6, 1)),
+        SimpleStoreOp(v4f, exec_t=8.0, ports=(6, 1)),
+        SignOp('add', '+', (v4f, v4f), ret_t=v4f, exec_t=4.0, ports=(4,), args_ordered=False),
+        SignOp('sub', '-', (v4f, v4f), ret_t=v4f, exec_t=4.0, ports=(4,)),
+        SignOp('mul', '*', (v4f, v4f), ret_t=v4f, exec_t=5.5, ports=(5,), args_ordered=False),
+        ConcatOp(v4f, exec_t=2.0, ports=(3,)),
+        Op(name='get_elemYv4f', ret_t=float_, exec_t=1.0, ports=(3,)),
+        TypedNoargOp(name='const', ret_t=v4f, exec_t=1.0, ports=(3,)),
+    )
+)
+
+
+def ring_graph(n: int, rounds: int = 3):
+    arr = float_.var('arr')
+    t = [
+        float_.var(f'x{i}') for i in range(n)
+    ]
+    for r in range(rounds):
+        for i in range(n):
+            t[i] = t[i] * t[(i + r + 3) % n] + t[(i + r + 4) % n]
+    for i in range(n):
+        t[i].store(arr, int32_.var(f'i{i}'))
+    # repeat the whole computation, every node is a CSE hit now
+    t = [
+        float_.var(f'x{i}') for i in range(n)
+    ]
+    for r in range(rounds):
+        for i in range(n):
+            t[i] = t[(i + r + 3) % n] * t[i] + t[(i + r + 4) % n]
+
+
+def bench_trace(n: int = 20000, rounds: int = 3):
+    with proc(bench_pd), new_graph() as g:
+        start = perf_counter()
+        ring_graph(n, rounds)
+        elapsed = perf_counter() - start
+    built = n * (4 + 4 * rounds)
+    return {
+        'nodes': len(g._op_idx),
+        'built': built,
+        'seconds': elapsed,
+        'nodes_per_s': built / elapsed,
+    }
+
+
+def bench_memory(n: int = 20000, rounds: int = 3):
+    with proc(bench_pd), new_graph() as g:
+        tracemalloc.start()
+        start = perf_counter()
+        ring_graph(n, rounds)
+        elapsed = perf_counter() - start
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    nodes = len(g._op_idx)
+    return {
+        'nodes': nodes,
+        'bytes_per_node': size / nodes,
+        'peak_bytes_per_node': peak / nodes,
+        'nodes_per_s': n * (4 + 4 * rounds) / elapsed,
+    }
+
+
+def bench_export(n: int = 20000, rounds: int = 3, columnar=False):
+    with proc(bench_pd), new_graph(columnar=columnar) as g:
+        ring_graph(n, rounds)
+        start = perf_counter()
+        g.optim_graph()
+        elapsed = perf_counter() - start
+    return {
+        'nodes': len(g._op_idx),
+        'columnar': columnar,
+        'seconds': elapsed,
+    }
+
+
+def bench_load(n: int = 20000, rounds: int = 3):
+    with proc(bench_pd):
+        with new_graph() as g:
+            start = perf_counter()
+            ring_graph(n, rounds)
+            trace_s = perf_counter() - start
+        data = dump_graph(g)
+        start = perf_counter()
+        load_graph(data)
+        load_s = perf_counter() - start
+    return {
+        'nodes': len(g._op_idx),
+        'bytes': len(data),
+        'trace_seconds': trace_s,
+        'load_seconds': load_s,
+    }
+
+
+def bench_schedule(n: int = 200, rounds: int = 3, compare_optim=True):
+    # the extension prints its own finish times before and after its search
+    with proc(bench_pd), new_graph() as g:
+        ring_graph(n, rounds)
+        start = perf_counter()
+        sched = list_schedule(g)
+        elapsed = perf_counter() - start
+        r = {
+            'nodes': len(g._op_idx),
+            'seconds': elapsed,
+            'cycles': sched.cycles,
+            'source_cycles': sched.source_cycles,
+        }
+        if compare_optim and optim is not None:
+            prog = g.optim_graph()._prog
+            start = perf_counter()
+            optim.test(prog)
+            r['optim_seconds'] = perf_counter() - start
+    return r
+
+
+def elementwise_graph(n: int):
+    # out[i] = a[i] * b[i] + c over n floats
+    a, b, out = float_.var('a'), float_.var('b'), float_.var('out')
+    i = int32_.var('i')
+    c = float_.var('c')
+    for k in range(n):
+        idx = i + int32_.from_const(k) if k else i
+        (float_.load(a, idx) * float_.load(b, idx) + c).store(out, idx)
+
+
+def bench_slp(n: int = 20000):
+    with proc(bench_pd), new_graph() as g:
+        elementwise_graph(n)
+        scalar_nodes = len(g.select_used())
+        scalar_cycles = estimate_cycles(g)
+        start = perf_counter()
+        stats = slp_vectorize(g, restrict=True)  # a, b and out are distinct arrays
+        elapsed = perf_counter() - start
+        return {
+            'packs': stats.packs,
+            'scalar_nodes': scalar_nodes,
+            'nodes': len(g.select_used()),
+            'scalar_cycles': scalar_cycles,
+            'cycles': estimate_cycles(g),
+            'seconds': elapsed,
+        }
+
+
+def bench_cse(n: int = 20000, repeats: int = 5):
+    with proc(bench_pd), new_graph() as g:
+        x = [float_.var(f'x{i}') for i in range(64)]
+        start = perf_counter()
+        for _ in range(repeats):
+            for i in range(n):
+                x[i % 64] * x[(i + 7) % 64] + x[(i + 13) % 64]
+        elapsed = perf_counter() - start
+    built = 2 * n * repeats
+    return {
+        'nodes': len(g._op_idx),
+        'built': built,
+        'seconds': elapsed,
+        'nodes_per_s': built / elapsed,
+    }
+
+
+def _ring_n(size: int) -> int:
+    # ring_graph(n) has about 9n used nodes
+    return max(8, size // 9)
+
+
+def bench_used(size: int):
+    with proc(bench_pd), new_graph() as g:
+        start = perf_counter()
+        ring_graph(_ring_n(size))
+        trace_s = perf_counter() - start
+        start = perf_counter()
+        used = len(g.select_used())
+        select_s = perf_counter() - start
+        start = perf_counter()
+        g.recompute_used()
+        recompute_s = perf_counter() - start
+    return {
+        'nodes': used,
+        'trace_seconds': trace_s,
+        'select_used_seconds': select_s,
+        'recompute_used_seconds': recompute_s,
+    }
+
+
+def bench_optim_graph(size: int):
+    if optim is None:
+        raise RuntimeError('optim extension is not built')
+    with proc(bench_pd), new_graph() as g:
+        ring_graph(_ring_n(size))
+        start = perf_counter()
+        g.optim_graph()
+        elapsed = perf_counter() - start
+    return {
+        'nodes': len(g.select_used()),
+        'seconds': elapsed,
+        'nodes_per_s': len(g.select_used()) / elapsed,
+    }
+
+
+def bench_render(n: int = 20000, reuse_names=False):
+    with proc(bench_pd), new_graph() as g:
+        ring_graph(n)
+        start = perf_counter()
+        lines = sum(1 for _ in g.render_code(reuse_names=reuse_names))
+        elapsed = perf_counter() - start
+    return {
+        'lines': lines,
+        'seconds': elapsed,
+        'lines_per_s': lines / elapsed,
+    }
+
+
+def _bench_gen(f, opts, repeats: int):
+    with proc(bench_pd):
+        start = perf_counter()
+        for _ in range(repeats):
+            code = f.gen_code(opts)
+        elapsed = perf_counter() - start
+    return {
+        'bytes': len(code),
+        'seconds': elapsed / repeats,
+    }
+
+
+def bench_loop_func(repeats: int = 20):
+    from .proc_ctx import func_ctx
+    from .loop import LoopFunc
+
+    @LoopFunc(name='bench_loop', loop_dims=(('x', 8), ('y', 64), ('x', 64)), block_ddims=(('x', 4),))
+    def f(it_x, it_y):
+        func_ctx.get_var('a', float_).store(float_.var('out'), it_x + it_y)
+
+    return _bench_gen(f, {}, repeats)
+
+
+def bench_gpu_loop_func(repeats: int = 20):
+    from .proc_ctx import func_ctx
+    from .gpu import CUDAFunc
+    from .loop import GpuLoopFunc
+
+    @GpuLoopFunc(CUDAFunc, name='bench_gpu_loop', loop_dims=(('y', 4), ('x', 2), ('y', 64)), block_ddims=(('x', 2), ('y', 4)))
+    def f(it_x, it_y):
+        func_ctx.get_var('a', float_).store(float_.var('out'), it_x + it_y)
+
+    return _bench_gen(f, {}, repeats)
+
+
+def _bench_shader(make, repeats: int):
+    from .test import pd as shader_pd
+
+    with proc(shader_pd):
+        start = perf_counter()
+        for _ in range(repeats):
+            text = make().render()
+        elapsed = perf_counter() - start
+    return {
+        'bytes': len(text),
+        'seconds': elapsed / repeats,
+    }
+
+
+def bench_vertex_shader(repeats: int = 50):
+    from .shader.base import SimpleVertexShader
+    return _bench_shader(SimpleVertexShader, repeats)
+
+
+def bench_fragment_shader(repeats: int = 50):
+    from .shader.base import SimpleFragmentShader, SimpleVertexShader
+    from .test import pd as shader_pd
+
+    with proc(shader_pd):
+        vert = SimpleVertexShader()
+        vert.render()
+
+    return _bench_shader(
+        lambda: SimpleFragmentShader(inputs=vert.output_params, uniform_inputs=vert.uniform_params),
+        repeats
+    )
+
+
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+
+FORMAT_VERSION = 1
+
+
+def workloads(sizes: Iterable[int] = DEFAULT_SIZES) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    r = {
+        'trace': bench_trace,
+        'cse': bench_cse,
+        'memory': bench_memory,
+        'load': bench_load,
+        'export': bench_export,
+        'export_columnar': partial(bench_export, columnar=True),
+        'render': bench_render,
+        'render_reuse_names': partial(bench_render, reuse_names=True),
+        'schedule': partial(bench_schedule, 20000, compare_optim=False),
+        'slp': bench_slp,
+        'loop_func': bench_loop_func,
+        'gpu_loop_func': bench_gpu_loop_func,
+        'vertex_shader': bench_vertex_shader,
+        'fragment_shader': bench_fragment_shader,
+    }
+    for size in sizes:
+        r[f'used/{size}'] = partial(bench_used, size)
+        r[f'optim_graph/{size}'] = partial(bench_optim_graph, size)
+    return r
+
+
+def run_suite(names: Iterable[str] = None, sizes: Iterable[int] = DEFAULT_SIZES, log=True) -> Dict[str, Any]:
+    # a failing workload is recorded with its error, the others still run
+    all_workloads = workloads(sizes)
+    if names is None:
+        names = all_workloads
+    results = {}
+    for name in names:
+        try:
+            results[name] = all_workloads[name]()
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+        if log:
+            print(f'{name}: {results[name]}', file=sys.stderr)
+    return {
+        'version': FORMAT_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.1) -> List[str]:
+    # `*seconds` must not grow and `*_per_s` must not drop by more than `tolerance`
+    regressions = []
+    for name, base in baseline['results'].items():
+        r = results['results'].get(name)
+        if r is None or 'error' in base:
+            continue
+        if 'error' in r:
+            regressions.append(f'{name}: {r["error"]}')
+            continue
+        for k, b in base.items():
+            v = r.get(k)
+            if not isinstance(v, (int, float)) or not isinstance(b, (int, float)) or b <= 0:
+                continue
+            if k.endswith('seconds') and v > b * (1 + tolerance):
+                regressions.append(f'{name}.{k}: {v:.4g} vs {b:.4g}')
+            elif k.endswith('_per_s') and v < b / (1 + tolerance):
+                regressions.append(f'{name}.{k}: {v:.4g} vs {b:.4g}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='speedutils benchmarks')
+    parser.add_argument('workloads', nargs='*', help='workloads to run, all by default')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='graph sizes for used/optim_graph')
+    parser.add_argument('--json', help='write results to this file instead of stdout')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--list', action='store_true', help='list the workloads and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(workloads(args.sizes)))
+        return 0
+
+    results = run_suite(args.workloads or None, args.sizes)
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f'REGRESSION {r}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import sys
+import traceback
+from time import perf_counter
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from .cache import KernelCache
+from .func import func_reg
+from .proc_ctx import proc, proc_ctx
+from .proc_descr import ProcDescr
+from .sink import BufferSink, FileSink
+
+GenResult = NamedTuple('GenResult', (('name', str), ('code', Optional[str]), ('seconds', float), ('error', Optional[str])))
+
+ProgressFn = Callable[[int, int, GenResult], None]
+
+# set before the pool forks, workers read it instead of receiving pickled funcs
+_worker_state: Optional[Tuple[ProcDescr, Optional[KernelCache]]] = None
+
+
+def print_progress(done: int, total: int, r: GenResult):
+    status = 'FAILED' if r.error is not None else f'{r.seconds:.3f}s'
+    print(f'[{done}/{total}] {r.name} {status}', file=sys.stderr)
+
+
+def _gen_one(name: str) -> GenResult:
+    pd, cache = _worker_state
+    f, consts = func_reg[name]
+    start = perf_counter()
+    try:
+        # through gen, gpu funcs prefix the kernel there
+        sink = BufferSink()
+        with proc(pd):
+            f.gen({n: v for n, t, v in consts}, cache=cache, sink=sink)
+        code = sink.getvalue().rstrip('\n')
+    except Exception:
+        return GenResult(name, None, perf_counter() - start, traceback.format_exc())
+    return GenResult(name, code, perf_counter() - start, None)
+
+
+def _can_fork() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def generate_all(
+        names: Iterable[str] = None, jobs: int = None, cache: KernelCache = None,
+        progress: Optional[ProgressFn] = print_progress
+) -> List[GenResult]:
+    # must run inside proc(), results are sorted by name whatever order they finish in
+    global _worker_state
+    names = sorted(func_reg if names is None else names)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(names)))
+
+    _worker_state = (proc_ctx.model.pd, cache)
+    results = []
+    try:
+        if jobs == 1 or not _can_fork():
+            done = map(_gen_one, names)
+            pool = None
+        else:
+            pool = multiprocessing.get_context('fork').Pool(jobs)
+            done = pool.imap_unordered(_gen_one, names)
+        try:
+            for r in done:
+                results.append(r)
+                if progress is not None:
+                    progress(len(results), len(names), r)
+        finally:
+            if pool is not None:
+                pool.terminate()
+    finally:
+        _worker_state = None
+
+    results.sort()
+    failed = [r for r in results if r.error is not None]
+    if failed:
+        details = '\n'.join(f'{r.name}:\n{r.error}' for r in failed)
+        raise RuntimeError(f'Generation failed for {len(failed)} of {len(names)} functions\n{details}')
+    return results
+
+
+def write_all(results: Iterable[GenResult], path: str) -> FileSink:
+    with FileSink(path) as sink:
+        for r in results:
+            with sink.section(r.name):
+                sink.write(r.code + '\n')
+    return sink
@@ -0,0 +1,181 @@
+import hashlib
+import inspect
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # no flock, eviction is not serialized between processes
+    fcntl = None
+
+from .proc_descr import ProcDescr
+
+CACHE_DIR_ENV = 'SPEEDUTILS_CACHE_DIR'
+
+_lib_hash: Optional[str] = None
+
+
+def library_hash() -> str:
+    # any change of the library sources invalidates cached kernels
+    global _lib_hash
+    if _lib_hash is None:
+        h = hashlib.sha256()
+        root = Path(__file__).parent
+        for path in sorted(root.rglob('*.py')):
+            h.update(str(path.relative_to(root)).encode())
+            h.update(path.read_bytes())
+        _lib_hash = h.hexdigest()
+    return _lib_hash
+
+
+def fingerprint(obj: Any) -> str:
+    if isinstance(obj, dict):
+        items = sorted((fingerprint(k), fingerprint(v)) for k, v in obj.items())
+        return '{' + ','.join(f'{k}:{v}' for k, v in items) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '(' + ','.join(map(fingerprint, obj)) + ')'
+    if isinstance(obj, (set, frozenset)):
+        return '{' + ','.join(sorted(map(fingerprint, obj))) + '}'
+    if inspect.isclass(obj) or inspect.isbuiltin(obj):
+        return _qualname(obj)
+    if inspect.isfunction(obj):
+        # closures of one factory differ only in what they captured
+        cells = tuple(
+            _qualname(c.cell_contents) if inspect.isfunction(c.cell_contents) else c.cell_contents
+            for c in obj.__closure__ or ()
+        )
+        return _qualname(obj) + (fingerprint(cells) if cells else '')
+    if isinstance(obj, partial):
+        return 'partial' + fingerprint((obj.func, obj.args, obj.keywords))
+    if obj is None or isinstance(obj, (str, bytes, int, float, complex)):
+        return f'{type(obj).__name__}:{obj!r}'
+    # a repr may hold an address, the key would differ in every process
+    raise TypeError(f'Cannot fingerprint {type(obj).__name__} values')
+
+
+def _qualname(obj) -> str:
+    return f'{obj.__module__}.{obj.__qualname__}'
+
+
+def pd_fingerprint(pd: ProcDescr) -> str:
+    return fingerprint((
+        pd.name,
+        pd.mem_levels,
+        tuple(
+            (type(o), o.name, o.ret_t, o.exec_t, o.ports, o.args_ordered, o.expr, o.py_eval)
+            for o in pd.ops
+        ),
+    ))
+
+
+def source_fingerprint(*objs) -> str:
+    parts = []
+    for obj in objs:
+        try:
+            parts.append(inspect.getsource(obj))
+        except (OSError, TypeError):  # defined interactively, fall back to bytecode
+            code = getattr(inspect.unwrap(obj), '__code__', None)
+            parts.append(fingerprint(obj) if code is None else code.co_code.hex())
+    return '\n'.join(parts)
+
+
+@contextmanager
+def file_lock(path: Union[str, os.PathLike]):
+    # exclusive between processes, the lock file is left behind
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def cache_key(*parts: str) -> str:
+    h = hashlib.sha256(library_hash().encode())
+    for p in parts:
+        h.update(b'\0')
+        h.update(p.encode())
+    return h.hexdigest()
+
+
+class KernelCache:
+    def __init__(self, root: Union[str, os.PathLike], max_bytes: int = 256 << 20):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:]
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            text = path.read_text(encoding='utf-8')
+            os.utime(path)  # mtime is the LRU order
+        except FileNotFoundError:  # missing or evicted meanwhile
+            return None
+        return text
+
+    def put(self, key: str, text: str):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def _entries(self) -> Iterable[os.DirEntry]:
+        for d in os.scandir(self.root):
+            if d.is_dir():
+                for e in os.scandir(d.path):
+                    if not e.name.startswith('.tmp'):
+                        yield e
+
+    def evict(self):
+        with file_lock(self.root / '.lock'):
+            entries = []
+            total = 0
+            for e in self._entries():
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+_default_cache: Optional[KernelCache] = None
+
+
+def set_default_cache(cache: Optional[KernelCache]):
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_cache() -> Optional[KernelCache]:
+    global _default_cache
+    if _default_cache is None and os.environ.get(CACHE_DIR_ENV):
+        _default_cache = KernelCache(os.environ[CACHE_DIR_ENV])
+    return _default_cache
@@ -0,0 +1,104 @@
+from array import array
+from typing import Iterable, List, Sequence, TYPE_CHECKING, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # columnar graphs are optional
+    np = None
+
+if TYPE_CHECKING:
+    from .graphval import GraphVal
+
+COL_HAS_OUTPUT = 1
+COL_CONST = 2
+COL_RENDERED = 4
+
+
+# row view over compressed argument lists, passed to `optim._prog` as the graph
+class CSRRows(Sequence):
+    def __init__(self, ptr: List[int], idx: List[int]):
+        self._ptr = ptr
+        self._idx = idx
+
+    def __len__(self):
+        return len(self._ptr) - 1
+
+    def __getitem__(self, i):
+        return self._idx[self._ptr[i]:self._ptr[i + 1]]
+
+
+class NodeColumns:
+    def __init__(self):
+        if np is None:
+            raise RuntimeError('Columnar graph storage requires numpy')
+        self.nodes: List['GraphVal'] = []
+        self.op_ids = array('i')
+        self.scopes = array('i')
+        self.flags = array('B')
+        self.arg_ptr = array('q', (0,))
+        self.arg_idx = array('i')
+        self.used = bytearray()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def append(self, v: 'GraphVal', op_id: int, args: Iterable[int]) -> int:
+        n = len(self.nodes)
+        self.nodes.append(v)
+        self.op_ids.append(op_id)
+        self.scopes.append(v.scope_n)
+        self.flags.append(
+            (COL_HAS_OUTPUT if v.has_output else 0)
+            | (COL_CONST if v.const else 0)
+            | (COL_RENDERED if v.is_rendered else 0)
+        )
+        self.arg_idx.extend(args)
+        self.arg_ptr.append(len(self.arg_idx))
+        self.used.append(0)
+        return n
+
+    def mark_used(self, n: int):
+        self.used[n] = 1
+
+    def clear_used(self):
+        self.used = bytearray(len(self.used))
+
+    def _np(self) -> Tuple['np.ndarray', ...]:
+        return (
+            np.frombuffer(self.op_ids, np.int32),
+            np.frombuffer(self.scopes, np.int32),
+            np.frombuffer(self.flags, np.uint8),
+            np.frombuffer(self.arg_ptr, np.int64),
+            np.frombuffer(self.arg_idx, np.int32),
+        )
+
+    @staticmethod
+    def _gather_args(ptr: 'np.ndarray', idx: 'np.ndarray', rows: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+        starts = ptr[rows]
+        lens = ptr[rows + 1] - starts
+        row_ptr = np.zeros(len(rows) + 1, np.int64)
+        np.cumsum(lens, out=row_ptr[1:])
+        pos = np.arange(row_ptr[-1], dtype=np.int64) - np.repeat(row_ptr[:-1] - starts, lens)
+        return row_ptr, idx[pos]
+
+    def used_mask(self) -> 'np.ndarray':
+        return np.frombuffer(self.used, np.bool_)
+
+    def ordered_rows(self, used: 'np.ndarray' = None) -> 'np.ndarray':
+        if used is None:
+            used = self.used_mask()
+        scopes = np.frombuffer(self.scopes, np.int32)
+        rows = np.flatnonzero(used)
+        return rows[np.argsort(scopes[rows], kind='stable')]
+
+    def export(self, n_scopes: int, used: 'np.ndarray' = None):
+        op_ids, scopes, _, ptr, idx = self._np()
+        rows = self.ordered_rows(used)
+        remap = np.empty(len(self.nodes), np.int32)
+        remap[rows] = np.arange(len(rows), dtype=np.int32)
+
+        row_ptr, args = self._gather_args(ptr, idx, rows)
+        args = remap[args]
+        scope_ends = np.cumsum(np.bincount(scopes[rows], minlength=n_scopes))
+
+        return rows, op_ids[rows], CSRRows(row_ptr.tolist(), args.tolist()), scope_ends
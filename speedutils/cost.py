@@ -0,0 +1,118 @@
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from .graphval import GraphVal
+from .proc_descr import MemLevel
+from .sched import _Ports, _issued_op, _latency, _scope_deps, _scope_runs
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+# cycles of one execution of the scope
+ScopeCost = NamedTuple('ScopeCost', (
+    ('scope_n', int), ('block', int), ('exp_use', float), ('nodes', int),
+    ('critical_path', float), ('port_bound', float), ('cycles', float)
+))
+
+# exp_use weighted sums over the scopes of a block and its nested blocks
+BlockCost = NamedTuple('BlockCost', (
+    ('block', int), ('parent', Optional[int]), ('critical_path', float), ('port_bound', float), ('cycles', float)
+))
+
+CostReport = NamedTuple('CostReport', (('scopes', Tuple[ScopeCost, ...]), ('blocks', Dict[int, BlockCost])))
+
+
+def _mem_level(levels: Sequence[MemLevel], dist: int) -> MemLevel:
+    # same selection as proc_state::mem_level_select
+    for m in levels:
+        if dist <= m.size:
+            return m
+        dist -= m.size
+    return levels[-1]
+
+
+def _scope_cost(
+        graph: 'FlowGraph', nodes: Sequence[GraphVal], order: Sequence[int]
+) -> Tuple[float, float, float]:
+    levels = graph.model.mem_levels
+    get_alias = graph.get_alias
+    pos = {v.orig: n for n, v in enumerate(nodes)}
+    deps = _scope_deps(graph, nodes)
+
+    ports = _Ports()
+    end = [0.0] * len(nodes)
+    path = [0.0] * len(nodes)
+    # step of the last read, values far behind are loaded from a slower level
+    last_use = [0] * len(nodes)
+    pressure: Dict[int, float] = defaultdict(float)
+    finish = 0.0
+    for step, n in enumerate(order):
+        v = nodes[n]
+        args = {pos[a.orig] for a in map(get_alias, v.a) if a.orig in pos}
+        ready_t = longest = 0.0
+        for d in deps[n]:
+            load_t = 0.0
+            arg_t = end[d]
+            if d in args and levels:
+                m = _mem_level(levels, step - last_use[d])
+                load_t = m.load_time
+                last_use[d] = step
+                if load_t:
+                    pressure[m.port_n] += load_t
+                    arg_t = ports.free[m.port_n] = max(ports.free.get(m.port_n, 0.0), arg_t) + load_t
+            ready_t = max(ready_t, arg_t)
+            longest = max(longest, path[d] + load_t)
+
+        op = _issued_op(v)
+        end[n] = ports.issue(op, ready_t)
+        path[n] = longest + _latency(v)
+        last_use[n] = step
+        finish = max(finish, end[n])
+        if op is not None and op.ports:
+            port = min(op.ports, key=lambda p: pressure[p])
+            pressure[port] += op.exec_t
+
+    return max(path, default=0.0), max(pressure.values(), default=0.0), finish
+
+
+def estimate_cost(graph: 'FlowGraph', ord: Optional[Sequence[int]] = None) -> CostReport:
+    # `ord` as for render_code, e.g. from sched.list_schedule
+    nodes = graph.used_ordered()
+    scopes = graph.scopes
+    if ord is None:
+        ord = range(len(nodes))
+    pos = {n: i for i, n in enumerate(ord)}
+
+    scope_costs: List[ScopeCost] = []
+    for start, end in _scope_runs(nodes):
+        scope_nodes = nodes[start:end]
+        scope = scopes[scope_nodes[0].scope_n]
+        order = sorted(range(end - start), key=lambda n: pos[start + n])
+        critical_path, port_bound, cycles = _scope_cost(graph, scope_nodes, order)
+        scope_costs.append(ScopeCost(
+            scope_nodes[0].scope_n, scope.block, scope.exp_use, end - start,
+            critical_path, port_bound, cycles
+        ))
+
+    totals = [[0.0, 0.0, 0.0] for _ in graph.block_parents]
+    for s in scope_costs:
+        b = s.block
+        while b is not None:
+            t = totals[b]
+            t[0] += s.critical_path * s.exp_use
+            t[1] += s.port_bound * s.exp_use
+            t[2] += s.cycles * s.exp_use
+            b = graph.block_parents[b]
+    blocks = {
+        b: BlockCost(b, parent, *totals[b])
+        for b, parent in enumerate(graph.block_parents)
+    }
+    return CostReport(tuple(scope_costs), blocks)
+
+
+def format_cost(report: CostReport) -> str:
+    lines = [f'{"block":>5} {"parent":>6} {"crit path":>12} {"port bound":>12} {"cycles":>12}']
+    for b in report.blocks.values():
+        parent = '' if b.parent is None else b.parent
+        lines.append(f'{b.block:>5} {parent:>6} {b.critical_path:>12.1f} {b.port_bound:>12.1f} {b.cycles:>12.1f}')
+    return '\n'.join(lines)
@@ -1,17 +1,25 @@
 from collections import defaultdict
+from contextlib import contextmanager
+from heapq import heappop, heappush
 from itertools import chain
-from typing import Dict, Iterable, List, Optional, Set
+from operator import attrgetter
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Set, Tuple
+from weakref import WeakValueDictionary
 
-from . import optim
+from . import instrument
+from .columns import NodeColumns
 from .graph import GraphOptim
 from .graphval import GraphVal, OpScope
 from .proc_descr import Op
+from .proc_model import ProcModel
+from .sched import _allocated, pressure_order
 from .vtypes import OpDescr, VType
 
 
 class ScopeDescr:
-    def __init__(self, exp_use: float):
+    def __init__(self, exp_use: float, block: int = 0):
         self.exp_use: float = exp_use
+        self.block: int = block
         self.nodes: List['GraphVal'] = []
 
     def append(self, v: 'GraphVal'):
@@ -37,100 +45,378 @@ class NodeMapper:
         except KeyError:
             raise RuntimeError(f'No name registered for {v}, {v.__dict__}')
 
+    def def_prefix(self, v: GraphVal) -> str:
+        return f'{v.type_name} {self.get(v)} ='
+
+    def declarations(self) -> Iterable[str]:
+        return ()
+
+
+class RegNodeMapper(NodeMapper):
+    # names are reused once their value is dead, like registers
+    def __init__(
+            self, alias_mapper, nodes: Iterable[GraphVal],
+            scopes: Tuple[ScopeDescr, ...], block_parents: List[Optional[int]]
+    ):
+        super().__init__(alias_mapper)
+        nodes = tuple(nodes)
+        self._planned: Dict[int, str] = {}
+        self._decls: Dict[str, List[str]] = {}
+        # peak number of simultaneously live names per type and of all types
+        self.peak: Dict[str, int] = {}
+        self.max_live = 0
+        self._plan(nodes, scopes, block_parents)
+
+    def _plan(self, nodes, scopes, block_parents):
+        blocks = [scopes[v.scope_n].block for v in nodes]
+        # last position inside every block, nested blocks included
+        block_end = [-1] * len(block_parents)
+        for pos, b in enumerate(blocks):
+            while b is not None and block_end[b] < pos:
+                block_end[b] = pos
+                b = block_parents[b]
+
+        def ancestors(b):
+            r = set()
+            while b is not None:
+                r.add(b)
+                b = block_parents[b]
+            return r
+
+        alias = self._alias_mapper
+        def_pos = {v.orig: pos for pos, v in enumerate(nodes) if _allocated(v)}
+        end = dict(def_pos)
+        def_ancestors = {}
+        for pos, v in enumerate(nodes):
+            for a in v.a:
+                orig = alias(a).orig
+                d = def_pos.get(orig)
+                if d is None:
+                    continue
+                last = pos
+                # used inside a loop entered after the definition, live until the loop ends
+                b, outer = blocks[pos], None
+                if b != blocks[d]:
+                    def_blocks = def_ancestors.get(blocks[d])
+                    if def_blocks is None:
+                        def_blocks = def_ancestors[blocks[d]] = ancestors(blocks[d])
+                    while b not in def_blocks:
+                        outer = b
+                        b = block_parents[b]
+                if outer is not None:
+                    last = max(last, block_end[outer])
+                if last > end[orig]:
+                    end[orig] = last
+
+        free: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+        live: Dict[str, int] = defaultdict(int)
+        expiring: List[Tuple[int, int, Tuple[str, str], str]] = []
+        total = 0
+        for pos, v in enumerate(nodes):
+            if v.orig not in def_pos:
+                continue
+            # a value last read by this node can give its name to the result
+            while expiring and expiring[0][0] <= pos:
+                _, _, pool, n = heappop(expiring)
+                free[pool].append(n)
+                live[pool[0]] -= 1
+                total -= 1
+            pool = v.type_name, v.name_prefix or 'v'
+            if free[pool]:
+                n = free[pool].pop()
+            else:
+                prefix = pool[1]
+                n = f'{prefix}{self._nd[prefix]}'
+                self._nd[prefix] += 1
+                self._decls.setdefault(pool[0], []).append(n)
+            self._planned[v.orig] = n
+            live[pool[0]] += 1
+            self.peak[pool[0]] = max(self.peak.get(pool[0], 0), live[pool[0]])
+            total += 1
+            self.max_live = max(self.max_live, total)
+            heappush(expiring, (end[v.orig], pos, pool, n))
+
+    def set(self, v: GraphVal, n: str = None):
+        planned = self._planned.get(v.orig)
+        if planned is not None and not n:
+            self._d[v.orig] = planned
+        else:
+            super().set(v, n)
+
+    def def_prefix(self, v: GraphVal) -> str:
+        if v.orig in self._planned:
+            return f'{self.get(v)} ='
+        return super().def_prefix(v)
+
+    def declarations(self) -> Iterable[str]:
+        for type_name, names in self._decls.items():
+            for i in range(0, len(names), 16):
+                yield f'{type_name} {", ".join(names[i:i + 16])};'
+
 
 class FlowGraph:
-    def __init__(self, mem_levels, ops: Iterable[Op]):
-        self.ops: Dict[str, Op] = {}
-        ports = set(sum(
-            (o.ports for o in ops),
-            tuple(m[2] for m in mem_levels)
-        ))
-        p = optim._proc(len(ports))
-        port2n = dict(zip(*reversed(list(zip(*enumerate(ports))))))
-        for n, size, port, load_time in mem_levels:
-            p.new_mem_level(
-                size, port2n[port], load_time
-            )
-        for o in ops:
-            op_id = p.new_op(
-                o.exec_t,
-                [port2n[p] for p in ports]
-            )
-            self.ops[o.name] = o
-        self._op_idx: Dict[str, GraphVal] = {}
-        self._proc: optim._proc = p
+    def __init__(self, model: ProcModel, columnar=False, drop_unused=False, fold_consts=True):
+        if columnar and drop_unused:
+            raise ValueError('Unused nodes cannot be dropped from columnar graph')
+        self.model: ProcModel = model
+        self.ops: Mapping[str, Op] = model.ops
+        self._lookup_op = model.op_table.lookup
+        self.fold_consts = fold_consts
+        # without strong references unused nodes disappear from the index
+        self._op_idx: Dict[Hashable, GraphVal] = WeakValueDictionary() if drop_unused else {}
+        self._drop_unused = drop_unused
+        self._used: Set[int] = set()
+        self._removed_roots: Set[int] = set()
+        self._scoped_used: Optional[List[List[GraphVal]]] = None
+        self._reordered = False
+        self._insert_scope: Optional[int] = None
+        self._proc = model.proc
         self._use_stack = [1.0]
+        self._block_stack = [0]
+        self.block_parents: List[Optional[int]] = [None]
+        # blocks that may run zero times, nothing may be read ahead of them
+        self.skippable_blocks: Set[int] = set()
         self._scope_list: List[ScopeDescr] = []
         self._orig_aliases = {}
+        self._cols: Optional[NodeColumns] = NodeColumns() if columnar else None
 
         self.new_scope()
 
     def find_op(self, n: str, a: Iterable[GraphVal]) -> Op:
-        t = tuple(v.type_name for v in a)
-        op_n = f'{n}Y{"X".join(t)}'
-        try:
-            return self.ops[op_n]
-        except KeyError:
-            reorder_op_n = f'{n}Y{"X".join(sorted(t))}'
-            try:
-                op = self.ops[reorder_op_n]
-                if not op.args_ordered:
-                    return op
-                raise KeyError('')
-            except KeyError:
-                raise ValueError(
-                    f'No operation `{op_n}` on types'
-                    f'{tuple(type(v) for v in a)}'
-                )
+        types = tuple(map(type, a))
+        op = self._lookup_op(n, types)
+        if op is None:
+            raise ValueError(
+                f'No operation `{n}` on types'
+                f'{types}'
+            )
+        return op
+
+    @staticmethod
+    def _no_typed_op(n: str, types: Iterable[VType]):
+        type_names = 'X'.join(t.type_name for t in types)
+        return ValueError(f'No typespec-operation `{n}Y{type_names}` on `{n}` for types {types}')
 
     def find_const_op(self, t: VType):
-        op_n = f'constY{t.type_name}'
-        return self.ops[op_n]
+        op = self._lookup_op('const', (t,))
+        if op is None:
+            raise self._no_typed_op('const', (t,))
+        return op
 
     def find_load_op(self, t: VType):
-        op_n = f'loadY{t.type_name}'
-        return self.ops[op_n]
+        op = self._lookup_op('load', (t,))
+        if op is None:
+            raise self._no_typed_op('load', (t,))
+        return op
 
     def find_cvt_op(self, v: GraphVal, t: VType):
-        op_n = f'cvtY{v.type_name}X{t.type_name}'
-        return self.ops[op_n]
+        types = (type(v), t)
+        op = self._lookup_op('cvt', types)
+        if op is None:
+            raise self._no_typed_op('cvt', types)
+        return op
 
     def find_store_op(self, t: VType):
-        op_n = f'storY{t.type_name}'
-        return self.ops[op_n]
+        op = self._lookup_op('stor', (t,))
+        if op is None:
+            raise self._no_typed_op('stor', (t,))
+        return op
 
     def find_spec_op(self, name, t: VType):
-        op_n = f'{name}Y{t.type_name}'
-        try:
-            return self.ops[op_n]
-        except KeyError:
-            raise ValueError(f'No typespec-operation `{op_n}` on `{name}` for type {t}')
+        op = self._lookup_op(name, (t,))
+        if op is None:
+            raise self._no_typed_op(name, (t,))
+        return op
 
     def add_node(self, v: GraphVal) -> GraphVal:
+        if self.fold_consts and v.a and v.code is None:
+            folded = self._fold(v)
+            if folded is not None:
+                return folded
+
         k = v.key
         # TODO: check and add parent nodes
-        if k in self._op_idx:
-            return self._op_idx[k].copy()
-        else:
-            self._op_idx[k] = v
+        old = self._op_idx.get(k)
+        if old is not None and self._visible(old, v.scope_n):
+            if instrument.profiler is not None:
+                instrument.profiler.count('cse_hits')
+            return old.copy()
+
+        if instrument.profiler is not None:
+            instrument.profiler.count('nodes')
+        self._op_idx[k] = v
+        self._scoped_used = None
+        if self._cols is not None:
+            v.col_n = self._cols.append(v, self._op_col_id(v), self._arg_cols(v))
+        elif not self._drop_unused:
             self._scope_list[v.scope_n].append(v)
-            return v
+        if not v.has_output:
+            self._mark_used(v)
+        return v
+
+    def _visible(self, v: GraphVal, scope_n: int) -> bool:
+        # values of a closed block are out of scope after it, e.g. for the next copy of a loop body
+        if v.scope_n == scope_n:
+            return True
+        block = self._scope_list[scope_n].block
+        v_block = self._scope_list[v.scope_n].block
+        while block != v_block:
+            block = self.block_parents[block]
+            if block is None:
+                return False
+        return v.scope_n < scope_n
+
+    def add_used_nodes(self, nodes: Iterable[GraphVal]):
+        # nodes are already unique, ordered and all used, e.g. from a saved graph
+        used = self._used
+        scopes = self._scope_list
+        for v in nodes:
+            self._op_idx[v.key] = v
+            used.add(v.orig)
+            if self._cols is not None:
+                v.col_n = self._cols.append(v, self._op_col_id(v), self._arg_cols(v))
+                self._cols.mark_used(v.col_n)
+            else:
+                scopes[v.scope_n].append(v)
+        self._scoped_used = None
+
+    def _fold(self, v: GraphVal) -> Optional[GraphVal]:
+        op = v.op
+        if op is None or op.py_eval is None or op.ret_t is None:
+            return None
+        for a in v.a:
+            if not a.const:
+                return None
+        if self._lookup_op('const', (op.ret_t,)) is None:
+            return None
+
+        args = tuple(a.fold_val(a.val) for a in v.a)
+        if NotImplemented in args:
+            return None
+        val = op.py_eval(*args)
+        if val is NotImplemented:
+            return None
+        val = op.ret_t.fold_val(val)
+        if val is NotImplemented:
+            return None
+        return op.ret_t.from_const(val)
+
+    def _mark_used(self, v: GraphVal):
+        used = self._used
+        v = self.get_alias(v)
+        if v.orig in used:
+            return
+        used.add(v.orig)
+
+        stack = [v]
+        while stack:
+            v = stack.pop()
+            if v.p is self:
+                if self._drop_unused:
+                    self._scope_list[v.scope_n].append(v)
+                    # the indexed node may be gone while a copy of it is still alive
+                    self._op_idx.setdefault(v.key, v)
+                elif self._cols is not None and v.col_n >= 0:
+                    self._cols.mark_used(v.col_n)
 
-    def start_use_block(self, exp_use):
+            for nv in v.a:
+                nv = self.get_alias(nv)
+                if nv.orig not in used:
+                    used.add(nv.orig)
+                    stack.append(nv)
+
+    @instrument.instrumented('recompute_used')
+    def recompute_used(self):
+        self._used = set()
+        self._scoped_used = None
+        # the scopes hold the only strong references of a drop_unused graph
+        nodes = list(self._op_idx.values())
+        if self._drop_unused:
+            for scope in self._scope_list:
+                nodes += scope.nodes
+                scope.nodes = []
+        if self._cols is not None:
+            self._cols.clear_used()
+
+        removed = self._removed_roots
+        for v in nodes:
+            if not v.has_output and v.orig not in removed:
+                self._mark_used(v)
+
+    def remove_root(self, v: GraphVal):
+        # takes effect with the next recompute_used
+        if v.has_output:
+            raise ValueError(f'{v.op_name} is not a root of the graph')
+        self._removed_roots.add(v.orig)
+
+    def _op_col_id(self, v: GraphVal) -> int:
+        if v.op is None:
+            return -1
+        return self.model.op_ids[v.op.name]
+
+    def _arg_cols(self, v: GraphVal) -> List[int]:
+        # args from outside of the graph are not dependencies here
+        return [
+            n for n in (self.get_alias(a).col_n for a in v.a)
+            if n >= 0
+        ]
+
+    def start_use_block(self, exp_use, skippable=False) -> int:
+        block = len(self.block_parents)
+        self.block_parents.append(self._block_stack[-1])
+        if skippable:
+            self.skippable_blocks.add(block)
+        self._block_stack.append(block)
         self._use_stack.append(self._use_stack[-1] * exp_use)
         self.new_scope()
+        return block
 
     def end_use_block(self):
         self._use_stack.pop()
+        self._block_stack.pop()
         self.new_scope()
 
     def new_scope(self):
+        self._scoped_used = None
         self._scope_list.append(
             ScopeDescr(
-                exp_use=self._use_stack[-1]
+                exp_use=self._use_stack[-1],
+                block=self._block_stack[-1]
             )
         )
 
+    @property
+    def scopes(self) -> Tuple[ScopeDescr, ...]:
+        return tuple(self._scope_list)
+
+    def load_scopes(
+            self, scopes: Iterable[Tuple[float, int]], block_parents: Iterable[Optional[int]],
+            skippable_blocks: Iterable[int] = ()
+    ):
+        if self._op_idx:
+            raise ValueError('Scopes can be loaded only into an empty graph')
+        self._scope_list = [ScopeDescr(exp_use, block) for exp_use, block in scopes]
+        self.block_parents = list(block_parents)
+        self.skippable_blocks = set(skippable_blocks)
+        self._scoped_used = None
+
+    def rescope(self, moved: Iterable[GraphVal]):
+        # `moved` nodes have new scope_n set, they go to the end of their new scope
+        if self._cols is not None:
+            for v in moved:
+                self._cols.scopes[v.col_n] = v.scope_n
+        else:
+            nodes = [scope.nodes for scope in self._scope_list]
+            for scope in self._scope_list:
+                scope.nodes = []
+            for v in chain.from_iterable(nodes):
+                self._scope_list[v.scope_n].append(v)
+            self._reordered = True
+        self._scoped_used = None
+
+    def exp_use(self, v: GraphVal) -> float:
+        return self._scope_list[v.scope_n].exp_use
+
     def get_scope_n(self, *a: GraphVal) -> int:
         scopes = tuple(
             v.scope_n for v in a
@@ -138,8 +424,20 @@ class FlowGraph:
         try:
             return max(scopes)
         except ValueError:
+            if self._insert_scope is not None:
+                return self._insert_scope
             return len(self._scope_list) - 1
 
+    @contextmanager
+    def insert_at(self, scope_n: int):
+        # nodes without args go to `scope_n` instead of the last scope
+        old = self._insert_scope
+        self._insert_scope = scope_n
+        try:
+            yield
+        finally:
+            self._insert_scope = old
+
     # def op(self, n, *a: GraphVal) -> GraphVal:
     #     return self.add_node(
     #         OpNode(self, n, a)
@@ -195,43 +493,89 @@ class FlowGraph:
     #     )
 
     def get_alias(self, v: GraphVal) -> GraphVal:
-        return self._orig_aliases.get(v.orig) or v
+        alias = self._orig_aliases.get(v.orig)
+        while alias is not None:  # replaced nodes can form chains
+            v = alias
+            alias = self._orig_aliases.get(v.orig)
+        return v
 
     def add_alias(self, oldv: GraphVal, newv: GraphVal):
         self._orig_aliases[newv.orig] = self.get_alias(oldv)
 
+    def replace(self, oldv: GraphVal, newv: GraphVal):
+        if self._cols is not None:
+            raise ValueError('Nodes of columnar graph cannot be replaced')
+        newv = self.get_alias(newv)
+        if newv.orig == oldv.orig:
+            return
+        if self._drop_unused:
+            self._op_idx.setdefault(newv.key, newv)
+        self.add_alias(newv, oldv)
+        self._reordered = True
+        self._scoped_used = None
+
     def node_mapper(self) -> NodeMapper:
         return NodeMapper(self.get_alias)
 
-    def select_used(self) -> Set[int]:
-        stack = []
-        used = set()
-
-        for v in self._op_idx.values():
-            v = self.get_alias(v)
-            if not v.has_output:
-                stack.append(v)
-
-        while stack:
-            v = stack.pop()
-            used.add(v.orig)
-
-            for nv in v.a:
-                nv = self.get_alias(nv)
-                if nv.orig not in used:
-                    stack.append(nv)
-
-        return used
+    def reg_mapper(self, nodes: Iterable[GraphVal]) -> RegNodeMapper:
+        # `nodes` in render order
+        return RegNodeMapper(self.get_alias, nodes, self.scopes, self.block_parents)
 
+    @instrument.instrumented('select_used')
+    def select_used(self) -> Set[int]:
+        # kept up to date by add_node, do not modify
+        return self._used
+
+    def _used_scopes(self) -> List[List[GraphVal]]:
+        if self._scoped_used is None:
+            if self._drop_unused:
+                # nodes were appended when marked, restore creation order
+                self._scoped_used = [
+                    sorted(scope.nodes, key=attrgetter('orig'))
+                    for scope in self._scope_list
+                ]
+            else:
+                used = self._used
+                self._scoped_used = [
+                    [v for v in scope.nodes if v.orig in used]
+                    for scope in self._scope_list
+                ]
+            if self._reordered:
+                self._scoped_used = list(map(self._topo_order, self._scoped_used))
+        return self._scoped_used
+
+    def _topo_order(self, nodes: List[GraphVal]) -> List[GraphVal]:
+        # nodes inserted by rewrites are moved before their first user, the rest keeps its order
+        members = {v.orig: v for v in nodes}
+        seen = set()
+        ordered = []
+        for v in nodes:
+            if v.orig in seen:
+                continue
+            seen.add(v.orig)
+            stack = [(v, iter(v.a))]
+            while stack:
+                nv, args = stack[-1]
+                for a in args:
+                    a = self.get_alias(a)
+                    if a.orig in members and a.orig not in seen:
+                        seen.add(a.orig)
+                        a = members[a.orig]
+                        stack.append((a, iter(a.a)))
+                        break
+                else:
+                    stack.pop()
+                    ordered.append(nv)
+        return ordered
+
+    @instrument.instrumented('optim_graph')
     def optim_graph(self) -> GraphOptim:
+        if self._cols is not None:
+            return self._optim_graph_columnar()
+
         ordered = []
         op_scopes = []
-        used = self.select_used()
-        for scope in self._scope_list:
-            scope_used = [
-                v for v in scope.nodes
-                if v.orig in used
-            ]
+        for scope, scope_used in zip(self._scope_list, self._used_scopes()):
             op_scopes.append(
                 OpScope(
                     start_pos=len(ordered),
@@ -241,32 +585,62 @@ class FlowGraph:
             )
             ordered.extend(scope_used)
 
-        return GraphOptim(self._proc, ordered, op_scopes)
+        return GraphOptim(self._proc, ordered, op_scopes, self.model.op_ids)
 
-    def used_ordered(self):
-        used = self.select_used()
-        return tuple(
-            v for v in
-            chain(*(
-                scope.nodes for scope in self._scope_list
-            ))
-            if v.orig in used
+    def _optim_graph_columnar(self) -> GraphOptim:
+        rows, op_nums, graph, scope_ends = self._cols.export(len(self._scope_list))
+        op_scopes = []
+        start_pos = 0
+        for scope, end_pos in zip(self._scope_list, scope_ends.tolist()):
+            op_scopes.append(
+                OpScope(
+                    start_pos=start_pos,
+                    end_pos=end_pos,
+                    exp_use=scope.exp_use
+                )
+            )
+            start_pos = end_pos
+
+        nodes = self._cols.nodes
+        return GraphOptim.from_columns(
+            self._proc, [nodes[n] for n in rows.tolist()], op_nums.tolist(), graph, op_scopes, self.model.op_ids
         )
 
+    def used_ordered(self):
+        if self._cols is not None:
+            rows = self._cols.ordered_rows()
+            nodes = self._cols.nodes
+            return tuple(nodes[n] for n in rows.tolist())
+
+        return tuple(chain.from_iterable(self._used_scopes()))
+
     def print_graph(self):
         nums = self.node_mapper()
         for v in self.used_ordered():
             nums.set(v)
             args = ' '.join(map(nums.get, v.a))
-            print(f'{nums.get(v)}: {v.key} {args}')
+            print(f'{nums.get(v)}: {v.op_name} {args}')
 
-    def render_code(self, ord: Optional[Iterable[int]] = None) -> Iterable[str]:
+    @instrument.instrumented('render_code')
+    def render_code(self, ord: Optional[Iterable[int]] = None, reuse_names=False) -> Iterable[str]:
         nodes = self.used_ordered()
 
         if ord is None:
             ord = range(len(nodes))
 
-        nums = self.node_mapper()
+        if reuse_names:
+            ord = tuple(ord)
+            nums = self.reg_mapper(nodes[i] for i in ord)
+            regs = self.model.mem_levels[0].size if self.model.mem_levels else None
+            if regs is not None and nums.max_live > regs:
+                # too many values live at once, reorder for fewer if deps allow
+                reordered = pressure_order(self, ord, regs)
+                pressured = self.reg_mapper(nodes[i] for i in reordered)
+                if pressured.max_live < nums.max_live:
+                    ord, nums = reordered, pressured
+        else:
+            nums = self.node_mapper()
+        yield from nums.declarations()
         for i in ord:
             v = nodes[i]
             nums.set(v, v.var_name)
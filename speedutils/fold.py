@@ -0,0 +1,130 @@
+import operator
+import struct
+from math import isfinite, sqrt
+from typing import Any, Callable
+
+Evaluator = Callable[..., Any]
+
+
+def _is_vec(v) -> bool:
+    return isinstance(v, (tuple, list))
+
+
+def elementwise(f: Evaluator) -> Evaluator:
+    # scalars are broadcast over flat vectors, anything else is left for runtime
+    def evaluate(*args):
+        vecs = [a for a in args if _is_vec(a)]
+        if not vecs:
+            return f(*args)
+        n = len(vecs[0])
+        if any(len(v) != n or any(map(_is_vec, v)) for v in vecs):
+            return NotImplemented
+        items = tuple(
+            f(*(a[i] if _is_vec(a) else a for a in args))
+            for i in range(n)
+        )
+        if NotImplemented in items:
+            return NotImplemented
+        return items
+
+    return evaluate
+
+
+def _div(a, b):
+    if not b:
+        return NotImplemented
+    if isinstance(a, int) and isinstance(b, int):
+        # integer types hold int consts, C division truncates towards zero
+        q = abs(a) // abs(b)
+        return q if (a < 0) == (b < 0) else -q
+    return a / b
+
+
+def _bitwise(f: Evaluator) -> Evaluator:
+    def evaluate(a, b):
+        if not (isinstance(a, int) and isinstance(b, int)):
+            return NotImplemented
+        return f(a, b)
+
+    return evaluate
+
+
+_sign_evaluators = {
+    ('+', 2): elementwise(operator.add),
+    ('-', 2): elementwise(operator.sub),
+    ('*', 2): elementwise(operator.mul),
+    ('/', 2): elementwise(_div),
+    ('-', 1): elementwise(operator.neg),
+    ('&', 2): elementwise(_bitwise(operator.and_)),
+    ('|', 2): elementwise(_bitwise(operator.or_)),
+    ('^', 2): elementwise(_bitwise(operator.xor)),
+}
+
+
+def sign_evaluator(sign: str, nargs: int):
+    return _sign_evaluators.get((sign, nargs))
+
+
+def same_value(v):
+    return v
+
+
+def _stored_float(fmt: str) -> Evaluator:
+    # rounds like a store to the target float type, overflow and nan are left for runtime
+    def convert(v):
+        if _is_vec(v):
+            items = tuple(map(convert, v))
+            return NotImplemented if NotImplemented in items else items
+        try:
+            v = struct.unpack(fmt, struct.pack(fmt, v))[0]
+        except (OverflowError, struct.error):
+            return NotImplemented
+        return v if isfinite(v) else NotImplemented
+
+    return convert
+
+
+def _stored_int(bits: int) -> Evaluator:
+    # C truncates towards zero, out of range values are undefined there
+    lo, hi = -1 << bits - 1, (1 << bits - 1) - 1
+
+    def convert(v):
+        if isinstance(v, float):
+            if not isfinite(v):
+                return NotImplemented
+            v = int(v)
+        if not isinstance(v, int) or not lo <= v <= hi:
+            return NotImplemented
+        return v
+
+    return convert
+
+
+float16 = _stored_float('<e')
+float32 = _stored_float('<f')
+int32 = _stored_int(32)
+
+
+def concat(*args):
+    items = []
+    for a in args:
+        if _is_vec(a):
+            items.extend(a)
+        else:
+            items.append(a)
+    return tuple(items)
+
+
+def dot(a, b):
+    if not (_is_vec(a) and _is_vec(b)) or len(a) != len(b):
+        return NotImplemented
+    return sum(x * y for x, y in zip(a, b))
+
+
+def normalize(v):
+    if not _is_vec(v):
+        return NotImplemented
+    length = sqrt(sum(x * x for x in v))
+    if not length:
+        return NotImplemented
+    return tuple(x / length for x in v)
@@ -1,7 +1,17 @@
-from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 
+from .cache import KernelCache, cache_key, fingerprint, get_default_cache, pd_fingerprint, source_fingerprint
+from .cost import CostReport, estimate_cost
+from .flow import FlowGraph
 from .graphval import GraphVal
+from .instrument import instrumented
 from .proc_ctx import clear_vars, func_scope, graph_ctx, new_graph, proc_ctx, set_vars, vars_ctx
+from .sched import list_schedule
+from .sink import CodeSink, stdout_sink
+from .slp import slp_vectorize
+from .specialize import SymbolicTrace, placeholder, specialize
+from .tune import get_default_tuning_db
 from .vtypes import VType
 
 
@@ -16,14 +26,28 @@ func_reg = {}
 
 class Func:
     _consts = ()
+    # declare locals up front and reuse their names once the values are dead
+    reuse_names = False
+    # reorder nodes with sched.list_schedule before rendering
+    schedule = False
+    # pack isomorphic scalar ops into registered vector types with slp.slp_vectorize
+    vectorize = False
+    # array params never alias each other, lets slp_vectorize pack stores around loads
+    restrict = False
+    # analysis traces kept for gen to render, keyed by resolved consts
+    kept_traces = 4
+    # trace once with consts as placeholders, specializations substitute and fold them
+    trace_once = True
 
     def __init__(self, name=None, **opts):
         self._name = name
         self._opts = opts
         self._args: Dict[str, FuncArg] = {}
-
-    def codeln(self, l):
-        print(l)
+        self._traces: 'OrderedDict[str, FlowGraph]' = OrderedDict()
+        self._symbolic: 'OrderedDict[str, SymbolicTrace]' = OrderedDict()
+        # set while tracing symbolically
+        self._placeholders: Optional[Dict[str, GraphVal]] = None
+        self._shaping: Optional[Set[str]] = None
 
     def _filter_arg_type(self, t: VType):
         return sorted(
@@ -44,36 +68,149 @@ class Func:
 
     def _get_name(self) -> str:
         const_descr = 'X'.join(
-            f'{k}V{t.trunc(v)}' for k, t, v in self._get_consts()
+            f'{k}V{v}' for k, t, v in self._get_consts()
         ).replace('.', 'K')
         return f'{self._name}_' \
                f'{const_descr}_' \
                f'F{proc_ctx.arch}'
 
-    def _gen_body(self):
+    @instrumented('trace', per_func=True)
+    def _trace_graph(self) -> FlowGraph:
         with new_graph() as graph:
             self._func()  # TODO: args by signature ?
-            graph.render_code()
-
-    def _analyze(self):
-        with new_graph():
-            self._func()
+        return graph
+
+    def _gen_body(self, graph: FlowGraph = None) -> Iterable[str]:
+        if graph is None:
+            graph = self._trace_graph()
+        ord = list_schedule(graph).ord if self.schedule else None
+        yield from graph.render_code(ord, reuse_names=self.reuse_names)
+
+    def _const_values(self) -> Dict[str, Any]:
+        return {n: v for n, t, v in self._get_consts()}
+
+    def _symbolic_key(self, shaping) -> str:
+        return fingerprint((proc_ctx.arch, shaping))
+
+    def _find_symbolic(self, values: Dict[str, Any]) -> Optional[SymbolicTrace]:
+        for key, sym in self._symbolic.items():
+            if key == self._symbolic_key(tuple((n, values.get(n)) for n, _ in sym.shaping)):
+                self._symbolic.move_to_end(key)
+                return sym
+        return None
+
+    def _trace_symbolic(self) -> SymbolicTrace:
+        self._placeholders, self._shaping = {}, set()
+        try:
+            graph = self._trace_graph()
+            placeholders, shaping = self._placeholders, self._shaping
+        finally:
+            self._placeholders = self._shaping = None
+
+        values = self._const_values()
+        sym = SymbolicTrace(
+            graph,
+            {v.orig: n for n, v in placeholders.items()},
+            tuple(sorted((n, values[n]) for n in shaping))
+        )
+        if not sym.placeholders:
+            return sym
+        self._symbolic[self._symbolic_key(sym.shaping)] = sym
+        while len(self._symbolic) > self.kept_traces:
+            self._symbolic.popitem(last=False)
+        return sym
+
+    @instrumented('specialize', per_func=True)
+    def _specialize(self, sym: SymbolicTrace) -> FlowGraph:
+        return specialize(sym, self._const_values())
+
+    @instrumented('analyze', per_func=True)
+    def _analyze(self) -> FlowGraph:
+        # finds args and consts, the trace is the body graph for the same consts
+        if not self.trace_once:
+            return self._trace_graph()
+        sym = self._find_symbolic(self._const_values()) if self._args else None
+        if sym is None:
+            sym = self._trace_symbolic()
+            if not sym.placeholders:
+                return sym.graph  # nothing to substitute
+        return self._specialize(sym)
+
+    def _trace_key(self, opts) -> str:
+        # only known after a first analysis, runtime values do not change the trace
+        resolved = self._get_all_opts(opts)
+        return fingerprint((
+            proc_ctx.arch,
+            tuple((a.name, resolved.get(a.name)) for a in self._const_args),
+        ))
+
+    def _keep_trace(self, opts, graph: FlowGraph):
+        self._traces[self._trace_key(opts)] = graph
+        while len(self._traces) > self.kept_traces:
+            self._traces.popitem(last=False)
+
+    def _traced(self, opts) -> FlowGraph:
+        # must run in func_scope, traces only if no analysis trace was kept
+        graph = self._traces.pop(self._trace_key(opts), None) if self._args else None
+        if graph is None:
+            with clear_vars(**self._get_all_opts(opts)):
+                graph = self._analyze()
+        if self.vectorize:
+            slp_vectorize(graph, restrict=self.restrict)
+        return graph
+
+    def _cache_key(self, opts) -> str:
+        return cache_key(
+            'func',
+            fingerprint(type(self)),
+            source_fingerprint(self._func),
+            fingerprint(self._name),
+            fingerprint((self.reuse_names, self.schedule, self.vectorize, self.restrict, self.trace_once)),
+            fingerprint(self._get_all_opts(opts)),
+            pd_fingerprint(proc_ctx.model.pd),
+        )
 
-    def gen(self, opts):
+    def _gen_lines(self, opts) -> Iterable[str]:
         with func_scope(self):
-            with clear_vars(**self._get_all_opts(opts)):
-                self._analyze()
+            graph = self._traced(opts)
 
             with clear_vars(**self._get_all_opts(opts)):
                 args_str = ', '.join(
                     f'{arg.type.type_name} {arg.name}'
                     for arg in self._var_args
                 )
-                self.codeln(
-                    f'void {self._get_name()}({args_str}) {{'
-                )
-                self._gen_body()
-                self.codeln('}')
+                yield f'void {self._get_name()}({args_str}) {{'
+                yield from self._gen_body(graph)
+                yield '}'
+
+    def trace(self, opts) -> FlowGraph:
+        # the graph gen_code would render, for analysis
+        with func_scope(self):
+            return self._traced(opts)
+
+    def cost(self, opts) -> CostReport:
+        graph = self.trace(opts)
+        return estimate_cost(graph, list_schedule(graph).ord if self.schedule else None)
+
+    @instrumented('gen', per_func=True)
+    def gen_code(self, opts, cache: Optional[KernelCache] = None) -> str:
+        if cache is None:
+            cache = get_default_cache()
+        if cache is None:
+            return '\n'.join(self._gen_lines(opts))
+
+        key = self._cache_key(opts)
+        text = cache.get(key)
+        if text is None:
+            text = '\n'.join(self._gen_lines(opts))
+            cache.put(key, text)
+        return text
+
+    def gen(self, opts, cache: Optional[KernelCache] = None, sink: Optional[CodeSink] = None):
+        if sink is None:
+            sink = stdout_sink()
+        with sink.section(self._name):
+            sink.write(self.gen_code(opts, cache=cache))
 
     def _lookup_var(self, name, t: VType, const=False, default=None) -> Tuple[FuncArg, Any]:
         if name not in self._args:
@@ -84,7 +221,7 @@ class Func:
             )
         else:
             a = self._args[name]
-            if not isinstance(a.type, t):
+            if not issubclass(a.type, t):
                 raise ValueError(f'Invalid type `{t.type_name}` for `{name}` having already type `{a.type}`')
 
         if default is not None:
@@ -124,7 +261,10 @@ class Func:
         a, val = self._lookup_var(name, t, const=const, default=default)
 
         if a.const:
-            return graph_ctx.const(t, val)
+            if self._placeholders is not None:
+                self._placeholders[name] = v = placeholder(t, name)
+                return v
+            return t.from_const(val)
         else:
             return t.var(name, start_scope=True)
 
@@ -133,11 +273,21 @@ class Func:
 
         if not a.const:
             raise ValueError(f'Variable {name} is not const')
+        if self._shaping is not None:
+            self._shaping.add(name)
 
         return val
 
+    def _tuned_opts(self) -> Dict[str, Any]:
+        db = get_default_tuning_db()
+        if db is None or not self._name:
+            return {}
+        return db.get(self._name, proc_ctx.model.pd) or {}
+
     def _get_all_opts(self, args):
+        # explicit args win over tuned opts, tuned opts over the decorator ones
         r = dict(self._opts)
+        r.update(self._tuned_opts())
         r.update(args)
         return self._process_args(r)
 
@@ -194,6 +344,7 @@ class Func:
         )
         graph_ctx.raw_code(f'{name}({args_fmt})', *arg_vars)
 
+    @instrumented('call', per_func=True)
     def call(self, **kwargs):
         inline = kwargs.pop('inline', False)
         opts = self._get_all_opts(kwargs)  # TODO: auto pick vars ?
@@ -202,9 +353,10 @@ class Func:
                 with clear_vars(**opts):
                     registered = self._check_registered()
                     if not registered:
-                        self._analyze()
+                        graph = self._analyze()
                 if not registered:
                     opts = self._get_all_opts(kwargs)
+                    self._keep_trace(kwargs, graph)
             if not registered:
                 with clear_vars(**opts):
                     self._register()
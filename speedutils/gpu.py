@@ -1,4 +1,5 @@
 from .func import Func, FuncArg
+from .sink import stdout_sink
 from .graphval import LoadNode
 from .proc_ctx import graph_ctx, vars_ctx
 from .vtypes import int32_, bool__, Tcfg
@@ -135,14 +136,17 @@ class CLFunc(GroupedGpuFunc):
 
     def _print_exts(self, exts):
         for e in exts:
-            self.codeln('#pragma OPENCL EXTENSION {} : {}'.format(
+            yield '#pragma OPENCL EXTENSION {} : {}'.format(
                 e.name, 'enabled' if self._get_call_val(e.name, CLExt) else 'disabled'
-            ))
+            )
 
-    def gen(self, opts):
-        self._print_exts(self._filter_arg_type(CLExt))
-        self.codeln('__kernel')
-        super().gen(opts)
+    def gen(self, opts, cache=None, sink=None):
+        if sink is None:
+            sink = stdout_sink()
+        with sink.section(self._name):
+            sink.write_lines(self._print_exts(self._filter_arg_type(CLExt)))
+            sink.write('__kernel')
+            super().gen(opts, cache=cache, sink=sink)
 
     def _gen_call(self):
         name = self._get_name()
@@ -187,9 +191,12 @@ class CUDAFunc(GroupedGpuFunc):
     def _local_size(self, dn: int) -> LoadNode:
         return int32_.load(f'blockDim.{self.DIM_NAMES[dn]}')
 
-    def gen(self, opts):
-        self.codeln('__global__')
-        super().gen(opts)
+    def gen(self, opts, cache=None, sink=None):
+        if sink is None:
+            sink = stdout_sink()
+        with sink.section(self._name):
+            sink.write('__global__')
+            super().gen(opts, cache=cache, sink=sink)
 
     def _gen_call(self):
         name = self._get_name()
@@ -1,22 +1,51 @@
-from typing import Iterable, List, Tuple, Any, Dict, TYPE_CHECKING
+from typing import Iterable, List, Mapping, Sequence, Tuple, Any, Dict, TYPE_CHECKING
 
-from . import optim
+try:
+    from . import optim
+except ImportError:
+    optim = None
 from .graphval import GraphVal, OpScope
+from .instrument import instrumented
 
 if TYPE_CHECKING:
     from .flow import FlowGraph
 
 
+def _new_prog(p, op_nums, graph, op_scopes):
+    if optim is None:
+        raise RuntimeError('The optim extension is not built, use sched.list_schedule instead')
+    return optim._prog(p, op_nums, graph, op_scopes)
+
+
 class GraphOptim:
-    def __init__(self, p: 'FlowGraph', op_l: Iterable[GraphVal], op_scopes: Iterable[OpScope]):
+    @instrumented('graph_optim')
+    def __init__(
+            self, p: 'FlowGraph', op_l: Iterable[GraphVal], op_scopes: Iterable[OpScope], op_ids: Mapping[str, int]
+    ):
         self.p: 'FlowGraph' = p
         self.op_l: Tuple[GraphVal] = tuple(op_l)
-        self._prog = optim._prog(p, self.op_nums, self._simple_graph(), op_scopes)
+        # the Op objects can be shared by several models, ids are per model
+        self.op_ids: Mapping[str, int] = op_ids
+        self._prog = _new_prog(p, self.op_nums, self._simple_graph(), op_scopes)
+
+    @classmethod
+    @instrumented('graph_optim')
+    def from_columns(
+            cls, p: 'FlowGraph', op_l: Iterable[GraphVal], op_nums: Sequence[int],
+            graph: Sequence[Sequence[int]], op_scopes: Iterable[OpScope], op_ids: Mapping[str, int]
+    ) -> 'GraphOptim':
+        # graph is already numbered in op_l order, nothing to rebuild
+        self = cls.__new__(cls)
+        self.p = p
+        self.op_l = tuple(op_l)
+        self.op_ids = op_ids
+        self._prog = _new_prog(p, op_nums, graph, op_scopes)
+        return self
 
     @property
     def op_nums(self):
         return tuple(
-            v.op.op_id for v in self.op_l
+            self.op_ids[v.op.name] for v in self.op_l
         )
 
     def _simple_graph(self, ord: Iterable[int] = None) -> List[Tuple[int]]:
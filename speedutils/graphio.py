@@ -0,0 +1,200 @@
+import marshal
+import mmap
+import os
+import struct
+from array import array
+from importlib import import_module
+from typing import Dict, List, Tuple, TYPE_CHECKING, Union
+
+from .graphval import GraphVal, _next_orig, key_id
+from .proc_ctx import proc_ctx
+from .vtypes import Ptr, PtrVal, VType
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+MAGIC = b'SUFG'
+VERSION = 2
+
+# magic, version, node count, arg count, tables size
+_header = struct.Struct('<4sIIII')
+
+KIND_OP = 0
+KIND_VAR = 1
+KIND_CONST = 2
+KIND_UNIQUE = 3
+
+FLAG_RENDERED = 4
+ATTRS_SHIFT = 8
+
+def type_ref(t: VType):
+    if issubclass(t, PtrVal):
+        return 'ptr', type_ref(t.pointee)
+    return t.__module__, t.__qualname__
+
+
+def resolve_type(ref) -> VType:
+    if ref[0] == 'ptr':
+        return Ptr(resolve_type(ref[1]))
+    module, qualname = ref
+    t = import_module(module)
+    for n in qualname.split('.'):
+        t = getattr(t, n)
+    return t
+
+
+def _node_kind(v: GraphVal) -> int:
+    if v.key == v.orig:
+        return KIND_UNIQUE
+    if v.var_name is not None:
+        return KIND_VAR
+    if v.const:
+        return KIND_CONST
+    return KIND_OP
+
+
+def _payload(v: GraphVal):
+    # only stored for nodes that have any of these set
+    payload = (v.var_name, v.val, v.val_args, v.code, v.comment, v.name_prefix, v.op_name)
+    if payload == (None, '', (), None, None, None, v.op and v.op.name):
+        return None
+    return payload
+
+
+def dump_graph(graph: 'FlowGraph') -> bytes:
+    nodes = graph.used_ordered()
+    get_alias = graph.get_alias
+    # aliases are resolved here, a loaded graph has none
+    idx: Dict[int, int] = {v.orig: n for n, v in enumerate(nodes)}
+
+    types: Dict[VType, int] = {}
+    ops: Dict[str, int] = {}
+    payloads = []
+    cols = [array('i') for _ in range(5)]
+    type_col, op_col, scope_col, flag_col, payload_col = cols
+    arg_ptr = array('i', (0,))
+    arg_idx = array('i')
+    for v in nodes:
+        type_col.append(types.setdefault(type(v), len(types)))
+        op_col.append(-1 if v.op is None else ops.setdefault(v.op.name, len(ops)))
+        scope_col.append(v.scope_n)
+        flag_col.append(
+            _node_kind(v)
+            | (FLAG_RENDERED if v.is_rendered else 0)
+            | (v.num_attrs << ATTRS_SHIFT)
+        )
+        payload = _payload(v)
+        if payload is None:
+            payload_col.append(-1)
+        else:
+            payload_col.append(len(payloads))
+            payloads.append(payload)
+        for a in v.a:
+            try:
+                arg_idx.append(idx[get_alias(a).orig])
+            except KeyError:
+                raise ValueError(f'Argument of {v.op_name} is not a node of the graph') from None
+        arg_ptr.append(len(arg_idx))
+
+    tables = marshal.dumps((
+        graph.model.name,
+        tuple(map(type_ref, types)),
+        tuple(ops),
+        tuple((s.exp_use, s.block) for s in graph.scopes),
+        tuple(graph.block_parents),
+        tuple(sorted(graph.skippable_blocks)),
+        tuple(payloads),
+    ))
+    return b''.join((
+        _header.pack(MAGIC, VERSION, len(nodes), len(arg_idx), len(tables)),
+        *(c.tobytes() for c in cols),
+        arg_ptr.tobytes(),
+        arg_idx.tobytes(),
+        tables,
+    ))
+
+
+def save_graph(graph: 'FlowGraph', path: Union[str, os.PathLike]):
+    data = dump_graph(graph)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _read(buf) -> Tuple[List[List[int]], List[int], List[int], tuple]:
+    magic, version, n, n_args, tables_size = _header.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError('Not a saved FlowGraph')
+    if version != VERSION:
+        raise ValueError(f'Unsupported FlowGraph format version {version}')
+
+    ints_end = _header.size + (6 * n + 1 + n_args) * 4
+    with memoryview(buf) as view, view[_header.size:ints_end].cast('i') as ints:
+        cols = [ints[i * n:(i + 1) * n].tolist() for i in range(5)]
+        pos = 5 * n
+        arg_ptr = ints[pos:pos + n + 1].tolist()
+        pos += n + 1
+        arg_idx = ints[pos:pos + n_args].tolist()
+    tables = marshal.loads(buf[ints_end:ints_end + tables_size])
+    return cols, arg_ptr, arg_idx, tables
+
+
+def _build(graph: 'FlowGraph', cols, arg_ptr, arg_idx, tables):
+    pd_name, type_refs, op_names, scopes, block_parents, skippable_blocks, payloads = tables
+    if pd_name != graph.model.name:
+        raise ValueError(f'Graph was saved for `{pd_name}`, not `{graph.model.name}`')
+    types = tuple(map(resolve_type, type_refs))
+    ops = tuple(graph.ops[n] for n in op_names)
+    op_keys = tuple(key_id(n) for n in op_names)
+    graph.load_scopes(scopes, block_parents, skippable_blocks)
+
+    nodes: List[GraphVal] = []
+    new = object.__new__
+    get_node = nodes.__getitem__
+    for t, op, scope_n, flags, payload, start, end in zip(*cols, arg_ptr, arg_ptr[1:]):
+        v = new(types[t])
+        v.p = graph
+        v.scope_n = scope_n
+        v.a = tuple(map(get_node, arg_idx[start:end]))
+        v.attr_stack = ()
+        v.num_attrs = flags >> ATTRS_SHIFT
+        v.orig = _next_orig()
+        v.op = ops[op] if op >= 0 else None
+        v.op_name = v.op and v.op.name
+        v.val_args = ()
+        v.val = ''
+        v.is_rendered = bool(flags & FLAG_RENDERED)
+        v.col_n = -1
+        if payload >= 0:
+            v.var_name, v.val, v.val_args, v.code, v.comment, v.name_prefix, v.op_name = payloads[payload]
+        else:
+            v.var_name = v.code = v.comment = v.name_prefix = None
+        kind = flags & 3
+        v.const = kind == KIND_CONST
+        if kind == KIND_OP:
+            if payload >= 0:
+                v.key = v._gen_key()
+            elif v.op.args_ordered:
+                v.key = (op_keys[op], *(a.orig for a in v.a))
+            else:
+                v.key = (op_keys[op], *sorted(a.orig for a in v.a))
+        elif kind == KIND_VAR:
+            v.key = v._var_key()
+        elif kind == KIND_CONST:
+            v.key = v._const_key()
+        else:
+            v.key = v.orig
+        nodes.append(v)
+
+    graph.add_used_nodes(nodes)
+    return graph
+
+
+def load_graph(src: Union[bytes, str, os.PathLike], **graph_opts) -> 'FlowGraph':
+    # builds a new graph of the current proc, like new_graph() would
+    graph = proc_ctx.new_graph(**graph_opts)
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return _build(graph, *_read(src))
+
+    with open(src, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        parts = _read(buf)
+    return _build(graph, *parts)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from copy import copy, deepcopy
-from typing import Iterable, List, NamedTuple, Optional, Set, TYPE_CHECKING, Tuple, Type
+from operator import attrgetter
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, TYPE_CHECKING, Tuple, Type
 
+from . import fold
 from .proc_ctx import graph_ctx
 from .utils import str_list
 
@@ -20,6 +21,30 @@ def _next_orig() -> int:
     return _orig_id
 
 
+def last_orig() -> int:
+    return _orig_id
+
+
+_key_ids: Dict[Hashable, int] = {}
+
+
+def key_id(k: Hashable) -> int:
+    kid = _key_ids.get(k)
+    if kid is None:
+        kid = _key_ids[k] = len(_key_ids)
+    return kid
+
+
+def _const_token(val) -> Hashable:
+    # keep 1 and 1.0 apart, they are rendered differently
+    if isinstance(val, (tuple, list)):
+        return tuple(map(_const_token, val))
+    if isinstance(val, float):
+        # -0.0 == 0.0 and nan != nan, the text tells them apart
+        return type(val), repr(val)
+    return type(val), val
+
+
 attr_types = {
     'zero': 10,
     'one': 10,
@@ -28,24 +53,40 @@ attr_types = {
     'invdiv': 4
 }
 
-AttrGroup = NamedTuple('AttrGroup', (('type', int), ('attrs', Set[str])))
+ATTR_ZERO = 1
+ATTR_ONE = 2
+ATTR_NOTBIT = 4
+ATTR_NEG = 8
+ATTR_INVDIV = 16
+
+attr_bits = {
+    'zero': ATTR_ZERO,
+    'one': ATTR_ONE,
+    'notbit': ATTR_NOTBIT,
+    'neg': ATTR_NEG,
+    'invdiv': ATTR_INVDIV
+}
+_attr_order = tuple(sorted(attr_bits.items()))
+
+AttrGroup = NamedTuple('AttrGroup', (('type', int), ('attrs', int)))
 OpScope = NamedTuple('OpScope', (('start_pos', int), ('end_pos', int), ('exp_use', float)))
 VType = Type['GraphVal']
 
 
 class GraphVal:
-    op_name: str = ''
-    val_args = ()
-    var_name: Optional[str] = None
-    val = ''
-    const: bool = False
+    __slots__ = (
+        'p', 'scope_n', 'a', 'attr_stack', 'num_attrs', 'orig', 'op', 'code', 'op_name', 'key',
+        'val_args', 'var_name', 'val', 'const', 'comment', 'name_prefix', 'is_rendered', 'col_n',
+        '__weakref__'
+    )
+
     type_name: str = '?'
-    comment = None
-    name_prefix = None
-    is_rendered = True
 
     dims = (1,)
 
+    # the value a const of this type has in the kernel, NotImplemented is not folded
+    fold_val = staticmethod(fold.same_value)
+
     def __init__(
             self,
             a: Iterable['GraphVal', ...] = (), op: Optional['OpDescr'] = None,
@@ -57,8 +98,8 @@ class GraphVal:
             v.flush_attr() for v in a
         )
 
-        self.attr_stack: List[AttrGroup] = []
-        self.num_attrs = set()
+        self.attr_stack: Tuple[AttrGroup, ...] = ()
+        self.num_attrs: int = 0
         self.orig = _next_orig()
 
         self.op: Op = op
@@ -72,7 +113,16 @@ class GraphVal:
         if remove_duplicates:
             self.key = self._gen_key()
         else:
-            str(self.orig)
+            self.key = self.orig
+
+        self.val_args = ()
+        self.var_name: Optional[str] = None
+        self.val = ''
+        self.const: bool = False
+        self.comment = None
+        self.name_prefix = None
+        self.is_rendered = True
+        self.col_n = -1
 
     def trunc(self) -> str:
         if self.const:
@@ -95,12 +145,15 @@ class GraphVal:
         return self.op is not None and self.op.ret_t is not None
 
     def flush_attr(self) -> GraphVal:
+        attr_stack = self.attr_stack
+        if not attr_stack:
+            return self
         new_node = self.copy()
-        attr_stack = new_node.attr_stack
         new_node.attr_stack = ()
         for grp in attr_stack:
-            for a in sorted(grp.attrs):
-                new_node = getattr(new_node, 'apply_' + a)()
+            for a, bit in _attr_order:
+                if grp.attrs & bit:
+                    new_node = getattr(new_node, 'apply_' + a)()
         return new_node
 
     def apply_notbit(self) -> GraphVal:
@@ -226,27 +279,46 @@ class GraphVal:
     def setnot(self, a: str) -> GraphVal:
         new_node = self.copy()
         type = attr_types[a]
-
-        if new_node.attr_stack and new_node.attr_stack[-1].type == type:
-            attrs = new_node.attr_stack[-1].attrs
-            if a in attrs:
-                attrs.discard(a)
-            else:
-                attrs.add(a)
+        bit = attr_bits[a]
+
+        attr_stack = self.attr_stack
+        if attr_stack and attr_stack[-1].type == type:
+            attrs = attr_stack[-1].attrs ^ bit
+            attr_stack = attr_stack[:-1]
+            if attrs:
+                attr_stack += (AttrGroup(type, attrs),)
         else:
-            new_node.attr_stack.append(AttrGroup(type, {a}))
-
-        while new_node.attr_stack and not new_node.attr_stack[-1].attrs:
-            new_node.attr_stack.pop()
+            attr_stack += (AttrGroup(type, bit),)
+        new_node.attr_stack = attr_stack
 
         return new_node
 
-    def __getattr__(self, a: str) -> bool:
-        if a.startswith('_'):
-            return super().__getattribute__(a)
-        if not self.attr_stack:
-            return a in self.num_attrs
-        return a in self.attr_stack[-1].attrs
+    @property
+    def attrs(self) -> int:
+        attr_stack = self.attr_stack
+        if attr_stack:
+            return attr_stack[-1].attrs
+        return self.num_attrs
+
+    @property
+    def zero(self) -> bool:
+        return bool(self.attrs & ATTR_ZERO)
+
+    @property
+    def one(self) -> bool:
+        return bool(self.attrs & ATTR_ONE)
+
+    @property
+    def notbit(self) -> bool:
+        return bool(self.attrs & ATTR_NOTBIT)
+
+    @property
+    def neg(self) -> bool:
+        return bool(self.attrs & ATTR_NEG)
+
+    @property
+    def invdiv(self) -> bool:
+        return bool(self.attrs & ATTR_INVDIV)
 
     # def gen_op(self, n: str, *a: GraphVal) -> GraphVal:
     #     return self.p.op(n, *a)
@@ -260,22 +332,23 @@ class GraphVal:
     @classmethod
     def gen_zero(cls) -> GraphVal:
         v = cls.from_spec_op('zero')
-        v.num_attrs.add('zero')
+        v.num_attrs |= ATTR_ZERO
         return v.p.add_node(v)
 
     @classmethod
     def gen_one(cls) -> GraphVal:
         v = cls.from_const(1.0)
-        v.num_attrs.add('one')
+        v.num_attrs |= ATTR_ONE
         return v.p.add_node(v)
 
     # def store(self, arr: GraphNode, val):
     #     self.p.store(self, arr, val)
 
     def copy(self) -> GraphVal:
-        r = copy(self)
-        r.attr_stack = deepcopy(self.attr_stack)
-        r.num_attrs = deepcopy(self.num_attrs)
+        # attr_stack and num_attrs are immutable, a shallow copy is enough
+        r = object.__new__(type(self))
+        for n, v in zip(_val_slots, _get_val_slots(self)):
+            setattr(r, n, v)
         return r
 
     def reset_orig(self):
@@ -297,12 +370,16 @@ class GraphVal:
                 and self.attr_stack == v.attr_stack
         )
 
-    def _gen_key(self) -> str:
+    def _gen_key(self) -> Tuple[int, ...]:
         if self.op.args_ordered:
-            args_str = 'X'.join(str(o.orig) for o in self.a)
-        else:
-            args_str = 'X'.join(sorted(str(o.orig) for o in self.a))
-        return f'{self.op_name}Y{args_str}'
+            return (key_id(self.op_name), *(o.orig for o in self.a))
+        return (key_id(self.op_name), *sorted(o.orig for o in self.a))
+
+    def _var_key(self) -> Tuple[int]:
+        return key_id((self.var_name, type(self))),
+
+    def _const_key(self) -> Tuple[int, Any]:
+        return key_id(self.op_name), _const_token(self.val)
 
     def render_op(self, mapper: NodeMapper) -> Iterable[str]:
         if not self.is_rendered:
@@ -310,7 +387,7 @@ class GraphVal:
 
         arg_list = str_list(self.val_args) + tuple(map(mapper.get, self.a))
         if self.has_output:
-            prefix = [f'{self.type_name} {mapper.get(self)} =']
+            prefix = [mapper.def_prefix(self)]
         else:
             prefix = []
         if self.code:
@@ -376,14 +453,18 @@ class GraphVal:
         graph_ctx.new_scope()
         return r
 
+    @classmethod
+    def _var_op(cls) -> Op:
+        return graph_ctx.find_spec_op('load', cls)
+
     @classmethod
     def var(cls, var_name: str, start_scope=True):
         v = cls(
-            op=graph_ctx.find_spec_op('load', cls)
+            op=cls._var_op()
         )
 
-        v.key = f'{var_name}Z{cls.__name__}'
         v.var_name = var_name
+        v.key = v._var_key()
         v.is_rendered = False
         if start_scope:
             v.scope_n = 0
@@ -412,7 +493,7 @@ class GraphVal:
         )
 
         v.val = val
-        v.key = f'{v.op_name}Z{v.val}'
+        v.key = v._const_key()
         v.val_args = (v.val,)
         v.const = True
 
@@ -436,6 +517,9 @@ class GraphVal:
         v.scope_n = v.p.get_scope_n()  # put separator in current scope
         return v.p.add_node(v)
 
+_val_slots = tuple(n for n in GraphVal.__slots__ if n != '__weakref__')
+_get_val_slots = attrgetter(*_val_slots)
+
 # class OpNode(GraphNode):
 #     def __init__(self, p: 'FlowGraph', n: str, a: Iterable[GraphNode]):
 #         a = flush_attrs(a)
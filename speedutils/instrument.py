@@ -0,0 +1,203 @@
+import inspect
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter_ns
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+# the active Profiler, hot paths check `instrument.profiler is not None` and nothing else
+profiler: Optional['Profiler'] = None
+
+PhaseStats = NamedTuple('PhaseStats', (
+    ('calls', int), ('seconds', float), ('allocations', int), ('counters', Dict[str, int])
+))
+
+
+class _Phase:
+    __slots__ = ('name', 'func', 'stack', 'tid', 'start', 'blocks', 'counters')
+
+    def __init__(self, name: str, func: Optional[str], stack: List['_Phase']):
+        self.name = name
+        self.func = func
+        # of the thread that began it, a generator may be finished elsewhere
+        self.stack = stack
+        self.tid = threading.get_ident()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.blocks = sys.getallocatedblocks()
+        self.start = perf_counter_ns()
+
+
+# finished phase: name, func, start ns, duration ns, allocated blocks, counters, thread id
+_Event = Tuple[str, Optional[str], int, int, int, Dict[str, int], int]
+
+
+class Profiler:
+    def __init__(self):
+        self.events: List[_Event] = []
+        self._local = threading.local()
+        self._origin = perf_counter_ns()
+        self._pid = os.getpid()
+
+    @property
+    def _stack(self) -> List[_Phase]:
+        # phases nest per thread
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    def count(self, key: str, n: int = 1):
+        stack = self._stack
+        if stack:
+            stack[-1].counters[key] += n
+
+    def begin(self, name: str, func: str = None) -> _Phase:
+        stack = self._stack
+        if func is None and stack:
+            func = stack[-1].func
+        p = _Phase(name, func, stack)
+        stack.append(p)
+        return p
+
+    def end(self, p: _Phase):
+        # `p` from begin, phases begun inside it and not ended yet move to its parent
+        end = perf_counter_ns()
+        stack = p.stack
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is p:
+                del stack[i]
+                break
+        else:
+            raise RuntimeError(f'Phase {p.name} was ended already')
+        blocks = sys.getallocatedblocks() - p.blocks
+        self.events.append((p.name, p.func, p.start, end - p.start, blocks, dict(p.counters), p.tid))
+        if i:
+            # counters of nested phases add up in their parents
+            parent = stack[i - 1].counters
+            for k, v in p.counters.items():
+                parent[k] += v
+
+    @contextmanager
+    def phase(self, name: str, func: str = None):
+        p = self.begin(name, func)
+        try:
+            yield p
+        finally:
+            self.end(p)
+
+    def stats(self) -> Dict[Tuple[str, Optional[str]], PhaseStats]:
+        # inclusive of nested phases, keyed by (phase, func name)
+        acc = {}
+        for name, func, _, dur, blocks, counters, _ in self.events:
+            calls, ns, allocs, total = acc.get((name, func), (0, 0, 0, {}))
+            total = dict(total)
+            for k, v in counters.items():
+                total[k] = total.get(k, 0) + v
+            acc[name, func] = (calls + 1, ns + dur, allocs + blocks, total)
+        return {
+            k: PhaseStats(calls, ns / 1e9, allocs, counters)
+            for k, (calls, ns, allocs, counters) in acc.items()
+        }
+
+    def cse_hit_rate(self, name: str, func: str = None) -> Optional[float]:
+        s = self.stats().get((name, func))
+        if s is None:
+            return None
+        hits = s.counters.get('cse_hits', 0)
+        total = hits + s.counters.get('nodes', 0)
+        return hits / total if total else None
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        # complete events, load in chrome://tracing or Perfetto
+        events = []
+        for name, func, start, dur, blocks, counters, tid in self.events:
+            args: Dict[str, Any] = {'allocations': blocks, **counters}
+            if func is not None:
+                args['func'] = func
+            events.append({
+                'name': name if func is None else f'{name} {func}',
+                'cat': name,
+                'ph': 'X',
+                'ts': (start - self._origin) / 1000,
+                'dur': dur / 1000,
+                'pid': self._pid,
+                'tid': tid,
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path: Union[str, os.PathLike]):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def enable(p: Profiler = None) -> Profiler:
+    global profiler
+    profiler = p if p is not None else Profiler()
+    return profiler
+
+
+def disable() -> Optional[Profiler]:
+    global profiler
+    p, profiler = profiler, None
+    return p
+
+
+@contextmanager
+def profiling(p: Profiler = None):
+    old = profiler
+    p = enable(p)
+    try:
+        yield p
+    finally:
+        if old is not None:
+            enable(old)
+        else:
+            disable()
+
+
+def _func_name(self) -> str:
+    return getattr(self, '_name', None) or type(self).__name__
+
+
+def instrumented(name: str, per_func=False):
+    # method decorator, a disabled profiler costs one global lookup per call
+    def decor(f):
+        if inspect.isgeneratorfunction(f):
+            @wraps(f)
+            def gen_wrapper(self, *args, **kwargs):
+                if profiler is None:
+                    return f(self, *args, **kwargs)
+                return _profiled_gen(profiler, f(self, *args, **kwargs), name, _func_name(self) if per_func else None)
+            return gen_wrapper
+
+        @wraps(f)
+        def wrapper(self, *args, **kwargs):
+            p = profiler
+            if p is None:
+                return f(self, *args, **kwargs)
+            ph = p.begin(name, _func_name(self) if per_func else None)
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                p.end(ph)
+        return wrapper
+    return decor
+
+
+def _profiled_gen(p: Profiler, gen, name: str, func: Optional[str]):
+    # the phase covers the whole iteration, the consumer's time included
+    ph = p.begin(name, func)
+    try:
+        n = 0
+        for item in gen:
+            n += 1
+            yield item
+        ph.counters['items'] += n
+    finally:
+        p.end(ph)
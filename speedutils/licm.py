@@ -0,0 +1,110 @@
+from collections import defaultdict
+from itertools import accumulate
+from typing import Dict, List, TYPE_CHECKING, Tuple
+
+from .graphval import GraphVal
+from .proc_descr import split_op_name
+from .vtypes import CtlCodeVal
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+
+def _block_chain(parents: List[int], block: int) -> Tuple[int, ...]:
+    chain = []
+    while block is not None:
+        chain.append(block)
+        block = parents[block]
+    return tuple(chain)
+
+
+def _is_pinned(v: GraphVal) -> bool:
+    # stores, stationary code, separators and named variables stay where they were built
+    return (
+            not v.has_output
+            or v.key == v.orig
+            or v.var_name is not None
+    )
+
+
+def _clobbers(v: GraphVal) -> bool:
+    # stores, and code the graph cannot see into, e.g. calls, may write memory
+    if v.op is None:
+        return not isinstance(v, CtlCodeVal)
+    return not v.has_output
+
+
+def _is_load(v: GraphVal) -> bool:
+    return split_op_name(v.op.name)[0] == 'load'
+
+
+class _LoopInfo:
+    def __init__(self, graph: 'FlowGraph', nodes: Tuple[GraphVal, ...]):
+        scopes = graph.scopes
+        self.exp_use = [s.exp_use for s in scopes]
+        self.chains = [_block_chain(graph.block_parents, s.block) for s in scopes]
+        self.skippable = graph.skippable_blocks
+
+        self.block_end: Dict[int, int] = {}
+        for n, chain in enumerate(self.chains):
+            for b in chain:
+                self.block_end[b] = n
+
+        stores = [0] * len(scopes)
+        for v in nodes:
+            if _clobbers(v):
+                stores[v.scope_n] += 1
+        self._stores_before = (0, *accumulate(stores))
+
+    def _stores_in(self, start: int, end: int) -> int:
+        return self._stores_before[end + 1] - self._stores_before[start]
+
+    def targets(self, lo: int, cur: int, is_load: bool):
+        # scopes enclosing `cur` that v can move to, latest first
+        chain = self.chains[cur]
+        for t in range(cur - 1, lo - 1, -1):
+            if self.chains[t][0] not in chain:
+                continue
+            if is_load:
+                exited = chain[:len(chain) - len(self.chains[t])]
+                end = max((self.block_end[b] for b in exited), default=cur)
+                # a load ahead of a block that may not run could read out of bounds
+                if self._stores_in(t + 1, max(end, cur)) or not self.skippable.isdisjoint(exited):
+                    break
+            yield t
+
+
+def hoist_invariants(graph: 'FlowGraph') -> Dict[int, float]:
+    nodes = graph.used_ordered()
+    info = _LoopInfo(graph, nodes)
+    get_alias = graph.get_alias
+
+    scope_of: Dict[int, int] = {}
+    moved: List[GraphVal] = []
+    saved: Dict[int, float] = defaultdict(float)
+    for v in nodes:
+        cur = v.scope_n
+        if _is_pinned(v):
+            continue
+
+        lo = 0
+        for a in v.a:
+            alias = get_alias(a)
+            lo = max(lo, scope_of.get(alias.orig, alias.scope_n))
+            if alias.orig != a.orig:  # bound copies keep the scope they were bound to
+                lo = max(lo, a.scope_n)
+
+        best = cur
+        for t in info.targets(lo, cur, _is_load(v)):
+            if info.exp_use[t] < info.exp_use[best]:
+                best = t
+        if best == cur:
+            continue
+
+        saved[info.chains[cur][0]] += v.op.exec_t * (info.exp_use[cur] - info.exp_use[best])
+        v.scope_n = scope_of[v.orig] = best
+        moved.append(v)
+
+    if moved:
+        graph.rescope(moved)
+    return dict(saved)
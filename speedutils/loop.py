@@ -1,14 +1,17 @@
 from collections import defaultdict
 from functools import wraps
 from itertools import chain
-from typing import Iterable, Type
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Tuple, Type, TYPE_CHECKING, Union
 
-from .array import CumDims, Dimension, StoredArray
+from .array import ArrayDescr, CumDims, Dimension, MemArray, StoredArray
 from .func import Func
-from .gpu import GpuFunc, GroupedGpuFunc
 from .graphval import GraphVal
-from .proc_ctx import func_ctx, graph_ctx
-from .vtypes import CodeVal, Tcfg, int32_
+from .proc_ctx import func_ctx, graph_ctx, proc_ctx
+from .proc_descr import MemLevel
+from .vtypes import CtlCodeVal, Tcfg, int32_
+
+if TYPE_CHECKING:
+    from .gpu import GpuFunc
 
 
 def _it_name(dname) -> str:
@@ -23,31 +26,49 @@ class Loop:
             end_val: GraphVal = None,
             range_len: GraphVal = None,
             shift_len: GraphVal = None,
-            external_iter: GraphVal = None
+            external_iter: GraphVal = None,
+            unroll: int = 1,
+            name: str = None
     ):
         self._exp_use = exp_use
+        self.block = None
 
         self._shift_len = shift_len
+        self._unroll = unroll
+        self._range_len = range_len
+        self._start_val = start_val
 
-        if external_iter is None:
-            self._iter_val = graph_ctx.sep(start_val)
-        else:
-            self._iter_val = external_iter
+        # declared when the loop opens, straight line copies do without it
+        self._name = name
+        self._iter_val = external_iter
 
         if end_val is None:
-            self._end_val = range_len
-        else:
-            self._end_val = end_val
+            if start_val is None or start_val.const and start_val.val == 0:
+                end_val = range_len
+            else:
+                end_val = start_val + range_len
+        self._end_val = end_val
+
+    def _declare(self):
+        # a mutable variable, bound copies keep its users inside the loop,
+        # numbered by the next block so the copies of a nested loop differ
+        if self._iter_val is not None:
+            return
+        t = type(self._start_val)
+        name = f'{self._name or "it"}{len(graph_ctx.block_parents)}'
+        CtlCodeVal.stationary_code(f'{t.type_name} {name} = {{}};', None, self._start_val)
+        self._iter_val = t.var(name)
 
     def open(self):
-        CodeVal.start_use_block(self._exp_use)
-        CodeVal.stationary_code('do {{')
-        return graph_ctx.bind_scope(self._iter_val)
+        self._declare()
+        self.block = graph_ctx.start_use_block(self._exp_use)
+        CtlCodeVal.stationary_code('do {{')
+        return self._iter_val.bind_scope()
 
     def close(self):
-        it = graph_ctx.bind_scope(self._iter_val)
-        CodeVal.stationary_code('{} = {};', it, it + self._shift_len)
-        CodeVal.stationary_code('}} while ({} < {});', it, self._end_val)
+        it = self._iter_val.bind_scope()
+        CtlCodeVal.stationary_code('{} = {};', None, it, it + self._shift_len)
+        CtlCodeVal.stationary_code('}} while ({} < {});', None, it, self._end_val)
         graph_ctx.end_use_block()
 
     def __enter__(self):
@@ -56,8 +77,105 @@ class Loop:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def trip_count(self) -> Optional[int]:
+        # None unless the length and the step are consts
+        shift = self._shift_len
+        if not shift.const or shift.val <= 0:
+            return None
+        if self._range_len is not None and self._range_len.const:
+            span = self._range_len.val
+        elif self._start_val is not None and self._start_val.const and self._end_val.const:
+            span = self._end_val.val - self._start_val.val
+        else:
+            return None
+        return max(0, -(-span // shift.val))
+
+    def _copies(self, body: Callable[[GraphVal], Any], it: GraphVal, n: int) -> Tuple[GraphVal, Any]:
+        # straight line bodies at it, it + shift, ..., the iterators chain so CSE sees through them
+        r = None
+        for _ in range(n):
+            r = body(it)
+            it = it + self._shift_len
+        return it, r
+
+    def _unrolled(self, body: Callable[[GraphVal], Any], exp_use: float, guard: bool) -> Any:
+        u = self._unroll
+        shift = self._shift_len
+        # the last copy of an iteration must still be in range
+        limit = self._end_val + type(shift).from_const(-(u - 1) * shift.val)
+        self._declare()
+        self.block = graph_ctx.start_use_block(exp_use, skippable=guard)
+        if guard:
+            # one line, nothing hoisted out of the block can land under the guard
+            CtlCodeVal.stationary_code('if ({} < {}) do {{', None, self._iter_val.bind_scope(), limit)
+        else:
+            CtlCodeVal.stationary_code('do {{')
+        it, r = self._copies(body, self._iter_val.bind_scope(), u)
+        var = self._iter_val.bind_scope()
+        CtlCodeVal.stationary_code('{} = {};', None, var, it)
+        CtlCodeVal.stationary_code('}} while ({} < {});', None, var, limit)
+        graph_ctx.end_use_block()
+        return r
+
+    def _remainder(self, body: Callable[[GraphVal], Any]) -> Any:
+        # at most unroll - 1 iterations left
+        graph_ctx.start_use_block((self._unroll - 1) / 2, skippable=True)
+        CtlCodeVal.stationary_code('while ({} < {}) {{', None, self._iter_val.bind_scope(), self._end_val)
+        it, r = self._copies(body, self._iter_val.bind_scope(), 1)
+        CtlCodeVal.stationary_code('{} = {};', None, self._iter_val.bind_scope(), it)
+        CtlCodeVal.stationary_code('}}')
+        graph_ctx.end_use_block()
+        return r
+
+    def run(self, body: Callable[[GraphVal], Any]) -> Any:
+        # traces body once per copy, returns the result of the last one
+        u = self._unroll
+        if u <= 1:
+            with self as it:
+                return body(it)
+        if not self._shift_len.const:
+            raise ValueError('Unrolled loop needs a const step')
+
+        n = self.trip_count()
+        if n is None:
+            # without a count the loop is guessed long enough to be worth unrolling,
+            # the body repeating more often than the remainder
+            self._unrolled(body, max(self._exp_use / u, u), guard=True)
+            return self._remainder(body)
+
+        groups, rest = divmod(n, u)
+        r = None
+        if groups > 1:
+            r = self._unrolled(body, groups, guard=False)
+            it = self._iter_val.bind_scope()
+        else:
+            it, r = self._copies(body, self._start_val, u * groups)
+        if rest:
+            _, r = self._copies(body, it, rest)
+        return r
+
+
+def _size_val(sizes: Iterable[Union[int, str]]) -> GraphVal:
+    # product of loop sizes, str ones are runtime int32 args of the func
+    const = 1
+    v = None
+    for s in sizes:
+        if isinstance(s, str):
+            s = func_ctx.get_var(s, int32_)
+            v = s if v is None else v * s
+        else:
+            const *= s
+    if v is None:
+        return int32_.from_const(const)
+    return v if const == 1 else v * int32_.from_const(const)
+
 
 class LoopFunc(Func):
+    def _process_args(self, args):
+        # ((dimension, factor), ...), for the innermost loop over the dimension
+        args.setdefault('unroll', ())
+        return super()._process_args(args)
+
     def decor(self, f: Func):
         @wraps(f)
         def wrapper(f: Func = f):
@@ -65,33 +183,38 @@ class LoopFunc(Func):
             block_ddims = CumDims.from_cfg(
                 func_ctx.const_val('block_ddims', Tcfg)
             )
-            block_sizes = []
+            unroll = dict(func_ctx.const_val('unroll', Tcfg))
+            # sizes of the loops inside, per dimension, a loop steps over all of them
+            inner = defaultdict(list)
+            loops = []
             for d in loop_dims:
-                block_sizes.append(block_ddims)
-                block_ddims *= CumDims.from_cfg([d])
-
-            loop_stack = []
-            iters = {}
-            for d, s in zip(reversed(loop_dims), reversed(block_sizes)):
                 d = Dimension(*d)
-                n = d.n
-                it_n = _it_name(n)
+                loops.append((d, (block_ddims[d.n], *inner[d.n]), 1 if inner[d.n] else unroll.get(d.n, 1)))
+                inner[d.n].append(d.size)
+            loops.reverse()
+
+            def nest(level, iters):
+                if level == len(loops):
+                    return f(**iters)  # TODO: func in name
+                d, shift, factor = loops[level]
+                it_n = _it_name(d.n)
                 l = Loop(
-                    start_val=iters[it_n] if it_n in iters else int32_.zero(),
-                    range_len=int32_.v(d.size),
-                    shift_len=int32_.v(s[n])
+                    start_val=iters[it_n] if it_n in iters else int32_.from_const(0),
+                    range_len=_size_val((d.size,)),
+                    shift_len=_size_val(shift),
+                    unroll=factor,
+                    name=f'{it_n}_'
                 )
-                iters[it_n] = l.open()
-                loop_stack.append(l)
-            r = f(**iters)  # TODO: func in name
-            while loop_stack:
-                loop_stack.pop().close()
-            return r
+                return l.run(lambda it: nest(level + 1, {**iters, it_n: it}))
+
+            return nest(0, {})
 
         return super().decor(wrapper)
 
 
-def _create_gpu_loop_func(gpu_func_t: Type[GpuFunc]) -> Type[GpuFunc]:
+def _create_gpu_loop_func(gpu_func_t: Type['GpuFunc']) -> Type['GpuFunc']:
+    from .gpu import GroupedGpuFunc
+
     class loop_t(gpu_func_t):
         def __init__(self, **opts):
             super().__init__(**opts)
@@ -164,7 +287,7 @@ def _create_gpu_loop_func(gpu_func_t: Type[GpuFunc]) -> Type[GpuFunc]:
 GPU_LOOP_FUNCS = {}
 
 
-def GpuLoopFunc(gpu_func_t: Type[GpuFunc], **kwargs):
+def GpuLoopFunc(gpu_func_t: Type['GpuFunc'], **kwargs):
     global GPU_LOOP_FUNCS
     try:
         loop_t = GPU_LOOP_FUNCS[gpu_func_t]
@@ -174,15 +297,26 @@ def GpuLoopFunc(gpu_func_t: Type[GpuFunc], **kwargs):
 
 
 class ArraysLoop:
-    def __init__(self, arrs: Iterable[StoredArray], dim_order: Iterable[Dimension]):
+    def __init__(
+            self,
+            arrs: Iterable[StoredArray],
+            dim_order: Iterable[Dimension],
+            outs: Iterable[StoredArray] = (),
+            unroll: Mapping[str, int] = None
+    ):
+        # `dim_order` innermost first like LoopFunc loop_dims, `outs` are written with the blocks
+        # the body returns, `unroll` as for LoopFunc, for the register tile loops
         self._arrs = tuple(arrs)
-        self._dim_order = tuple(dim_order)
+        self._outs = tuple(outs)
+        self._dim_order = tuple(Dimension(*d) for d in dim_order)
+        self._unroll = dict(unroll or {})
 
+        all_arrs = self._arrs + self._outs
         adims = tuple(
-            a.ddims for a in self._arrs
+            a.ddims for a in all_arrs
         )
         dim_ns = set(chain(*(
-            a.ddims.keys() for a in self._arrs
+            a.ddims.keys() for a in all_arrs
         )))
         for dim in dim_ns:
             vs = set(
@@ -192,4 +326,106 @@ class ArraysLoop:
             if len(vs) > 1:
                 raise ValueError(f'Insufficient values {vs} for dimension {dim}')
 
-    # def get_ranges(self):
+        for a in all_arrs:
+            names = a.dims.names
+            if len(set(names)) != len(names):
+                raise ValueError(f'Dimensions {names} are split, tiles need each dimension once')
+        for d in self._dim_order:
+            if any(dd[d.n] not in (1, d.size) for dd in adims):
+                raise ValueError(f'Dimension {d.n} of size {d.size} differs from the arrays')
+        missing = {n for n in dim_ns if any(dd[n] > 1 for dd in adims)} - {d.n for d in self._dim_order}
+        if missing:
+            raise ValueError(f'Dimensions {sorted(missing)} are not in the loop order')
+
+    def _working_set(self, tile: Mapping[str, int]) -> int:
+        # values of one tile of every array, an array without a dimension is reused along it
+        return sum(
+            _restricted(tile, a).size
+            for a in chain(self._arrs, self._outs)
+        )
+
+    def _grow(self, tile: CumDims, limit: int) -> CumDims:
+        # innermost dimensions first, each as large as still fits, in multiples of the smaller tile
+        tile = CumDims(tile)
+        for d in self._dim_order:
+            for f in reversed(range(tile[d.n], d.size + 1, tile[d.n])):
+                if d.size % f:
+                    continue
+                t = CumDims(tile)
+                t[d.n] = f
+                if self._working_set(t) <= limit:
+                    tile = t
+                    break
+        return tile
+
+    def tiles(self, mem_levels: Sequence[MemLevel] = None) -> Tuple[CumDims, CumDims]:
+        # register and L1 tiles from the first two memory levels, fastest first
+        if mem_levels is None:
+            mem_levels = proc_ctx.model.mem_levels
+        if not mem_levels:
+            raise ValueError('No memory levels to size the tiles')
+        reg_tile = self._grow(CumDims(), mem_levels[0].size)
+        if len(mem_levels) < 2:
+            return reg_tile, reg_tile
+        return reg_tile, self._grow(reg_tile, mem_levels[1].size)
+
+    def _start(self, a: StoredArray, iters: Mapping[str, GraphVal]) -> GraphVal:
+        start = None
+        stride = 1
+        for d in a.dims:
+            it = iters.get(d.n)
+            if it is not None:
+                off = it if stride == 1 else it * int32_.from_const(stride)
+                start = off if start is None else start + off
+            stride *= d.size
+        return int32_.from_const(0) if start is None else start
+
+    def run(self, body: Callable[..., Any], mem_levels: Sequence[MemLevel] = None) -> Any:
+        # body gets a register tile MemArray per array and returns one per out,
+        # L1 tile loops outside, register tile loops inside
+        reg_tile, l1_tile = self.tiles(mem_levels)
+        outer_first = self._dim_order[::-1]
+        loops = [
+            (d.n, d.size, l1_tile[d.n], 1)
+            for d in outer_first if l1_tile[d.n] < d.size
+        ] + [
+            (d.n, l1_tile[d.n], reg_tile[d.n], self._unroll.get(d.n, 1))
+            for d in outer_first if reg_tile[d.n] < l1_tile[d.n]
+        ]
+
+        def tile(iters):
+            blocks = tuple(
+                a.load(_restricted(reg_tile, a), self._start(a, iters))
+                for a in self._arrs
+            )
+            r = body(*blocks)
+            if isinstance(r, MemArray):
+                r = r,
+            if r is None:
+                r = ()
+            if len(r) != len(self._outs):
+                raise ValueError(f'Body returned {len(r)} blocks for {len(self._outs)} outputs')
+            for o, b in zip(self._outs, r):
+                o.store(b, self._start(o, iters))
+            return r
+
+        def nest(level, iters):
+            if level == len(loops):
+                return tile(iters)
+            n, size, step, factor = loops[level]
+            l = Loop(
+                start_val=iters[n] if n in iters else int32_.from_const(0),
+                range_len=int32_.from_const(size),
+                shift_len=int32_.from_const(step),
+                unroll=factor,
+                name=f'{_it_name(n)}_'
+            )
+            return l.run(lambda it: nest(level + 1, {**iters, n: it}))
+
+        return nest(0, {})
+
+
+def _restricted(ddims: Mapping[str, int], a: ArrayDescr) -> CumDims:
+    # the part of a tile that an array spans
+    names = a.dims.names
+    return CumDims((n, s) for n, s in ddims.items() if n in names and s > 1)
@@ -0,0 +1,143 @@
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, TYPE_CHECKING
+
+from .graphval import GraphVal
+from .proc_descr import split_op_name
+from .vtypes import PtrVal
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+# index as `base + offset`, base is None for constant indexes
+Index = Tuple[Optional[int], int]
+
+MemFlowStats = NamedTuple('MemFlowStats', (('forwarded', int), ('dead_stores', int)))
+
+
+def _op_base(v: GraphVal) -> Optional[str]:
+    if v.op is None or v.code is not None:
+        return None
+    return split_op_name(v.op.name)[0]
+
+
+class _Pending:
+    __slots__ = ('store', 'val', 'read')
+
+    def __init__(self, store: GraphVal, val: GraphVal):
+        self.store = store
+        self.val = val
+        self.read = False
+
+
+class _MemState:
+    def __init__(self, graph: 'FlowGraph', restrict: bool):
+        self._alias = graph.get_alias
+        self._restrict = restrict
+        # arr orig -> index -> last store
+        self._arrs: Dict[int, Dict[Index, _Pending]] = {}
+        # origs used as arrays by loads or stores
+        self.arrays: Set[int] = set()
+
+    def index(self, idx: GraphVal) -> Index:
+        idx = self._alias(idx)
+        if idx.const and isinstance(idx.val, int):
+            return None, idx.val
+        base = _op_base(idx)
+        if base in ('add', 'sub') and len(idx.a) == 2:
+            x, c = map(self._alias, idx.a)
+            if base == 'add' and x.const:
+                x, c = c, x
+            if c.const and isinstance(c.val, int):
+                x_base, x_off = self.index(x)
+                return x_base, x_off + (c.val if base == 'add' else -c.val)
+        return idx.orig, 0
+
+    @staticmethod
+    def _may_overlap(i: Index, j: Index) -> bool:
+        return i[0] != j[0] or i[1] == j[1]
+
+    def _overlapping(self, arr: int):
+        for n, stores in self._arrs.items():
+            if n == arr or not self._restrict:
+                yield n, stores
+
+    def reset(self):
+        self._arrs = {}
+
+    def read_all(self, arr: int):
+        # the array is read where the index is unknown
+        for _, stores in self._overlapping(arr):
+            for p in stores.values():
+                p.read = True
+
+    def load(self, arr: int, i: Index) -> Optional[GraphVal]:
+        self.arrays.add(arr)
+        stores = self._arrs.get(arr, {})
+        p = stores.get(i)
+        if p is not None:
+            p.read = True
+            return p.val
+        for n, stores in self._overlapping(arr):
+            for j, p in stores.items():
+                # indexes only compare within an array, another one may start at an offset
+                if n != arr or self._may_overlap(i, j):
+                    p.read = True
+        return None
+
+    def store(self, arr: int, i: Index, v: GraphVal, val: GraphVal) -> Optional[GraphVal]:
+        self.arrays.add(arr)
+        stores = self._arrs.setdefault(arr, {})
+        old = stores.get(i)
+        if not self._restrict:
+            for other, other_stores in self._arrs.items():
+                if other != arr:
+                    other_stores.clear()  # may be overwritten now
+        for j in tuple(stores):
+            if j != i and j[0] != i[0]:
+                del stores[j]
+        stores[i] = _Pending(v, val)
+        if old is not None and not old.read:
+            return old.store
+        return None
+
+
+def forward_stores(graph: 'FlowGraph', restrict=False) -> MemFlowStats:
+    # `restrict` assumes different array vars never point to the same memory,
+    # only for functions whose array params are declared restrict
+    nodes = graph.used_ordered()
+    scopes = graph.scopes
+    state = _MemState(graph, restrict)
+    get_alias = graph.get_alias
+
+    forwarded = 0
+    dead: List[GraphVal] = []
+    block = None
+    for v in nodes:
+        if scopes[v.scope_n].block != block:
+            block = scopes[v.scope_n].block
+            state.reset()
+
+        base = _op_base(v)
+        if v.op is None:  # stationary code, nothing is known across it
+            state.reset()
+        elif base == 'stor':
+            val, arr, idx = v.a
+            old = state.store(get_alias(arr).orig, state.index(idx), v, get_alias(val))
+            if old is not None:
+                dead.append(old)
+        elif base == 'load' and v.var_name is None:
+            arr, idx = v.a
+            val = state.load(get_alias(arr).orig, state.index(idx))
+            if val is not None and type(val) is type(v):
+                graph.replace(v, val)
+                forwarded += 1
+        elif v.code is not None:
+            # custom code may read through an array it gets
+            for a in map(get_alias, v.a):
+                if a.orig in state.arrays or isinstance(a, PtrVal):
+                    state.read_all(a.orig)
+
+    for v in dead:
+        graph.remove_root(v)
+    if forwarded or dead:
+        graph.recompute_used()
+    return MemFlowStats(forwarded, len(dead))
@@ -5,15 +5,18 @@ from typing import Iterable, TYPE_CHECKING, Union
 if TYPE_CHECKING:
     from .flow import FlowGraph
     from .func import Func
+    from .proc_model import ProcModel
 
 
 class ProcCtx:
     def __init__(self, pd):
+        from .proc_model import get_proc_model
         self._pd = pd
+        self.model: 'ProcModel' = get_proc_model(pd)
 
-    def new_graph(self) -> 'FlowGraph':
+    def new_graph(self, columnar=False, drop_unused=False, fold_consts=True) -> 'FlowGraph':
         from .flow import FlowGraph
-        return FlowGraph(mem_levels=self._pd.mem_levels, ops=self._pd.ops)
+        return FlowGraph(self.model, columnar=columnar, drop_unused=drop_unused, fold_consts=fold_consts)
 
     @property
     def arch(self):
@@ -82,8 +85,17 @@ def func_scope(f):
 
 
 @contextmanager
-def new_graph() -> Iterable['FlowGraph']:
-    graph = proc_ctx.new_graph()
+def graph_scope(graph):
+    old = graph_ctx._set(graph)
+    try:
+        yield graph
+    finally:
+        graph_ctx.reset(old)
+
+
+@contextmanager
+def new_graph(columnar=False, drop_unused=False, fold_consts=True) -> Iterable['FlowGraph']:
+    graph = proc_ctx.new_graph(columnar=columnar, drop_unused=drop_unused, fold_consts=fold_consts)
     old = graph_ctx._set(graph)
     try:
         yield graph
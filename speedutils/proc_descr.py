@@ -1,6 +1,8 @@
 from dataclasses import dataclass
-from typing import NamedTuple, Optional, Tuple
+from itertools import permutations
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple, Type
 
+from . import fold
 from .vtypes import VType
 
 MemLevel = NamedTuple('MemLevel', (('name', str), ('size', int), ('port_n', int), ('load_time', float)))
@@ -14,6 +16,8 @@ class Op:
     ports: Tuple[int]
     args_ordered: bool = True
     expr: str = ''
+    # evaluates the op on const values at build time, may return NotImplemented
+    py_eval: Optional[Callable[..., Any]] = None
 
     def format_expr(self, args):
         if self.expr:
@@ -53,8 +57,18 @@ class SimpleStoreOp(Op):
         )
 
 
+def _elementwise_types(args_t: Tuple[VType, ...], ret_t: Optional[VType]) -> bool:
+    # elementwise folding is only right for scalars or vectors all of one shape,
+    # e.g. a matrix product needs its own py_eval
+    if ret_t is None:
+        return False
+    return len({t.dims for t in (*args_t, ret_t)}) == 1 and len(ret_t.dims) == 1
+
+
 class SignOp(Op):
-    def __init__(self, name, sign, args_t, args_ordered=True, **kwargs):
+    def __init__(self, name, sign, args_t, args_ordered=True, py_eval=None, **kwargs):
+        if py_eval is None and _elementwise_types(args_t, kwargs.get('ret_t')):
+            py_eval = fold.sign_evaluator(sign, len(args_t))
         args_t = tuple(
             v.type_name for v in args_t
         )
@@ -73,18 +87,22 @@ class SignOp(Op):
             name=f'{name}Y{args_str}',
             expr=expr,
             args_ordered=args_ordered,
+            py_eval=py_eval,
             **kwargs
         )
 
 
 class CvtOp(Op):
-    def __init__(self, in_t: VType, ret_t: VType, expr=None, **kwargs):
+    def __init__(self, in_t: VType, ret_t: VType, expr=None, py_eval=None, **kwargs):
         if expr is None:
             expr = f'{ret_t.type_name}({{}})'
+        if py_eval is None and in_t.dims == ret_t.dims == (1,):
+            py_eval = fold.same_value  # scalar from_const does the conversion
         super().__init__(
             name=f'cvtY{in_t.type_name}X{ret_t.type_name}',
             ret_t=ret_t,
             expr=expr,
+            py_eval=py_eval,
             **kwargs
         )
 
@@ -100,3 +118,38 @@ class TypedNoargOp(Op):
 
 class ProcDescr(NamedTuple('ProcDescr', (('name', str), ('mem_levels', Tuple[MemLevel]), ('ops', Tuple[Op])))):
     pass
+
+
+def split_op_name(name: str) -> Tuple[str, Tuple[str, ...]]:
+    base, _, types = name.partition('Y')
+    return base, tuple(types.split('X')) if types else ()
+
+
+_unresolved = object()
+
+
+class OpTable:
+    def __init__(self, ops: Iterable[Op]):
+        self.ops: Dict[str, Op] = {}
+        self._by_type_names: Dict[Tuple[str, Tuple[str, ...]], Op] = {}
+        self._by_types: Dict[Tuple[str, Tuple[Type, ...]], Optional[Op]] = {}
+
+        ops = tuple(ops)
+        for o in ops:
+            self.ops[o.name] = o
+            self._by_type_names[split_op_name(o.name)] = o
+        for o in ops:  # exact names take precedence over reordered ones
+            if not o.args_ordered:
+                base, type_names = split_op_name(o.name)
+                for reordered in permutations(type_names):
+                    self._by_type_names.setdefault((base, reordered), o)
+
+    def lookup(self, n: str, types: Tuple[Type, ...]) -> Optional[Op]:
+        k = (n, types)
+        op = self._by_types.get(k, _unresolved)
+        if op is _unresolved:
+            op = self._by_types[k] = self._by_type_names.get(
+                (n, tuple(t.type_name for t in types))
+            )
+        return op
+
@@ -0,0 +1,60 @@
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+
+try:
+    from . import optim
+except ImportError:  # extension not built, sched.list_schedule still works
+    optim = None
+from .proc_descr import MemLevel, Op, OpTable, ProcDescr
+
+
+class ProcModel:
+    def __init__(self, pd: ProcDescr):
+        self.pd: ProcDescr = pd
+        self.mem_levels: Tuple[MemLevel, ...] = tuple(MemLevel(*m) for m in pd.mem_levels)
+        self.op_table: OpTable = OpTable(pd.ops)
+        self.ops: Mapping[str, Op] = MappingProxyType(self.op_table.ops)
+
+        self.ports: Tuple[int, ...] = tuple(sorted(set(sum(
+            (o.ports for o in pd.ops),
+            tuple(m.port_n for m in self.mem_levels)
+        ))))
+        self.port2n: Mapping[int, int] = MappingProxyType({
+            port: n for n, port in enumerate(self.ports)
+        })
+
+        op_ids: Dict[str, int] = {}
+        if optim is None:
+            for o in pd.ops:
+                op_ids[o.name] = len(op_ids)
+            self.op_ids: Mapping[str, int] = MappingProxyType(op_ids)
+            self.proc = None
+            return
+
+        p = optim._proc(len(self.ports))
+        for m in self.mem_levels:
+            p.new_mem_level(
+                m.size, self.port2n[m.port_n], m.load_time
+            )
+        for o in pd.ops:
+            op_ids[o.name] = p.new_op(
+                o.exec_t,
+                [self.port2n[port] for port in o.ports]
+            )
+        self.op_ids: Mapping[str, int] = MappingProxyType(op_ids)
+        self.proc: optim._proc = p
+
+    @property
+    def name(self) -> str:
+        return self.pd.name
+
+
+_models: Dict[int, ProcModel] = {}
+
+
+def get_proc_model(pd: ProcDescr) -> ProcModel:
+    # ops are unhashable dataclasses, the model keeps pd alive so that its id stays valid
+    model = _models.get(id(pd))
+    if model is None:
+        model = _models[id(pd)] = ProcModel(pd)
+    return model
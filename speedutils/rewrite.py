@@ -0,0 +1,232 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, TYPE_CHECKING
+
+from .graphval import GraphVal, last_orig
+from .proc_ctx import graph_scope
+from .proc_descr import ProcDescr, split_op_name
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+Captures = Dict[str, GraphVal]
+
+
+class ConstMatch:
+    def __init__(self, name: str, attr: str, val):
+        self.name = name
+        self.attr = attr
+        self.val = val
+
+    def __repr__(self):
+        return self.name
+
+    def match(self, v: GraphVal) -> bool:
+        if getattr(v, self.attr):
+            return True
+        return v.const and not isinstance(v.val, (tuple, list, str)) and v.val == self.val
+
+
+ZERO = ConstMatch('ZERO', 'zero', 0)
+ONE = ConstMatch('ONE', 'one', 1)
+
+
+# pattern is a capture name, a ConstMatch or `(op, *arg_patterns)`,
+# where op is a base op name (`mul`) or a full typed one (`mulYfloatXfloat`)
+@dataclass
+class RewriteRule:
+    name: str
+    pattern: Any
+    build: Callable[[Captures, GraphVal], GraphVal]
+    cond: Optional[Callable[[Captures, GraphVal], bool]] = None
+
+
+@dataclass
+class RuleStats:
+    applied: int = 0
+    saved: float = 0.0
+
+
+def _op(n: str, *a: GraphVal) -> GraphVal:
+    return GraphVal.from_op(n, *a)
+
+
+def _same_type_cvt(caps: Captures, v: GraphVal) -> bool:
+    return type(caps['x']) is type(v)
+
+
+DEFAULT_RULES: Tuple[RewriteRule, ...] = (
+    RewriteRule('mul_one', ('mul', 'x', ONE), lambda c, v: c['x']),
+    RewriteRule('add_zero', ('add', 'x', ZERO), lambda c, v: c['x']),
+    RewriteRule('sub_zero', ('sub', 'x', ZERO), lambda c, v: c['x']),
+    RewriteRule('sub_self', ('sub', 'x', 'x'), lambda c, v: type(v).gen_zero()),
+    RewriteRule('div_one', ('div', 'x', ONE), lambda c, v: c['x']),
+    RewriteRule('neg_neg', ('neg', ('neg', 'x')), lambda c, v: c['x']),
+    RewriteRule('notbit_notbit', ('notbit', ('notbit', 'x')), lambda c, v: c['x']),
+)
+
+# opt-in rules, register them per target with register_rules
+# a -> b -> a conversions are exact only when b holds every value of a
+CVT_ROUNDTRIP = RewriteRule('cvt_roundtrip', ('cvt', ('cvt', 'x')), lambda c, v: c['x'], _same_type_cvt)
+# exact for integers, floating point products round differently
+FACTOR_MUL = RewriteRule(
+    'factor_mul', ('add', ('mul', 'a', 'b'), ('mul', 'a', 'c')),
+    lambda c, v: _op('mul', c['a'], _op('add', c['b'], c['c']))
+)
+
+_target_rules: Dict[str, List[RewriteRule]] = {}
+
+
+def register_rules(pd: ProcDescr, *rules: RewriteRule):
+    _target_rules.setdefault(pd.name, []).extend(rules)
+
+
+def rules_for(pd: ProcDescr) -> Tuple[RewriteRule, ...]:
+    return DEFAULT_RULES + tuple(_target_rules.get(pd.name, ()))
+
+
+class _Matcher:
+    def __init__(self, graph: 'FlowGraph'):
+        self._alias = graph.get_alias
+
+    def match(self, pattern, v: GraphVal, caps: Captures) -> Iterator[Captures]:
+        if isinstance(pattern, str):
+            bound = caps.get(pattern)
+            if bound is None:
+                yield {**caps, pattern: v}
+            elif bound.orig == v.orig:
+                yield caps
+            return
+        if isinstance(pattern, ConstMatch):
+            if pattern.match(v):
+                yield caps
+            return
+
+        op_pattern, *arg_patterns = pattern
+        op = v.op
+        if op is None or v.code is not None or len(v.a) != len(arg_patterns):
+            return
+        if op_pattern != op.name and op_pattern != split_op_name(op.name)[0]:
+            return
+
+        args = tuple(map(self._alias, v.a))
+        yield from self._match_args(arg_patterns, args, caps)
+        if not op.args_ordered and len(args) == 2 and args[0].orig != args[1].orig:
+            yield from self._match_args(arg_patterns, args[::-1], caps)
+
+    def _match_args(self, patterns, args: Tuple[GraphVal, ...], caps: Captures) -> Iterator[Captures]:
+        if not patterns:
+            yield caps
+            return
+        for head in self.match(patterns[0], args[0], caps):
+            yield from self._match_args(patterns[1:], args[1:], head)
+
+
+class _Rewriter:
+    def __init__(self, graph: 'FlowGraph', rules: Iterable[RewriteRule]):
+        self.graph = graph
+        self.rules = tuple(rules)
+        self.stats: Dict[str, RuleStats] = {r.name: RuleStats() for r in self.rules}
+        self._alias = graph.get_alias
+        self._matcher = _Matcher(graph)
+
+    def cost(self, v: GraphVal) -> float:
+        if v.op is None or not v.is_rendered:
+            return 0.0
+        return v.op.exec_t * self.graph.exp_use(v)
+
+    def _count_uses(self, nodes: Iterable[GraphVal]) -> Dict[int, int]:
+        uses: Dict[int, int] = {}
+        for v in nodes:
+            for a in v.a:
+                o = self._alias(a).orig
+                uses[o] = uses.get(o, 0) + 1
+        return uses
+
+    def _dead_cone(self, v: GraphVal, uses: Mapping[int, int]) -> Dict[int, GraphVal]:
+        # nodes used only through v, roots never die
+        dropped: Dict[int, int] = {}
+        dead = {v.orig: v}
+        stack = [v]
+        while stack:
+            nv = stack.pop()
+            for a in nv.a:
+                a = self._alias(a)
+                n = dropped[a.orig] = dropped.get(a.orig, 0) + 1
+                if n == uses.get(a.orig, -1) and a.has_output and a.p is self.graph:
+                    dead[a.orig] = a
+                    stack.append(a)
+        return dead
+
+    def _gain(self, v: GraphVal, r: GraphVal, uses: Mapping[int, int], mark: int) -> Tuple[float, Dict[int, GraphVal]]:
+        dead = self._dead_cone(v, uses)
+        used = self.graph.select_used()
+        added = 0.0
+        seen = set()
+        stack = [r]
+        while stack:
+            nv = self._alias(stack.pop())
+            if nv.orig in seen:
+                continue
+            seen.add(nv.orig)
+            if nv.orig in dead:
+                del dead[nv.orig]  # still needed by the replacement
+            elif nv.orig > mark or nv.orig not in used:
+                # unused nodes may be left over from a rejected build, they are not free
+                added += self.cost(nv)
+            else:
+                continue
+            stack.extend(nv.a)
+        return sum(map(self.cost, dead.values())) - added, dead
+
+    def _try(self, rule: RewriteRule, v: GraphVal, uses: Dict[int, int]) -> Optional[Dict[int, GraphVal]]:
+        for caps in self._matcher.match(rule.pattern, v, {}):
+            if rule.cond is not None and not rule.cond(caps, v):
+                continue
+            mark = last_orig()
+            try:
+                with self.graph.insert_at(v.scope_n):
+                    r = rule.build(caps, v).flush_attr()
+            except ValueError:  # no such op on this target
+                continue
+            r = self._alias(r)
+            if r.orig == v.orig or type(r) is not type(v):
+                continue
+            gain, dead = self._gain(v, r, uses, mark)
+            if gain <= 0:
+                continue
+            self.graph.replace(v, r)
+            uses[r.orig] = uses.get(r.orig, 0) + uses.get(v.orig, 0)
+            stats = self.stats[rule.name]
+            stats.applied += 1
+            stats.saved += gain
+            return dead
+        return None
+
+    def sweep(self) -> int:
+        nodes = self.graph.used_ordered()
+        uses = self._count_uses(nodes)
+        touched = set()
+        applied = 0
+        for v in nodes:
+            if v.orig in touched or not v.has_output:
+                continue
+            for rule in self.rules:
+                dead = self._try(rule, v, uses)
+                if dead is not None:
+                    touched.update(dead)
+                    applied += 1
+                    break
+        if applied:
+            self.graph.recompute_used()
+        return applied
+
+
+def rewrite_graph(graph: 'FlowGraph', rules: Iterable[RewriteRule] = None, max_passes=16) -> Dict[str, RuleStats]:
+    if rules is None:
+        rules = rules_for(graph.model.pd)
+    rewriter = _Rewriter(graph, rules)
+    with graph_scope(graph):
+        for _ in range(max_passes):
+            if not rewriter.sweep():
+                break
+    return rewriter.stats
@@ -0,0 +1,308 @@
+from heapq import heapify, heappop, heappush
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+from .graphval import GraphVal
+from .proc_descr import Op, split_op_name
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+# `ord` for FlowGraph.render_code, cycles are exp_use weighted estimates
+Schedule = NamedTuple('Schedule', (('ord', List[int]), ('cycles', float), ('source_cycles', float)))
+
+# ready nodes compared for a free port before the most critical one waits
+_PORT_LOOKAHEAD = 4
+# ready nodes compared for one whose users free names, none there gives up reordering the scope
+_PRESSURE_LOOKAHEAD = 64
+
+
+class _Ports:
+    # in-order issue, an op keeps the least busy of its ports for exec_t, like optim.h
+    __slots__ = ('free', 't')
+
+    def __init__(self):
+        self.free: Dict[int, float] = {}
+        self.t = 0.0
+
+    def start_time(self, op: Optional[Op], ready_t: float) -> float:
+        t = max(self.t, ready_t)
+        if op is None or not op.ports:
+            return t
+        free = self.free
+        return max(t, min(free.get(p, 0.0) for p in op.ports))
+
+    def issue(self, op: Optional[Op], ready_t: float) -> float:
+        # returns the time the result is ready
+        if op is None or not op.ports:
+            self.t = max(self.t, ready_t)
+            return self.t
+        free = self.free
+        port = min(op.ports, key=lambda p: free.get(p, 0.0))
+        self.t = max(self.t, ready_t, free.get(port, 0.0))
+        end = free[port] = self.t + op.exec_t
+        return end
+
+
+def _issued_op(v: GraphVal) -> Optional[Op]:
+    # vars and other unrendered nodes cost nothing
+    return v.op if v.is_rendered else None
+
+
+def _latency(v: GraphVal) -> float:
+    op = _issued_op(v)
+    return op.exec_t if op is not None else 0.0
+
+
+def _scope_deps(graph: 'FlowGraph', nodes: Sequence[GraphVal]) -> List[List[int]]:
+    get_alias = graph.get_alias
+    pos = {v.orig: n for n, v in enumerate(nodes)}
+    deps = []
+    last_effect = None
+    loads: List[int] = []
+    for n, v in enumerate(nodes):
+        d = {pos[a.orig] for a in map(get_alias, v.a) if a.orig in pos}
+        # memory and side effects keep their order, loads may pass each other
+        if v.is_rendered and not v.has_output:
+            if last_effect is not None:
+                d.add(last_effect)
+            d.update(loads)
+            last_effect = n
+            loads = []
+        elif v.var_name is None and v.op is not None and split_op_name(v.op.name)[0] == 'load':
+            if last_effect is not None:
+                d.add(last_effect)
+            loads.append(n)
+        deps.append(sorted(d))
+    return deps
+
+
+def _simulate(nodes: Sequence[GraphVal], deps: List[List[int]], order: Sequence[int]) -> float:
+    ports = _Ports()
+    end = [0.0] * len(nodes)
+    finish = 0.0
+    for n in order:
+        ready_t = max((end[d] for d in deps[n]), default=0.0)
+        end[n] = ports.issue(_issued_op(nodes[n]), ready_t)
+        finish = max(finish, end[n])
+    return finish
+
+
+def _schedule_scope(nodes: Sequence[GraphVal], deps: List[List[int]]) -> Tuple[List[int], float]:
+    n_nodes = len(nodes)
+    users: List[List[int]] = [[] for _ in range(n_nodes)]
+    left = [len(d) for d in deps]
+    for n, d in enumerate(deps):
+        for p in d:
+            users[p].append(n)
+
+    # longest latency path to the end of the scope
+    crit = [0.0] * n_nodes
+    for n in range(n_nodes - 1, -1, -1):
+        crit[n] = _latency(nodes[n]) + max((crit[u] for u in users[n]), default=0.0)
+
+    data_t = [0.0] * n_nodes
+    end = [0.0] * n_nodes
+    waiting = [(0.0, -crit[n], n) for n in range(n_nodes) if not left[n]]
+    ready: List[Tuple[float, int]] = []
+    ports = _Ports()
+    order = []
+    finish = 0.0
+    while waiting or ready:
+        while waiting and waiting[0][0] <= ports.t:
+            _, c, n = heappop(waiting)
+            heappush(ready, (c, n))
+        if not ready:
+            ports.t = waiting[0][0]
+            continue
+
+        # the most critical node that does not wait for a port
+        cands = [heappop(ready) for _ in range(min(_PORT_LOOKAHEAD, len(ready)))]
+        best = min(
+            range(len(cands)),
+            key=lambda i: (ports.start_time(_issued_op(nodes[cands[i][1]]), data_t[cands[i][1]]), i)
+        )
+        for i, c in enumerate(cands):
+            if i != best:
+                heappush(ready, c)
+        n = cands[best][1]
+
+        order.append(n)
+        end[n] = ports.issue(_issued_op(nodes[n]), data_t[n])
+        finish = max(finish, end[n])
+        for u in users[n]:
+            data_t[u] = max(data_t[u], end[n])
+            left[u] -= 1
+            if not left[u]:
+                heappush(waiting, (data_t[u], -crit[u], u))
+    return order, finish
+
+
+def _scope_runs(nodes: Sequence[GraphVal]):
+    start = 0
+    for n in range(1, len(nodes) + 1):
+        if n == len(nodes) or nodes[n].scope_n != nodes[start].scope_n:
+            yield start, n
+            start = n
+
+
+def _allocated(v: GraphVal) -> bool:
+    # values that get a name of RegNodeMapper
+    return v.is_rendered and v.has_output and v.var_name is None
+
+
+def _pressure_scope(
+        nodes: Sequence[GraphVal], deps: List[List[int]], args: List[Set[int]],
+        order: Sequence[int], escaping: Set[int], max_live: int
+) -> List[int]:
+    n_nodes = len(nodes)
+    rank = [0] * n_nodes
+    for r, n in enumerate(order):
+        rank[n] = r
+    users: List[List[int]] = [[] for _ in range(n_nodes)]
+    left = [len(d) for d in deps]
+    for n, d in enumerate(deps):
+        for p in d:
+            users[p].append(n)
+    # readers not yet ordered, values read outside the scope never die in it
+    readers: List[Set[int]] = [set() for _ in range(n_nodes)]
+    for n, a in enumerate(args):
+        for p in a:
+            readers[p].add(n)
+    defines = [
+        int(_allocated(v) and (bool(readers[n]) or v.orig in escaping))
+        for n, v in enumerate(nodes)
+    ]
+
+    def freed(n, after=-1):
+        # names whose last reader is n, once `after` is ordered too
+        return sum(
+            1 for p in args[n]
+            if defines[p] and len(readers[p]) - (after in readers[p]) == 1 and nodes[p].orig not in escaping
+        )
+
+    def grows_next(n):
+        # with the best of the users it makes ready
+        return defines[n] - freed(n) + min(
+            (defines[u] - freed(u, n) for u in users[n] if left[u] == 1), default=0
+        )
+
+    def push_freeing(n):
+        # ready nodes that free at least as many names as they take, most freeing first
+        grows = defines[n] - freed(n)
+        if grows <= 0:
+            heappush(freeing, (grows, rank[n], n))
+
+    ready = [(rank[n], n) for n in range(n_nodes) if not left[n]]
+    heapify(ready)
+    freeing: List[Tuple[int, int, int]] = []
+    for _, n in ready:
+        push_freeing(n)
+    done = [False] * n_nodes
+    live = 0
+    result = []
+    while len(result) < n_nodes:
+        while freeing and done[freeing[0][-1]]:
+            heappop(freeing)
+        while done[ready[0][-1]]:
+            heappop(ready)
+        # one name is kept for a node that only makes freeing ones ready
+        if live + 1 < max_live:
+            n = heappop(ready)[-1]
+        elif freeing:
+            n = heappop(freeing)[-1]
+        else:
+            cands = []
+            while ready and len(cands) < _PRESSURE_LOOKAHEAD:
+                c = heappop(ready)
+                if not done[c[-1]]:
+                    cands.append(c)
+            grows, best = min((grows_next(c[-1]), i) for i, c in enumerate(cands))
+            if grows > 0:
+                # source order is still valid for the rest
+                result.extend(n for n in order if not done[n])
+                break
+            for i, c in enumerate(cands):
+                if i != best:
+                    heappush(ready, c)
+            n = cands[best][-1]
+        done[n] = True
+        result.append(n)
+        live += defines[n] - freed(n)
+        for p in args[n]:
+            readers[p].discard(n)
+            if len(readers[p]) == 1:
+                # the last reader may free its arg now
+                r = next(iter(readers[p]))
+                if not left[r] and not done[r]:
+                    push_freeing(r)
+        for u in users[n]:
+            left[u] -= 1
+            if not left[u]:
+                heappush(ready, (rank[u], u))
+                push_freeing(u)
+    return result
+
+
+def pressure_order(graph: 'FlowGraph', ord: Sequence[int], max_live: int) -> List[int]:
+    # reorders `ord` inside each scope so that at most `max_live` values of the scope are live
+    # where deps allow, values live across scopes are not counted
+    nodes = graph.used_ordered()
+    get_alias = graph.get_alias
+    pos = {n: i for i, n in enumerate(ord)}
+    runs = list(_scope_runs(nodes))
+    run_of = {}
+    for r, (start, end) in enumerate(runs):
+        for v in nodes[start:end]:
+            run_of[v.orig] = r
+    escaping = set()
+    for r, (start, end) in enumerate(runs):
+        for v in nodes[start:end]:
+            for a in map(get_alias, v.a):
+                if run_of.get(a.orig, r) != r:
+                    escaping.add(a.orig)
+
+    result = []
+    for start, end in runs:
+        scope_nodes = nodes[start:end]
+        local = {v.orig: n for n, v in enumerate(scope_nodes)}
+        args = [
+            {local[a.orig] for a in map(get_alias, v.a) if a.orig in local}
+            for v in scope_nodes
+        ]
+        order = sorted(range(end - start), key=lambda n: pos[start + n])
+        deps = _scope_deps(graph, scope_nodes)
+        result.extend(start + n for n in _pressure_scope(scope_nodes, deps, args, order, escaping, max_live))
+    return result
+
+
+def list_schedule(graph: 'FlowGraph') -> Schedule:
+    # orders nodes inside each scope to hide latencies and spread port use
+    nodes = graph.used_ordered()
+    scopes = graph.scopes
+    ord = []
+    cycles = source_cycles = 0.0
+    for start, end in _scope_runs(nodes):
+        scope_nodes = nodes[start:end]
+        deps = _scope_deps(graph, scope_nodes)
+        exp_use = scopes[scope_nodes[0].scope_n].exp_use
+        order, finish = _schedule_scope(scope_nodes, deps)
+        ord.extend(start + n for n in order)
+        cycles += finish * exp_use
+        source_cycles += _simulate(scope_nodes, deps, range(len(scope_nodes))) * exp_use
+    return Schedule(ord, cycles, source_cycles)
+
+
+def estimate_cycles(graph: 'FlowGraph', ord: Optional[Sequence[int]] = None) -> float:
+    # same model as list_schedule, `ord` must keep nodes inside their scopes
+    nodes = graph.used_ordered()
+    scopes = graph.scopes
+    if ord is None:
+        ord = range(len(nodes))
+    pos = {n: i for i, n in enumerate(ord)}
+    cycles = 0.0
+    for start, end in _scope_runs(nodes):
+        scope_nodes = nodes[start:end]
+        order = sorted(range(end - start), key=lambda n: pos[start + n])
+        finish = _simulate(scope_nodes, _scope_deps(graph, scope_nodes), order)
+        cycles += finish * scopes[scope_nodes[0].scope_n].exp_use
+    return cycles
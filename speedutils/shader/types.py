@@ -1,5 +1,6 @@
 from typing import Iterable, Tuple
 
+from speedutils import fold
 from speedutils.graphval import GraphVal, VType
 from speedutils.proc_ctx import graph_ctx
 from speedutils.proc_descr import Op
@@ -7,11 +8,12 @@ from speedutils.vtypes import float_
 
 
 class ConcatOp(Op):
-    def __init__(self, ret_t: VType, **kwargs):
+    def __init__(self, ret_t: VType, py_eval=fold.concat, **kwargs):
         super().__init__(
             name=f'concatY{ret_t.type_name}',
             ret_t=ret_t,
             expr='({})',
+            py_eval=py_eval,
             **kwargs
         )
 
@@ -21,6 +23,8 @@ class ConcatOp(Op):
 
 
 class Float(float_):
+    __slots__ = ()
+
     def inv(self):
         return self.gen_one() / self
 
@@ -42,7 +46,10 @@ class Float(float_):
 
 
 class Half(Float):
+    __slots__ = ()
+
     typename = 'half'
+    fold_val = staticmethod(fold.float16)
 
 
 def slice2range(s: slice, array_len) -> range:
@@ -60,7 +67,10 @@ def slice2range(s: slice, array_len) -> range:
 
 
 class Vec(GraphVal):
+    __slots__ = ()
+
     type_name = 'vec'
+    fold_val = staticmethod(fold.float32)
     ELEM_NAMES = 'xyzw'
 
     @classmethod
@@ -190,22 +200,31 @@ class Vec(GraphVal):
 
 
 class Vec2(Vec):
+    __slots__ = ()
+
     type_name = 'vec2'
     dims = (2,)
 
 
 class Vec3(Vec):
+    __slots__ = ()
+
     type_name = 'vec3'
     dims = (3,)
 
 
 class Vec4(Vec):
+    __slots__ = ()
+
     type_name = 'vec4'
     dims = (4,)
 
 
 class Mat(GraphVal):
+    __slots__ = ()
+
     type_name = 'mat'
+    fold_val = staticmethod(fold.float32)
 
     # @classmethod
     # def from_(cls, *a):
@@ -240,16 +259,22 @@ class Mat(GraphVal):
 
 
 class Mat2(Mat):
+    __slots__ = ()
+
     type_name = 'mat2'
     dims = (2,) * 2
 
 
 class Mat3(Mat):
+    __slots__ = ()
+
     type_name = 'mat3'
     dims = (3,) * 2
 
 
 class Mat4(Mat):
+    __slots__ = ()
+
     type_name = 'mat4'
     dims = (4,) * 2
 
@@ -282,6 +307,8 @@ def convert_args(arg_list: Iterable) -> Tuple[GraphVal, ...]:
 
 
 class Sampler2D(GraphVal):
+    __slots__ = ()
+
     typename = 'sampler2D'
     components = 3
 
@@ -1,10 +1,16 @@
+import json
 from _contextvars import ContextVar
 from inspect import getfullargspec
 from typing import Iterable, List, Optional, Tuple
 
 from speedutils.graphval import GraphVal, VType
 from .types import Float, convert_arg
-from ..proc_ctx import graph_ctx, new_graph
+from ..cache import KernelCache, cache_key, fingerprint, get_default_cache, pd_fingerprint, source_fingerprint
+from ..graphio import resolve_type, type_ref
+from ..instrument import instrumented
+from ..proc_ctx import graph_ctx, new_graph, proc_ctx
+from ..sched import list_schedule
+from ..sink import CodeSink
 
 
 class ShaderInputProperty:
@@ -110,6 +116,10 @@ def get_context_shader() -> 'Shader':
 
 
 class Shader:
+    # see Func.reuse_names and Func.schedule
+    reuse_names = False
+    schedule = False
+
     def __init__(self, inputs: Iterable[GraphVal] = (), uniform_inputs: Iterable[GraphVal] = (), version=330):
         self._version = version
         self._input: List[GraphVal] = list(inputs)
@@ -185,8 +195,9 @@ class Shader:
     def _render_content(self):
         with new_graph() as g:
             self._gen_code()
+            ord = list_schedule(g).ord if self.schedule else None
             code_lines = tuple(
-                g.render_code()
+                g.render_code(ord, reuse_names=self.reuse_names)
             )
         yield f'#version {self._version}'
         yield from self._render_definitions()
@@ -194,9 +205,67 @@ class Shader:
         yield from code_lines
         yield '}'
 
-    def render(self):
+    def _params(self):
+        return self._input, self._uniform_input, self._output
+
+    def _cache_key(self) -> str:
+        user_classes = tuple(
+            t for t in type(self).__mro__
+            if t is not object and not t.__module__.startswith('speedutils.')
+        )
+        return cache_key(
+            'shader',
+            fingerprint(type(self)),
+            source_fingerprint(*user_classes),
+            fingerprint(self._version),
+            fingerprint((self.reuse_names, self.schedule)),
+            fingerprint(tuple(
+                tuple((v.var_name, type(v)) for v in params)
+                for params in self._params()
+            )),
+            pd_fingerprint(proc_ctx.model.pd),
+        )
+
+    def _restore_params(self, saved):
+        # params of a cached shader are detached vars, enough to link the next stage
+        with new_graph():
+            for params, saved_params in zip(self._params(), saved):
+                params[:] = [
+                    resolve_type(t).var(n, start_scope=True)
+                    for n, t in saved_params
+                ]
+
+    @instrumented('shader_render', per_func=True)
+    def render(self, cache: Optional[KernelCache] = None, sink: Optional[CodeSink] = None):
+        text = self._render_cached(cache)
+        if sink is not None:
+            with sink.section(type(self).__name__):
+                sink.write(text)
+        return text
+
+    def _render_cached(self, cache: Optional[KernelCache]):
+        if cache is None:
+            cache = get_default_cache()
+        if cache is not None:
+            key = self._cache_key()
+            entry = cache.get(key)
+            if entry is not None:
+                entry = json.loads(entry)
+                self._restore_params(entry['params'])
+                return entry['text']
+
         old_val = _shader_context.set(self)
         try:
-            return '\n'.join(self._render_content())
+            text = '\n'.join(self._render_content())
         finally:
             _shader_context.reset(old_val)
+
+        if cache is not None:
+            cache.put(key, json.dumps({
+                'text': text,
+                'params': [
+                    [(v.var_name, type_ref(type(v))) for v in params]
+                    for params in self._params()
+                ],
+            }))
+        return text
@@ -0,0 +1,103 @@
+import os
+import sys
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, Iterable, List, NamedTuple, Optional, Union
+
+SinkStats = NamedTuple('SinkStats', (('name', str), ('bytes', int), ('lines', int)))
+
+
+class CodeSink:
+    # lines are joined into chunks of this size before they are written
+    chunk_lines = 4096
+
+    def __init__(self):
+        self.stats: List[SinkStats] = []
+        self.bytes = 0
+        self.lines = 0
+        self._section: Optional[str] = None
+        self._section_start = (0, 0)
+
+    def _write(self, chunk: str):
+        raise NotImplementedError(f'Writing unimplemented for sink {type(self).__name__}')
+
+    def write(self, text: str):
+        if not text.endswith('\n'):
+            text += '\n'
+        self._write(text)
+        self.bytes += len(text.encode())
+        self.lines += text.count('\n')
+
+    def write_lines(self, lines: Iterable[str]):
+        lines = iter(lines)
+        while True:
+            chunk = tuple(islice(lines, self.chunk_lines))
+            if not chunk:
+                break
+            self.write('\n'.join(chunk))
+
+    @contextmanager
+    def section(self, name: str):
+        # counts what is written for one function, nested sections belong to the outer one
+        if self._section is not None:
+            yield self
+            return
+        self._section = name
+        self._section_start = (self.bytes, self.lines)
+        try:
+            yield self
+        finally:
+            start_bytes, start_lines = self._section_start
+            self.stats.append(SinkStats(name, self.bytes - start_bytes, self.lines - start_lines))
+            self._section = None
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BufferSink(CodeSink):
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[str] = []
+
+    def _write(self, chunk: str):
+        self._chunks.append(chunk)
+
+    def getvalue(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+
+class StreamSink(CodeSink):
+    # e.g. stdout or the stdin pipe of a compiler process
+    def __init__(self, stream: IO[str]):
+        super().__init__()
+        self._stream = stream
+
+    def _write(self, chunk: str):
+        self._stream.write(chunk)
+
+    def flush(self):
+        self._stream.flush()
+
+
+class FileSink(StreamSink):
+    def __init__(self, path: Union[str, os.PathLike], buffering: int = 1 << 20):
+        super().__init__(open(path, 'w', buffering=buffering))
+
+    def close(self):
+        self._stream.close()
+
+
+def stdout_sink() -> StreamSink:
+    return StreamSink(sys.stdout)
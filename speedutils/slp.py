@@ -0,0 +1,321 @@
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+from .graphval import GraphVal, VType
+from .memflow import Index, _MemState, _op_base
+from .proc_ctx import graph_scope
+from .sched import _scope_runs
+from .vtypes import float_, v4f
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+# saved is the exec_t sum of removed minus added ops, weighted by exp_use
+SLPStats = NamedTuple('SLPStats', (('packs', int), ('saved', float)))
+
+# vector types by the type of their lanes, lanes go along the first dimension
+_vector_types: Dict[VType, List[VType]] = defaultdict(list)
+
+
+def register_vector_type(vec_t: VType, scalar_t: VType):
+    _vector_types[scalar_t].append(vec_t)
+
+
+def vector_types(scalar_t: VType) -> Tuple[VType, ...]:
+    # widest first
+    return tuple(sorted(_vector_types.get(scalar_t, ()), key=lambda t: -t.shape[0]))
+
+
+register_vector_type(v4f, float_)
+
+_OP = 0
+_LOAD = 1
+_CONST = 2
+_GATHER = 3
+
+
+class _Pack:
+    __slots__ = ('lanes', 'kind', 'args', 'op')
+
+    def __init__(self, lanes: Tuple[GraphVal, ...]):
+        self.lanes = lanes
+        self.kind = _GATHER
+        self.args: Tuple['_Pack', ...] = ()
+        self.op = None
+
+
+class _Scope:
+    # memory accesses of one scope, vector loads and stores move to its end or before their users
+    def __init__(self, packer: '_Packer', scope_n: int, nodes: Sequence[GraphVal]):
+        self.n = scope_n
+        self.pos = {v.orig: n for n, v in enumerate(nodes)}
+        self.loads: Dict[int, Dict[int, Index]] = defaultdict(dict)
+        self.stores: Dict[int, List[Tuple[Index, GraphVal]]] = defaultdict(list)
+        self.stationary = False
+        alias = packer.alias
+        for v in nodes:
+            base = _op_base(v)
+            if v.op is None or v.key == v.orig:
+                self.stationary = True
+            elif base == 'stor':
+                _, arr, idx = map(alias, v.a)
+                self.stores[arr.orig].append((packer.index(idx), v))
+            elif base == 'load' and v.var_name is None:
+                arr, idx = map(alias, v.a)
+                self.loads[arr.orig][v.orig] = packer.index(idx)
+        self._restrict = packer.restrict
+
+    def can_load(self, arr: int) -> bool:
+        return arr not in self.stores if self._restrict else not self.stores
+
+    def can_store(self, arr: int) -> bool:
+        if arr in self.loads if self._restrict else self.loads:
+            return False
+        idxs = [i for i, _ in self.stores.get(arr, ())]
+        return len(set(idxs)) == len(idxs) and len({b for b, _ in idxs}) == 1
+
+
+class _Packer:
+    def __init__(self, graph: 'FlowGraph', restrict: bool):
+        self.graph = graph
+        self.alias = graph.get_alias
+        self.index = _MemState(graph, restrict).index
+        self.restrict = restrict
+        self._lookup = graph.model.op_table.lookup
+        self.users: Dict[int, Set[int]] = defaultdict(set)
+        # interior nodes of emitted packs and lanes they gathered, neither is packed again
+        self.packed: Set[int] = set()
+        self.gathered: Set[int] = set()
+        self.packs = 0
+        self.saved = 0.0
+
+    def _exec_t(self, n: str, types: Tuple[VType, ...]) -> Optional[float]:
+        op = self._lookup(n, types)
+        return None if op is None else op.exec_t
+
+    def _independent(self, scope: _Scope, lanes: Sequence[GraphVal]) -> bool:
+        # no lane reaches another through nodes of the scope
+        pos = scope.pos
+        lo = min(pos[v.orig] for v in lanes)
+        others = {v.orig for v in lanes}
+        seen = set()
+        for v in lanes:
+            stack = [self.alias(a) for a in v.a]
+            while stack:
+                a = stack.pop()
+                if a.orig in seen or pos.get(a.orig, -1) < lo:
+                    continue
+                if a.orig in others:
+                    return False
+                seen.add(a.orig)
+                stack.extend(map(self.alias, a.a))
+        return True
+
+    def _is_load_pack(self, scope: _Scope, lanes: Sequence[GraphVal], vec_t: VType) -> bool:
+        if any(_op_base(v) != 'load' or v.var_name is not None for v in lanes):
+            return False
+        arr = self.alias(lanes[0].a[0]).orig
+        if any(self.alias(v.a[0]).orig != arr for v in lanes) or not scope.can_load(arr):
+            return False
+        loads = scope.loads.get(arr, {})
+        idxs = [loads.get(v.orig) for v in lanes]
+        if None in idxs or len({b for b, _ in idxs}) != 1:
+            return False
+        first = idxs[0][1]
+        return all(off == first + n for n, (_, off) in enumerate(idxs)) and \
+            self._exec_t('load', (vec_t,)) is not None
+
+    def _op_lanes(self, scope: _Scope, lanes: Sequence[GraphVal], scalar_t: VType) -> bool:
+        op = lanes[0].op
+        for v in lanes:
+            if (
+                    v.op is not op or v.code is not None or v.var_name is not None or v.const
+                    or v.scope_n != scope.n or v.key == v.orig or type(v) is not scalar_t
+                    or v.orig in self.packed or v.orig in self.gathered
+                    or any(type(a) is not scalar_t for a in v.a)
+            ):
+                return False
+        return op.ret_t is scalar_t and len({v.orig for v in lanes}) == len(lanes)
+
+    def _lane_args(self, op, lanes: Sequence[GraphVal]) -> List[Tuple[GraphVal, ...]]:
+        args = [tuple(map(self.alias, v.a)) for v in lanes]
+        if not op.args_ordered and len(args[0]) == 2:
+            # commutative args are swapped to match the first lane
+            want = tuple(map(_shape, args[0]))
+            for n, a in enumerate(args):
+                if tuple(map(_shape, a)) != want and tuple(map(_shape, a[::-1])) == want:
+                    args[n] = a[::-1]
+        return list(zip(*args))
+
+    def plan(self, scope: _Scope, lanes: Tuple[GraphVal, ...], vec_t: VType) -> Tuple[_Pack, Set[int]]:
+        scalar_t = type(lanes[0])
+        root = _Pack(lanes)
+        # the same lanes used twice share their pack
+        planned = {tuple(v.orig for v in lanes): root}
+        interior: Set[int] = set()
+        stack = [root]
+        while stack:
+            p = stack.pop()
+            lanes = p.lanes
+            if all(v.const and not isinstance(v.val, (tuple, list)) for v in lanes):
+                if self._exec_t('const', (vec_t,)) is not None:
+                    p.kind = _CONST
+            elif self._is_load_pack(scope, lanes, vec_t):
+                p.kind = _LOAD
+            elif self._op_lanes(scope, lanes, scalar_t) and not interior.intersection(v.orig for v in lanes):
+                base = _op_base(lanes[0])
+                arg_types = (vec_t,) * len(lanes[0].a)
+                if self._lookup(base, arg_types) is not None and self._independent(scope, lanes):
+                    p.kind = _OP
+                    p.op = base
+                    interior.update(v.orig for v in lanes)
+                    args = []
+                    for arg_lanes in self._lane_args(lanes[0].op, lanes):
+                        k = tuple(v.orig for v in arg_lanes)
+                        arg = planned.get(k)
+                        if arg is None:
+                            arg = planned[k] = _Pack(arg_lanes)
+                            stack.append(arg)
+                        args.append(arg)
+                    p.args = tuple(args)
+        return root, interior
+
+    def _gain(self, root: _Pack, inside: Set[int], stores: Sequence[GraphVal], vec_t: VType) -> Optional[float]:
+        # exec_t removed minus added, None when the target misses an op
+        removed = sum(v.op.exec_t for v in stores)
+        added = self._exec_t('stor', (vec_t,))
+        extract_t = self._exec_t('get_elem', (vec_t,))
+        seen = set()
+        stack = [root]
+        while stack:
+            p = stack.pop()
+            if id(p) in seen:
+                continue
+            seen.add(id(p))
+            if p.kind == _OP:
+                added += self._exec_t(p.op, (vec_t,) * len(p.args))
+                for v in p.lanes:
+                    removed += v.op.exec_t
+                    if not self.users[v.orig] <= inside:
+                        if extract_t is None:
+                            return None
+                        added += extract_t
+                stack.extend(p.args)
+            elif p.kind == _LOAD:
+                added += self._exec_t('load', (vec_t,))
+                removed += sum(v.op.exec_t for v in p.lanes if self.users[v.orig] <= inside)
+            elif p.kind == _CONST:
+                added += self._exec_t('const', (vec_t,))
+            else:
+                if any(v.orig in inside for v in p.lanes):
+                    return None  # would use its own extract
+                concat_t = self._exec_t('concat', (vec_t,))
+                if concat_t is None:
+                    return None
+                added += concat_t
+        return removed - added
+
+    def _add(self, vec_t: VType, op, args: Tuple[GraphVal, ...], scope_n: int) -> GraphVal:
+        v = vec_t(a=args, op=op)
+        v.scope_n = scope_n
+        return self.graph.add_node(v)
+
+    def _emit(self, root: _Pack, inside: Set[int], vec_t: VType, scope_n: int) -> GraphVal:
+        # lanes used outside of the pack are replaced by extracts
+        graph = self.graph
+        vecs: Dict[int, GraphVal] = {}
+        stack = [(root, False)]
+        while stack:
+            p, ready = stack.pop()
+            if id(p) in vecs:
+                continue
+            if p.kind == _OP and not ready:
+                stack.append((p, True))
+                stack.extend((a, False) for a in p.args)
+                continue
+            lanes = p.lanes
+            if p.kind == _OP:
+                args = tuple(vecs[id(a)] for a in p.args)
+                v = self._add(vec_t, graph.find_op(p.op, args), args, scope_n)
+                for n, lane in enumerate(lanes):
+                    if not self.users[lane.orig] <= inside:
+                        extract = graph.find_spec_op('get_elem', vec_t)
+                        graph.replace(lane, type(lane).from_expr(f'{{}}[{n}]', v, op=extract))
+            elif p.kind == _LOAD:
+                arr, idx = map(self.alias, lanes[0].a)
+                v = self._add(vec_t, graph.find_load_op(vec_t), (arr, idx), scope_n)
+            elif p.kind == _CONST:
+                with graph.insert_at(scope_n):
+                    v = vec_t.from_const(tuple(l.val for l in lanes))
+            else:
+                v = self._add(vec_t, graph.find_spec_op('concat', vec_t), lanes, scope_n)
+                self.gathered.update(l.orig for l in lanes)
+            vecs[id(p)] = v
+        return vecs[id(root)]
+
+    def _seeds(self, scope: _Scope):
+        # runs of stores to adjacent indexes of one array
+        for arr, stores in scope.stores.items():
+            if len(stores) < 2 or not scope.can_store(arr):
+                continue
+            by_type: Dict[VType, Dict[int, GraphVal]] = defaultdict(dict)
+            for (_, off), v in stores:
+                by_type[type(self.alias(v.a[0]))][off] = v
+            for scalar_t, by_off in by_type.items():
+                for vec_t in vector_types(scalar_t):
+                    if self._exec_t('stor', (vec_t,)) is None:
+                        continue
+                    width = vec_t.shape[0]
+                    for off in sorted(by_off):
+                        run = [by_off.get(off + n) for n in range(width)]
+                        if None not in run:
+                            for n in range(width):
+                                del by_off[off + n]
+                            yield vec_t, run
+
+    def pack_scope(self, scope: _Scope):
+        graph = self.graph
+        exp_use = graph.scopes[scope.n].exp_use
+        for vec_t, stores in self._seeds(scope):
+            lanes = tuple(self.alias(v.a[0]) for v in stores)
+            root, interior = self.plan(scope, lanes, vec_t)
+            inside = interior | {v.orig for v in stores}
+            gain = self._gain(root, inside, stores, vec_t)
+            if gain is None or gain <= 0:
+                continue
+            self.packed.update(interior)
+            vec = self._emit(root, inside, vec_t, scope.n)
+            arr, idx = map(self.alias, stores[0].a[1:])
+            self._add(vec_t, graph.find_store_op(vec_t), (vec, arr, idx), scope.n)
+            for v in stores:
+                graph.remove_root(v)
+            self.packs += 1
+            self.saved += gain * exp_use
+
+
+def _shape(v: GraphVal):
+    # what lanes must agree on to be packed together
+    if v.const:
+        return 'const'
+    return v.op.name if v.op is not None else v.orig
+
+
+def slp_vectorize(graph: 'FlowGraph', restrict=False) -> SLPStats:
+    # packs isomorphic scalar ops feeding stores to adjacent indexes into vector ops,
+    # `restrict` as for memflow.forward_stores
+    nodes = graph.used_ordered()
+    packer = _Packer(graph, restrict)
+    get_alias = graph.get_alias
+    for v in nodes:
+        for a in v.a:
+            packer.users[get_alias(a).orig].add(v.orig)
+
+    with graph_scope(graph):
+        for start, end in _scope_runs(nodes):
+            scope = _Scope(packer, nodes[start].scope_n, nodes[start:end])
+            if not scope.stationary and scope.stores:
+                packer.pack_scope(scope)
+
+    if packer.packs:
+        graph.recompute_used()
+    return SLPStats(packer.packs, packer.saved)
@@ -0,0 +1,93 @@
+from typing import Any, Dict, Mapping, NamedTuple, Tuple, TYPE_CHECKING
+
+from .graphio import KIND_CONST, KIND_OP, KIND_VAR, _node_kind
+from .graphval import GraphVal, VType, _next_orig
+from .proc_ctx import graph_scope, proc_ctx
+from .rewrite import DEFAULT_RULES, _Matcher
+
+if TYPE_CHECKING:
+    from .flow import FlowGraph
+
+# a trace with placeholders for the consts read as graph values,
+# `shaping` are the consts read as python values, the trace holds only for these
+SymbolicTrace = NamedTuple('SymbolicTrace', (
+    ('graph', 'FlowGraph'), ('placeholders', Dict[int, str]), ('shaping', Tuple[Tuple[str, Any], ...])
+))
+
+# simplifications a substituted zero or one enables
+CONST_RULES = tuple(r for r in DEFAULT_RULES if r.name in ('mul_one', 'add_zero', 'sub_zero', 'div_one'))
+
+
+def placeholder(t: VType, name: str) -> GraphVal:
+    # in the scope a const would get, never folded
+    return t.var(name, start_scope=False)
+
+
+def _rebuilt(v: GraphVal, args: Tuple[GraphVal, ...], graph: 'FlowGraph') -> GraphVal:
+    nv = object.__new__(type(v))
+    nv.p = graph
+    nv.scope_n = v.scope_n
+    nv.a = args
+    nv.attr_stack = ()
+    nv.num_attrs = v.num_attrs
+    nv.orig = _next_orig()
+    nv.op = v.op
+    nv.code = v.code
+    nv.op_name = v.op_name
+    nv.val_args = v.val_args
+    nv.var_name = v.var_name
+    nv.val = v.val
+    nv.const = v.const
+    nv.comment = v.comment
+    nv.name_prefix = v.name_prefix
+    nv.is_rendered = v.is_rendered
+    nv.col_n = -1
+    kind = _node_kind(v)
+    if kind == KIND_OP:
+        nv.key = nv._gen_key()
+    elif kind == KIND_VAR:
+        nv.key = nv._var_key()
+    elif kind == KIND_CONST:
+        nv.key = nv._const_key()
+    else:
+        nv.key = nv.orig
+    return graph.add_node(nv)
+
+
+def _simplified(matcher: _Matcher, v: GraphVal) -> GraphVal:
+    for rule in CONST_RULES:
+        for caps in matcher.match(rule.pattern, v, {}):
+            r = rule.build(caps, v)
+            if type(r) is type(v):
+                return r
+    return v
+
+
+def specialize(sym: SymbolicTrace, values: Mapping[str, Any], simplify=True) -> 'FlowGraph':
+    # replays the used nodes with consts substituted, add_node folds and dedups them again,
+    # only nodes with a const arg are simplified, the rest was as simple in the trace
+    src = sym.graph
+    get_alias = src.get_alias
+    placeholders = sym.placeholders
+    graph = proc_ctx.new_graph(fold_consts=True)
+    graph.load_scopes(((s.exp_use, s.block) for s in src.scopes), src.block_parents, src.skippable_blocks)
+    matcher = _Matcher(graph)
+
+    new: Dict[int, GraphVal] = {}
+    with graph_scope(graph):
+        for v in src.used_ordered():
+            name = placeholders.get(v.orig)
+            if name is not None:
+                with graph.insert_at(v.scope_n):
+                    nv = type(v).from_const(values[name])
+            else:
+                args = tuple(new.get(a.orig, a) for a in map(get_alias, v.a))
+                if any(a.const for a in args):
+                    with graph.insert_at(v.scope_n):
+                        nv = _rebuilt(v, args, graph)
+                        if simplify and nv.has_output and not nv.const:
+                            nv = _simplified(matcher, nv)
+                else:
+                    nv = _rebuilt(v, args, graph)
+            new[v.orig] = nv
+    return graph
@@ -1,5 +1,6 @@
 from speedutils.shader.base import SimpleFragmentShader, SimpleVertexShader
 
+from . import fold
 from .proc_ctx import new_graph, proc
 from .proc_descr import CvtOp, FuncOp, Op, ProcDescr, SignOp, SimpleLoadOp, SimpleStoreOp, TypedNoargOp
 from .shader.types import ConcatOp, Mat3, Mat4, Vec2, Vec3, Vec4
@@ -66,7 +67,7 @@ pd = ProcDescr(
         SignOp('mul', '*', (Mat3, Vec3), ret_t=Vec3, exec_t=3.0, ports=(4,)),
         SignOp('mul', '*', (Vec3, float_), ret_t=Vec3, exec_t=4.0, ports=(4,), args_ordered=False),
         SignOp('div', '/', (Vec2, float_), ret_t=Vec2, exec_t=4.0, ports=(4,)),
-        FuncOp('normalize', args_t=(Vec3,), ret_t=Vec3, exec_t=3.0, ports=(4,)),
+        FuncOp('normalize', args_t=(Vec3,), ret_t=Vec3, exec_t=3.0, ports=(4,), py_eval=fold.normalize),
         FuncOp('dot', args_t=(Vec3, Vec3), ret_t=Vec3, exec_t=3.0, ports=(4,)),
         ConcatOp(Vec4, exec_t=1.0, ports=(3,)),
         ConcatOp(Vec2, exec_t=1.0, ports=(3,)),
@@ -162,8 +163,9 @@ def test_shader():
         frag_content = frag_shader.render()
         print(frag_content)
 
-# test_graph()
-test_shader()
+if __name__ == '__main__':
+    # test_graph()
+    test_shader()
 
 # ttest()
 
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import traceback
+from itertools import permutations, product
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple, Union
+
+from .cache import file_lock, pd_fingerprint
+from .proc_ctx import proc, proc_ctx
+from .proc_descr import ProcDescr
+
+TUNE_DB_ENV = 'SPEEDUTILS_TUNE_DB'
+
+# lower is better, e.g. estimated cycles or measured seconds
+ScoreFn = Callable[[Any, Dict[str, Any]], float]
+
+Trial = NamedTuple('Trial', (('opts', Dict[str, Any]), ('score', Optional[float]), ('error', Optional[str])))
+TuneResult = NamedTuple('TuneResult', (('opts', Dict[str, Any]), ('score', float), ('trials', Tuple[Trial, ...])))
+
+ProgressFn = Callable[[int, int, Trial], None]
+
+
+def static_cost(func, opts: Dict[str, Any]) -> float:
+    return func.cost(opts).blocks[0].cycles
+
+
+def print_progress(done: int, total: int, t: Trial):
+    status = 'FAILED' if t.error is not None else f'{t.score:.1f}'
+    print(f'[{done}/{total}] {status}', file=sys.stderr)
+
+
+def _divisors(n: int) -> List[int]:
+    return [d for d in range(1, n + 1) if n % d == 0]
+
+
+def loop_space(
+        dims: Mapping[str, Union[int, str]],
+        block_sizes: Mapping[str, Iterable[int]] = None,
+        splits: Mapping[str, Iterable[int]] = None,
+        reorder=True
+) -> List[Dict[str, Any]]:
+    # LoopFunc configs, `dims` are total sizes in loop order (innermost first), str for runtime sizes,
+    # a split adds an inner loop of that size below the loop over the whole dimension
+    block_sizes = block_sizes or {}
+    splits = splits or {}
+
+    def choices(n, total):
+        for b in block_sizes.get(n, (1,)):
+            if isinstance(total, int) and total % b:
+                continue
+            inner = [None]
+            for f in splits.get(n, ()):
+                if f % b == 0 and f > b and (not isinstance(total, int) or total % f == 0 and f < total):
+                    inner.append(f)
+            for f in inner:
+                yield b, f
+
+    names = tuple(dims)
+    r = []
+    for picked in product(*(tuple(choices(n, dims[n])) for n in names)):
+        pieces = []
+        for n, (b, f) in zip(names, picked):
+            if f is not None:
+                pieces.append((n, f))
+            pieces.append((n, dims[n]))
+        block_ddims = tuple((n, b) for n, (b, f) in zip(names, picked) if b > 1)
+        orders = permutations(pieces) if reorder else (pieces,)
+        for order in orders:
+            # the split loop of a dimension stays inside the loop over the whole of it
+            if any(
+                    order.index((n, f)) > order.index((n, dims[n]))
+                    for n, (b, f) in zip(names, picked) if f is not None
+            ):
+                continue
+            r.append({'loop_dims': tuple(order), 'block_ddims': block_ddims})
+    return r
+
+
+def _from_json(v):
+    if isinstance(v, list):
+        return tuple(map(_from_json, v))
+    if isinstance(v, dict):
+        return {k: _from_json(x) for k, x in v.items()}
+    return v
+
+
+class TuningDB:
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._pd_keys: Dict[int, Tuple[ProcDescr, str]] = {}
+        # put since the last save, other entries are taken from the file when saving
+        self._changed: Set[str] = set()
+        self._entries = self._read()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return {}
+
+    def _pd_key(self, pd: ProcDescr) -> str:
+        # fingerprinting is slow, the pd is kept to keep its id valid
+        cached = self._pd_keys.get(id(pd))
+        if cached is None:
+            digest = hashlib.sha256(pd_fingerprint(pd).encode()).hexdigest()[:16]
+            cached = self._pd_keys[id(pd)] = (pd, f'{pd.name}:{digest}')
+        return cached[1]
+
+    def key(self, func_name: str, pd: ProcDescr) -> str:
+        return f'{func_name}@{self._pd_key(pd)}'
+
+    def get(self, func_name: str, pd: ProcDescr) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(self.key(func_name, pd))
+        if entry is None:
+            return None
+        return _from_json(entry['opts'])
+
+    def put(self, func_name: str, pd: ProcDescr, opts: Dict[str, Any], score: float):
+        key = self.key(func_name, pd)
+        self._entries[key] = {'opts': opts, 'score': score}
+        self._changed.add(key)
+        self.save()
+
+    def save(self):
+        # merges with what other processes saved meanwhile, their entries win unless put here
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.path.with_name(self.path.name + '.lock')):
+            entries = self._read()
+            entries.update((k, self._entries[k]) for k in self._changed)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        self._entries = entries
+        self._changed.clear()
+
+
+_default_db: Optional[TuningDB] = None
+
+
+def set_default_tuning_db(db: Optional[TuningDB]):
+    global _default_db
+    _default_db = db
+
+
+def get_default_tuning_db() -> Optional[TuningDB]:
+    global _default_db
+    if _default_db is None and os.environ.get(TUNE_DB_ENV):
+        _default_db = TuningDB(os.environ[TUNE_DB_ENV])
+    return _default_db
+
+
+# set before the pool forks, like build._worker_state
+_worker_state = None
+
+
+def _try_one(opts: Dict[str, Any]) -> Trial:
+    pd, func, score, base_opts = _worker_state
+    try:
+        with proc(pd):
+            s = score(func, {**base_opts, **opts})
+    except Exception:
+        return Trial(opts, None, traceback.format_exc())
+    return Trial(opts, s, None)
+
+
+def tune(
+        func, space: Iterable[Dict[str, Any]], score: ScoreFn = static_cost, jobs: int = None,
+        db: Optional[TuningDB] = None, base_opts: Dict[str, Any] = None,
+        progress: Optional[ProgressFn] = print_progress
+) -> TuneResult:
+    # must run inside proc(), the best opts are stored for the current proc and applied by Func
+    global _worker_state
+    space = list(space)
+    if not space:
+        raise ValueError('Empty search space')
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(space)))
+    if db is None:
+        db = get_default_tuning_db()
+    pd = proc_ctx.model.pd
+
+    _worker_state = (pd, func, score, dict(base_opts or {}))
+    trials: List[Trial] = []
+    try:
+        if jobs == 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            done = map(_try_one, space)
+            pool = None
+        else:
+            pool = multiprocessing.get_context('fork').Pool(jobs)
+            done = pool.imap(_try_one, space)
+        try:
+            for t in done:
+                trials.append(t)
+                if progress is not None:
+                    progress(len(trials), len(space), t)
+        finally:
+            if pool is not None:
+                pool.terminate()
+    finally:
+        _worker_state = None
+
+    scored = [t for t in trials if t.error is None]
+    if not scored:
+        raise RuntimeError(f'All {len(trials)} configurations of {func._name} failed\n{trials[0].error}')
+    best = min(scored, key=lambda t: t.score)
+    if db is not None:
+        db.put(func._name, pd, best.opts, best.score)
+    return TuneResult(best.opts, best.score, tuple(trials))
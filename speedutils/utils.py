@@ -23,7 +23,7 @@ def addi(a, s):
         return a
     if isinstance(a, int) and isinstance(s, int):
         return a + s
-    return '(({})*({}))'.format(a, s)
+    return '(({})+({}))'.format(a, s)
 
 
 def muli(a, k):
@@ -31,6 +31,8 @@ def muli(a, k):
         return 0
     if k == 1:
         return a
+    if isinstance(a, int) and isinstance(k, int):
+        return a * k
     if is_p2(k):
         return '(({})<<({}))'.format(a, get_p2(k))
     return '(({})*({}))'.format(a, k)
@@ -41,8 +43,10 @@ def divi(a, k):
         return
     if k == 1:
         return a
+    if isinstance(a, int) and isinstance(k, int):
+        return a // k
     if is_p2(k):
-        return '(({})<<({}))'.format(a, get_p2(k))
+        return '(({})>>({}))'.format(a, get_p2(k))
     return '(({})/({}))'.format(a, k)
 
 
@@ -51,6 +55,8 @@ def modi(a, k):
         return
     if k == 1:
         return 0
+    if isinstance(a, int) and isinstance(k, int):
+        return a % k
     if is_p2(k):
         return '(({})&({}))'.format(a, k - 1)
     return '(({})%({}))'.format(a, k)
@@ -1,15 +1,24 @@
-from typing import NamedTuple, TYPE_CHECKING
+from typing import Dict, NamedTuple, TYPE_CHECKING
 
+from . import fold
 from .graphval import GraphVal, VType
+from .proc_ctx import graph_ctx
 
 if TYPE_CHECKING:
     pass
 
 
 class CodeVal(GraphVal):
+    __slots__ = ()
+
     type_name = 'code'
 
 
+class CtlCodeVal(CodeVal):
+    # control flow lines, e.g. of loops, they never touch memory
+    __slots__ = ()
+
+
 # class VType:
 #     name: str = '?'
 #     shape: Tuple[int] = ()
@@ -48,43 +57,62 @@ class CodeVal(GraphVal):
 #         return str(self)
 
 
-# class Ptr(GraphVal):
-#     def __init__(self, t: VType):
-#         self._t: VType = t
-#
-#     def __str__(self):
-#         return f'{self._t}*'
-#
-#     @property
-#     def dims(self):
-#         raise ValueError('`ptr` has no dimensions')
-#
-#     @property
-#     def name(self):
-#         return f'ptrX{self._t.name}'
+class PtrVal(GraphVal):
+    __slots__ = ()
+
+    pointee: VType = None
+
+    @classmethod
+    def _var_op(cls):
+        # pointers are plain named inputs, no target declares ops on them
+        return graph_ctx.find_spec_op('load', cls.pointee)
+
+
+_ptr_types: Dict[VType, VType] = {}
+
+
+def Ptr(t: VType) -> VType:
+    try:
+        return _ptr_types[t]
+    except KeyError:
+        pass
+    ptr_t = _ptr_types[t] = type(f'ptr_{t.type_name}', (PtrVal,), {
+        '__slots__': (),
+        'type_name': f'ptr_{t.type_name}',
+        'pointee': t,
+    })
+    return ptr_t
 
 
 OpDescr = NamedTuple('op_descr', (('name', str), ('op_id', int), ('ordered', int), ('out_t', VType)))
 
 
 class bool_(GraphVal):
+    __slots__ = ()
+
     type_name = 'bool'
 
     @classmethod
     def from_const(cls, val):
-        super().from_const(bool(val))
+        return super().from_const(bool(val))
 
 
 class int32_(GraphVal):
+    __slots__ = ()
+
     type_name = 'int32'
+    fold_val = staticmethod(fold.int32)
 
     @classmethod
     def from_const(cls, val):  # TODO: check range
-        super().from_const(int(val))
+        return super().from_const(int(val))
 
 
 class float_(GraphVal):
+    __slots__ = ()
+
     type_name = 'float'
+    fold_val = staticmethod(fold.float32)
     shape = (1,)
 
     @classmethod
@@ -93,7 +121,10 @@ class float_(GraphVal):
 
 
 class v4f(GraphVal):
+    __slots__ = ()
+
     type_name = 'v4f'
+    fold_val = staticmethod(fold.float32)
     shape = (4,)
 
     @classmethod
@@ -123,6 +154,8 @@ def _trunc_cfg(obj) -> str:
 
 
 class Tcfg(GraphVal):
+    __slots__ = ()
+
     name = 'cfg'
 
     @classmethod
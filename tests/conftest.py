@@ -0,0 +1,57 @@
+import pytest
+
+from speedutils.proc_ctx import new_graph, proc
+from speedutils.proc_descr import CvtOp, Op, ProcDescr, SignOp, SimpleLoadOp, SimpleStoreOp, TypedNoargOp
+from speedutils.shader.types import ConcatOp
+from speedutils.vtypes import float_, int32_, v4f
+
+test_pd = ProcDescr(
+    name='pytestproc',
+    mem_levels=(
+        ('regs', 16, 0, 0.0),
+        ('L1', 3200, 1, 7.0)
+    ),
+    ops=(
+        SimpleLoadOp(ret_t=float_, exec_t=7.0, ports=(6, 1)),
+        SimpleLoadOp(ret_t=int32_, exec_t=7.0, ports=(6, 1)),
+        SimpleLoadOp(ret_t=v4f, exec_t=8.0, ports=(6, 1)),
+        SimpleStoreOp(float_, exec_t=7.0, ports=(6, 1)),
+        SimpleStoreOp(int32_, exec_t=7.0, ports=(6, 1)),
+        SimpleStoreOp(v4f, exec_t=8.0, ports=(6, 1)),
+        SignOp('add', '+', (float_, float_), ret_t=float_, exec_t=4.0, ports=(4,), args_ordered=False),
+        SignOp('sub', '-', (float_, float_), ret_t=float_, exec_t=4.0, ports=(4,)),
+        SignOp('mul', '*', (float_, float_), ret_t=float_, exec_t=5.5, ports=(5,), args_ordered=False),
+        SignOp('div', '/', (float_, float_), ret_t=float_, exec_t=12.0, ports=(5,)),
+        SignOp('neg', '-', (float_,), ret_t=float_, exec_t=1.0, ports=(4,)),
+        SignOp('add', '+', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), args_ordered=False),
+        SignOp('sub', '-', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,)),
+        SignOp('mul', '*', (int32_, int32_), ret_t=int32_, exec_t=3.0, ports=(4,), args_ordered=False),
+        SignOp('div', '/', (int32_, int32_), ret_t=int32_, exec_t=20.0, ports=(5,)),
+        SignOp('and', '&', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), args_ordered=False),
+        SignOp('or', '|', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), args_ordered=False),
+        SignOp('xor', '^', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), args_ordered=False),
+        CvtOp(in_t=int32_, ret_t=float_, exec_t=4.0, ports=(7,)),
+        CvtOp(in_t=float_, ret_t=int32_, exec_t=4.0, ports=(7,)),
+        TypedNoargOp(name='zero', ret_t=float_, exec_t=1.0, ports=(4,)),
+        TypedNoargOp(name='const', ret_t=float_, exec_t=1.0, ports=(3,)),
+        TypedNoargOp(name='const', ret_t=int32_, exec_t=1.0, ports=(3,)),
+        TypedNoargOp(name='const', ret_t=v4f, exec_t=1.0, ports=(3,)),
+        SignOp('add', '+', (v4f, v4f), ret_t=v4f, exec_t=4.0, ports=(4,), args_ordered=False),
+        SignOp('sub', '-', (v4f, v4f), ret_t=v4f, exec_t=4.0, ports=(4,)),
+        SignOp('mul', '*', (v4f, v4f), ret_t=v4f, exec_t=5.5, ports=(5,), args_ordered=False),
+        ConcatOp(v4f, exec_t=2.0, ports=(3,)),
+        Op(name='get_elemYv4f', ret_t=float_, exec_t=1.0, ports=(3,)),
+    )
+)
+
+
+@pytest.fixture
+def pd():
+    with proc(test_pd):
+        yield test_pd
+
+
+@pytest.fixture
+def graph(pd):
+    with new_graph() as g:
+        yield g
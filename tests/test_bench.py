@@ -0,0 +1,16 @@
+from speedutils.bench import bench_export, compare, workloads
+
+
+def test_export_workloads_are_registered():
+    w = workloads(())
+    assert w['export'] is bench_export
+    assert w['export_columnar'].func is bench_export
+    assert w['export_columnar'].keywords == {'columnar': True}
+
+
+def test_compare_finds_regressions():
+    base = {'results': {'a': {'seconds': 1.0, 'nodes_per_s': 100.0}, 'b': {'error': 'x'}}}
+    same = {'results': {'a': {'seconds': 1.05, 'nodes_per_s': 95.0}}}
+    slow = {'results': {'a': {'seconds': 1.5, 'nodes_per_s': 50.0}}}
+    assert compare(same, base) == []
+    assert len(compare(slow, base)) == 2
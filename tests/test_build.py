@@ -0,0 +1,53 @@
+import pytest
+
+from speedutils.build import generate_all, write_all
+from speedutils.func import Func, func_reg
+from speedutils.vtypes import float_, int32_
+
+
+class KernelFunc(Func):
+    # stands in for the gpu funcs, which prefix the signature in gen
+    def gen(self, opts, cache=None, sink=None):
+        with sink.section(self._name):
+            sink.write('__kernel')
+            super().gen(opts, cache=cache, sink=sink)
+
+
+def body():
+    (float_.var('a') * float_.var('b')).store(float_.var('out'), int32_.var('i'))
+
+
+@pytest.fixture
+def funcs():
+    plain, kernel = Func(name='plain').decor(body), KernelFunc(name='kernel').decor(body)
+    func_reg['plain'], func_reg['kernel'] = (plain, []), (kernel, [])
+    yield plain, kernel
+    del func_reg['plain'], func_reg['kernel']
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_gen_overrides_are_used(pd, funcs, jobs):
+    results = generate_all(['plain', 'kernel'], jobs=jobs, progress=None)
+    assert [r.name for r in results] == ['kernel', 'plain']
+    kernel, plain = (r.code for r in results)
+    assert kernel.startswith('__kernel\nvoid kernel_')
+    assert plain.startswith('void plain_')
+    assert kernel.split('\n', 2)[2] == plain.split('\n', 1)[1]
+
+
+def test_results_are_written_in_order(pd, funcs, tmp_path):
+    path = tmp_path / 'out.c'
+    sink = write_all(generate_all(['plain', 'kernel'], jobs=1, progress=None), path)
+    assert [s.name for s in sink.stats] == ['kernel', 'plain']
+    assert path.read_text().startswith('__kernel\n')
+
+
+def test_failures_are_reported(pd, funcs):
+    def broken():
+        raise KeyError('missing')
+    func_reg['broken'] = (Func(name='broken').decor(broken), [])
+    try:
+        with pytest.raises(RuntimeError, match='broken'):
+            generate_all(['plain', 'broken'], jobs=1, progress=None)
+    finally:
+        del func_reg['broken']
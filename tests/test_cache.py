@@ -0,0 +1,67 @@
+import os
+from functools import partial
+
+import pytest
+
+from speedutils import fold
+from speedutils.cache import KernelCache, cache_key, fingerprint, pd_fingerprint
+from speedutils.proc_descr import ProcDescr, SignOp
+from speedutils.vtypes import int32_
+
+from .conftest import test_pd
+
+
+def test_put_and_get(tmp_path):
+    cache = KernelCache(tmp_path)
+    key = cache_key('a', 'b')
+    assert cache.get(key) is None
+    cache.put(key, 'int x;')
+    assert cache.get(key) == 'int x;'
+    assert KernelCache(tmp_path).get(key) == 'int x;'
+
+
+def test_key_depends_on_all_parts():
+    assert cache_key('a', 'b') == cache_key('a', 'b')
+    assert cache_key('a', 'b') != cache_key('b', 'a')
+    assert cache_key('ab') != cache_key('a', 'b')
+
+
+def test_fingerprint_ignores_dict_order():
+    assert fingerprint({'a': 1, 'b': (2, 3)}) == fingerprint({'b': (2, 3), 'a': 1})
+    assert fingerprint({'a': 1}) != fingerprint({'a': '1'})
+
+
+def test_pd_fingerprint_sees_op_changes():
+    other = ProcDescr(name=test_pd.name, mem_levels=test_pd.mem_levels, ops=test_pd.ops[:-1])
+    assert pd_fingerprint(test_pd) == pd_fingerprint(test_pd)
+    assert pd_fingerprint(other) != pd_fingerprint(test_pd)
+
+
+def test_pd_fingerprint_sees_folding_changes():
+    def with_eval(py_eval):
+        return ProcDescr(name=test_pd.name, mem_levels=test_pd.mem_levels, ops=test_pd.ops + (
+            SignOp('sub', '-', (int32_, int32_), ret_t=int32_, exec_t=1.0, ports=(4,), py_eval=py_eval),
+        ))
+    assert pd_fingerprint(with_eval(fold.same_value)) != pd_fingerprint(with_eval(fold.sign_evaluator('-', 2)))
+    assert pd_fingerprint(with_eval(fold.sign_evaluator('+', 2))) != pd_fingerprint(with_eval(fold.sign_evaluator('-', 2)))
+    assert pd_fingerprint(with_eval(fold.dot)) == pd_fingerprint(with_eval(fold.dot))
+
+
+def test_fingerprint_rejects_plain_objects():
+    with pytest.raises(TypeError):
+        fingerprint({'a': object()})
+    assert fingerprint(partial(max, 1)) == fingerprint(partial(max, 1)) != fingerprint(partial(max, 2))
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = KernelCache(tmp_path)
+    keys = [cache_key(str(n)) for n in range(3)]
+    for n, key in enumerate(keys):
+        cache.put(key, 'x' * 100)
+        os.utime(cache._path(key), (n, n))
+    cache.get(keys[0])  # now the most recent
+    cache.max_bytes = 250
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
@@ -0,0 +1,41 @@
+from speedutils.proc_ctx import new_graph
+from speedutils.vtypes import float_, int32_
+
+
+def build():
+    arr = float_.var('arr')
+    a, b = float_.var('a'), float_.var('b')
+    unused = a * a  # never reaches a store
+    s = a * b + b
+    s.store(arr, int32_.var('i'))
+    (s - a).store(arr, int32_.var('j'))
+    return unused
+
+
+def test_columnar_matches_row_graph(pd):
+    with new_graph() as rows:
+        build()
+    with new_graph(columnar=True) as cols:
+        build()
+
+    def names(g):
+        return [v.op_name for v in g.used_ordered()]
+
+    assert names(cols) == names(rows)
+    assert list(cols.render_code()) == list(rows.render_code())
+    assert 'mulYfloatXfloat' in names(rows)
+    assert names(rows).count('mulYfloatXfloat') == 1
+
+
+def test_export_numbers_args_in_order(pd):
+    with new_graph(columnar=True) as g:
+        build()
+    nodes = g.used_ordered()
+    rows, op_nums, csr, scope_ends = g._cols.export(len(g.scopes))
+    assert len(csr) == len(nodes) == scope_ends[-1]
+    pos = {v.orig: n for n, v in enumerate(nodes)}
+    for n, v in enumerate(nodes):
+        want = [pos[g.get_alias(a).orig] for a in v.a if g.get_alias(a).orig in pos]
+        assert list(csr[n]) == want
+        assert all(a < n for a in csr[n])
+    assert list(op_nums) == [g.model.op_ids[v.op.name] for v in nodes]
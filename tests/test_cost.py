@@ -0,0 +1,44 @@
+import pytest
+
+from speedutils.cost import _mem_level, estimate_cost, format_cost
+from speedutils.proc_ctx import proc_ctx
+from speedutils.vtypes import float_, int32_
+
+
+def mul_chain(n):
+    a = x = float_.var('a')
+    for _ in range(n):
+        x = x * a
+    x.store(float_.var('out'), int32_.var('i'))
+
+
+def test_chain_cost(graph):
+    mul_chain(3)
+    (scope,) = estimate_cost(graph).scopes
+    assert scope.critical_path == pytest.approx(3 * 5.5 + 7.0)
+    assert scope.port_bound == pytest.approx(3 * 5.5)
+    assert scope.cycles >= scope.critical_path
+
+
+def test_far_reads_come_from_slower_levels(pd):
+    levels = proc_ctx.model.mem_levels
+    regs, l1 = levels
+    assert _mem_level(levels, 1) == regs
+    assert _mem_level(levels, regs.size) == regs
+    assert _mem_level(levels, regs.size + 1) == l1
+    assert _mem_level(levels, regs.size + l1.size + 1) == l1
+
+
+def test_blocks_sum_nested_scopes(graph):
+    a, i = float_.var('a'), int32_.var('i')
+    (a * a).store(a, i)
+    inner = graph.start_use_block(10)
+    (float_.var('b', start_scope=False) * a).store(a, int32_.var('j', start_scope=False))
+    graph.end_use_block()
+    report = estimate_cost(graph)
+    by_block = {s.block: s for s in report.scopes}
+    assert by_block[inner].exp_use == 10
+    assert report.blocks[inner].parent == 0
+    assert report.blocks[inner].cycles == pytest.approx(by_block[inner].cycles * 10)
+    assert report.blocks[0].cycles == pytest.approx(by_block[0].cycles + by_block[inner].cycles * 10)
+    assert len(format_cost(report).splitlines()) == 1 + len(report.blocks)
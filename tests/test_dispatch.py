@@ -0,0 +1,32 @@
+import pytest
+
+from speedutils.proc_descr import OpTable, SignOp, split_op_name
+from speedutils.vtypes import float_, int32_
+
+
+def test_split_op_name():
+    assert split_op_name('addYfloatXint32') == ('add', ('float', 'int32'))
+    assert split_op_name('nop') == ('nop', ())
+
+
+def test_lookup_by_types():
+    add = SignOp('add', '+', (float_, int32_), ret_t=float_, exec_t=1.0, ports=(4,), args_ordered=False)
+    sub = SignOp('sub', '-', (float_, int32_), ret_t=float_, exec_t=1.0, ports=(4,))
+    table = OpTable((add, sub))
+    assert table.lookup('add', (float_, int32_)) is add
+    # unordered ops are found with their args swapped, ordered ones are not
+    assert table.lookup('add', (int32_, float_)) is add
+    assert table.lookup('sub', (float_, int32_)) is sub
+    assert table.lookup('sub', (int32_, float_)) is None
+    assert table.lookup('mul', (float_, int32_)) is None
+
+
+def test_graph_find_helpers(graph):
+    assert graph.find_op('add', (float_.var('a'), float_.var('b'))).name == 'addYfloatXfloat'
+    assert graph.find_load_op(float_).name == 'loadYfloat'
+    assert graph.find_store_op(int32_).name == 'storYint32'
+    assert graph.find_cvt_op(float_.var('a'), int32_).name == 'cvtYfloatXint32'
+    with pytest.raises(ValueError):
+        graph.find_op('nop', (float_.var('a'),))
+    with pytest.raises(ValueError):
+        graph.find_spec_op('zero', int32_)
@@ -0,0 +1,83 @@
+import pytest
+
+from speedutils import fold
+from speedutils.proc_ctx import new_graph, proc
+from speedutils.proc_descr import ProcDescr, SignOp
+from speedutils.shader.types import Mat4, Vec4
+from speedutils.vtypes import float_, int32_
+
+from .conftest import test_pd
+
+
+def test_sign_ops_fold(graph):
+    r = float_.from_const(1.5) * float_.from_const(2.0) + float_.var('a')
+    assert r.a[0].const and r.a[0].val == 3.0
+    assert (int32_.from_const(6) - int32_.from_const(8)).val == -2
+
+
+def test_fold_off_keeps_the_op(pd):
+    with new_graph(fold_consts=False):
+        r = float_.from_const(1.5) * float_.from_const(2.0)
+        assert not r.const and r.op_name == 'mulYfloatXfloat'
+
+
+def test_division_by_zero_is_left_for_runtime(graph):
+    r = float_.from_const(1.0) / float_.from_const(0.0)
+    assert not r.const
+
+
+@pytest.mark.parametrize('a, b, q', [(7, 2, 3), (-7, 2, -3), (7, -2, -3), (-7, -2, 3), (2 ** 31 - 1, 1, 2 ** 31 - 1)])
+def test_integer_division_truncates(graph, a, b, q):
+    assert (int32_.from_const(a) / int32_.from_const(b)).val == q
+
+
+def test_int32_overflow_is_left_for_runtime(graph):
+    big = int32_.from_const(2 ** 31 - 1)
+    assert not (big + int32_.from_const(1)).const
+    assert not (int32_.from_const(-2 ** 31) / int32_.from_const(-1)).const
+    assert (big - int32_.from_const(1)).val == 2 ** 31 - 2
+
+
+def test_floats_fold_in_single_precision(graph):
+    r = float_.from_const(0.1) * float_.from_const(3.0)
+    assert r.val == fold.float32(fold.float32(0.1) * 3.0) != 0.1 * 3.0
+    assert not (float_.from_const(3e38) * float_.from_const(10.0)).const
+
+
+@pytest.mark.parametrize('val', (float('nan'), float('inf'), 1e30))
+def test_bad_int_conversion_is_left_for_runtime(graph, val):
+    r = float_.from_const(val).cvt(int32_)
+    assert not r.const and r.op_name == 'cvtYfloatXint32'
+    assert float_.from_const(-2.7).cvt(int32_).val == -2
+
+
+def test_bitwise_folds_ints_only(graph):
+    assert (int32_.from_const(6) & int32_.from_const(3)).val == 2
+    assert (int32_.from_const(6) ^ int32_.from_const(3)).val == 5
+    assert fold.sign_evaluator('&', 2)(1.5, 2.0) is NotImplemented
+    assert fold.sign_evaluator('|', 2)((1, 2), (1.0, 2)) is NotImplemented
+
+
+def test_float_bitwise_consts_stay_ops():
+    pd = ProcDescr('bitfloat', test_pd.mem_levels, test_pd.ops + (
+        SignOp('and', '&', (float_, float_), ret_t=float_, exec_t=1.0, ports=(4,)),
+    ))
+    with proc(pd), new_graph():
+        r = float_.from_const(1.5) & float_.from_const(2.0)
+        assert not r.const and r.op_name == 'andYfloatXfloat'
+
+
+def test_default_evaluator_needs_one_shape():
+    same = SignOp('add', '+', (Vec4, Vec4), ret_t=Vec4, exec_t=1.0, ports=(4,))
+    mat = SignOp('mul', '*', (Mat4, Mat4), ret_t=Mat4, exec_t=1.0, ports=(4,))
+    mixed = SignOp('mul', '*', (Mat4, Vec4), ret_t=Vec4, exec_t=1.0, ports=(4,))
+    assert same.py_eval is not None
+    assert mat.py_eval is None and mixed.py_eval is None
+    own = SignOp('mul', '*', (Mat4, Mat4), ret_t=Mat4, exec_t=1.0, ports=(4,), py_eval=fold.same_value)
+    assert own.py_eval is fold.same_value
+
+
+def test_elementwise_broadcasts_scalars():
+    add = fold.sign_evaluator('+', 2)
+    assert add((1.0, 2.0), 1.0) == (2.0, 3.0)
+    assert add((1.0, 2.0), (1.0,)) is NotImplemented
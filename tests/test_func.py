@@ -0,0 +1,99 @@
+import pytest
+
+from speedutils.cache import KernelCache
+from speedutils.func import Func, func_reg
+from speedutils.instrument import profiling
+from speedutils.proc_ctx import func_ctx, new_graph
+from speedutils.vtypes import float_, int32_
+
+
+class CallFunc(Func):
+    # the call itself is not emitted, only the analysis and registration are tested
+    def _gen_call(self):
+        pass
+
+
+def traces(p, name):
+    s = p.stats().get(('trace', name))
+    return 0 if s is None else s.calls
+
+
+@pytest.fixture
+def scale():
+    class Retraced(CallFunc):
+        trace_once = False
+
+    @Retraced(name='scale')
+    def scale():
+        c = func_ctx.get_var('c', float_, const=True)
+        (func_ctx.get_var('a', float_) * c).store(float_.var('out'), int32_.var('i'))
+
+    yield scale
+    for name in [n for n in func_reg if n.startswith('scale_')]:
+        del func_reg[name]
+
+
+def test_call_trace_is_reused_by_gen(pd, scale):
+    with profiling() as p:
+        with new_graph():
+            scale(c=2.0, a=float_.var('x'))
+        assert traces(p, 'scale') == 1
+        (name,) = [n for n in func_reg if n.startswith('scale_')]
+        code = scale.gen_code({'c': 2.0})
+        assert traces(p, 'scale') == 1
+        assert code.startswith(f'void {name}(float a)')
+        # the kept trace is used once, then traced again
+        assert scale.gen_code({'c': 2.0}) == code
+        assert traces(p, 'scale') == 2
+
+
+def test_other_consts_are_traced(pd, scale):
+    with profiling() as p:
+        with new_graph():
+            scale(c=2.0, a=float_.var('x'))
+        code = scale.gen_code({'c': 3.0})
+        assert traces(p, 'scale') == 2
+        assert '3.0' in code and '2.0' not in code
+        assert len(scale._traces) == 1
+
+
+def test_kept_traces_are_bounded(pd, scale):
+    scale.kept_traces = 2
+    with new_graph():
+        for c in (1.0, 2.0, 3.0):
+            scale(c=c, a=float_.var('x'))
+    assert len(scale._traces) == 2
+    assert len([n for n in func_reg if n.startswith('scale_')]) == 3
+
+
+def affine():
+    c = func_ctx.get_var('c', float_, const=True)
+    d = func_ctx.get_var('d', float_, const=True)
+    a, b = func_ctx.get_var('a', float_), func_ctx.get_var('b', float_)
+    (a * c + b * d + d).store(float_.var('out'), int32_.var('i'))
+
+
+class FreshFunc(Func):
+    trace_once = False
+
+
+def test_specialized_matches_fresh_trace(pd):
+    once, fresh = Func(name='affine').decor(affine), FreshFunc(name='affine').decor(affine)
+    opts = {'c': 2.0, 'd': 3.0}
+    assert once.gen_code(opts) == fresh.gen_code(opts)
+    # substituted ones and zeros are simplified away, a fresh trace keeps them
+    opts = {'c': 1.0, 'd': 0.0}
+    specialized, traced = once.gen_code(opts).split('\n'), fresh.gen_code(opts).split('\n')
+    assert specialized[0] == traced[0]
+    assert len(specialized) < len(traced)
+    assert 'constYfloat(1.0)' in traced[1] and not any('1.0' in l for l in specialized)
+
+
+def test_cache_tells_trace_modes_apart(pd, tmp_path):
+    cache = KernelCache(tmp_path)
+    once, fresh = Func(name='affine').decor(affine), Func(name='affine').decor(affine)
+    fresh.trace_once = False
+    opts = {'c': 1.0, 'd': 0.0}
+    specialized = once.gen_code(opts, cache=cache)
+    assert fresh.gen_code(opts, cache=cache) != specialized
+    assert once.gen_code(opts, cache=cache) == specialized
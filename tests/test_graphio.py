@@ -0,0 +1,50 @@
+import pytest
+
+from speedutils.graphio import dump_graph, load_graph, save_graph
+from speedutils.proc_ctx import graph_scope
+from speedutils.vtypes import float_, int32_
+
+
+def build():
+    arr = float_.var('arr')
+    i = int32_.var('i')
+    x = float_.load(arr, i) * float_.from_const(2.5) + float_.var('b')
+    x.store(arr, i + int32_.from_const(1))
+
+
+def test_round_trip_renders_the_same(graph):
+    build()
+    loaded = load_graph(dump_graph(graph))
+    assert list(loaded.render_code()) == list(graph.render_code())
+    assert [v.op_name for v in loaded.used_ordered()] == [v.op_name for v in graph.used_ordered()]
+
+
+def test_loaded_nodes_keep_keys(graph):
+    build()
+    loaded = load_graph(dump_graph(graph))
+    with graph_scope(loaded):
+        # rebuilding the same expressions finds the loaded nodes
+        n = len(loaded.used_ordered())
+        build()
+        assert len(loaded.used_ordered()) == n
+
+
+def test_skippable_blocks_are_kept(graph):
+    block = graph.start_use_block(4.0, skippable=True)
+    build()
+    graph.end_use_block()
+    assert load_graph(dump_graph(graph)).skippable_blocks == {block}
+
+
+def test_save_and_load_file(graph, tmp_path):
+    build()
+    path = tmp_path / 'g.bin'
+    save_graph(graph, path)
+    assert list(load_graph(path).render_code()) == list(graph.render_code())
+
+
+def test_bad_data_is_rejected(graph):
+    build()
+    data = dump_graph(graph)
+    with pytest.raises(ValueError):
+        load_graph(b'XXXX' + data[4:])
@@ -0,0 +1,38 @@
+import pytest
+
+from speedutils.graphval import GraphVal
+from speedutils.vtypes import float_
+
+
+def test_values_have_no_dict(graph):
+    v = float_.var('a')
+    assert not hasattr(v, '__dict__')
+    with pytest.raises(AttributeError):
+        v.foo = 1
+
+
+def test_setnot_toggles_without_touching_the_source(graph):
+    a = float_.var('a')
+    n = -a
+    assert n.neg and not a.neg
+    assert not (-n).neg
+    assert (-n).attr_stack == ()
+    assert n.orig == a.orig
+
+
+def test_copy_shares_immutable_state(graph):
+    a = -float_.var('a')
+    c = a.copy()
+    assert c is not a
+    assert c.attr_stack is a.attr_stack
+    c2 = c.setnot('neg')
+    assert a.neg and c.neg and not c2.neg
+
+
+def test_flush_attr_applies_pending_ops(graph):
+    a = float_.var('a')
+    r = float_.var('b') * (-a)
+    assert r.op_name == 'mulYfloatXfloat'
+    n = r.a[1]
+    assert isinstance(n, GraphVal) and n.op_name == 'negYfloat'
+    assert n.a[0].orig == a.orig and not n.neg
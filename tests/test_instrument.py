@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from speedutils.instrument import Profiler, instrumented, profiling
+from speedutils.proc_ctx import new_graph
+from speedutils.vtypes import float_
+
+
+def test_nested_counters_roll_up():
+    p = Profiler()
+    with p.phase('outer'):
+        p.count('nodes')
+        with p.phase('inner', 'f'):
+            p.count('nodes', 2)
+    stats = p.stats()
+    assert stats['inner', 'f'].counters == {'nodes': 2}
+    assert stats['outer', None].counters == {'nodes': 3}
+    assert stats['outer', None].seconds >= stats['inner', 'f'].seconds
+
+
+def test_func_is_inherited():
+    p = Profiler()
+    with p.phase('gen', 'f'):
+        with p.phase('trace'):
+            pass
+    assert ('trace', 'f') in p.stats()
+
+
+def test_end_removes_the_given_phase():
+    p = Profiler()
+    outer = p.begin('outer')
+    gen = p.begin('gen')
+    inner = p.begin('inner')
+    p.end(gen)  # e.g. a generator closed before the phases begun while it ran
+    p.count('nodes')
+    p.end(inner)
+    p.end(outer)
+    stats = p.stats()
+    assert [e[0] for e in p.events] == ['gen', 'inner', 'outer']
+    assert stats['inner', None].counters == {'nodes': 1}
+    assert stats['outer', None].counters == {'nodes': 1}
+    with pytest.raises(RuntimeError):
+        p.end(outer)
+
+
+def test_instrumented_generator_counts_items():
+    class G:
+        _name = 'g'
+
+        @instrumented('lines', per_func=True)
+        def lines(self):
+            yield from 'abc'
+
+    with profiling() as p:
+        it = G().lines()
+        with p.phase('other'):
+            next(it)
+        assert list(it) == ['b', 'c']
+    assert p.stats()['lines', 'g'].counters == {'items': 3}
+    assert p.stats()['other', None].counters == {}
+
+
+def test_threads_have_their_own_stacks():
+    p = Profiler()
+    ready, done = threading.Event(), threading.Event()
+
+    def worker():
+        with p.phase('worker'):
+            ready.set()
+            done.wait()
+            p.count('nodes')
+
+    t = threading.Thread(target=worker)
+    with p.phase('main'):
+        t.start()
+        ready.wait()
+        with p.phase('inner'):
+            done.set()
+            t.join()
+    stats = p.stats()
+    assert stats['worker', None].counters == {'nodes': 1}
+    assert stats['main', None].counters == {}
+    assert len({e[-1] for e in p.events}) == 2
+
+
+def test_cse_hit_rate(pd):
+    with profiling() as p, p.phase('build'), new_graph():
+        a = float_.var('a')
+        a * a
+        a * a
+    stats = p.stats()['build', None]
+    assert stats.counters['cse_hits'] >= 1
+    assert p.cse_hit_rate('build') == stats.counters['cse_hits'] / (stats.counters['cse_hits'] + stats.counters['nodes'])
+    assert p.cse_hit_rate('missing') is None
+
+
+def test_chrome_trace_shape():
+    p = Profiler()
+    with p.phase('gen', 'f'):
+        p.count('nodes', 5)
+    (e,) = p.chrome_trace()['traceEvents']
+    assert e['ph'] == 'X'
+    assert e['name'] == 'gen f' and e['cat'] == 'gen'
+    assert e['ts'] >= 0 and e['dur'] >= 0
+    assert e['tid'] == threading.get_ident()
+    assert e['args']['func'] == 'f' and e['args']['nodes'] == 5
+    assert 'allocations' in e['args']
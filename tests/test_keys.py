@@ -0,0 +1,53 @@
+from speedutils.graphval import _const_token
+from speedutils.vtypes import float_, int32_
+
+
+def test_same_op_same_args_is_deduplicated(graph):
+    a, b = float_.var('a'), float_.var('b')
+    x = a * b + a
+    y = a * b + a
+    assert x.orig == y.orig
+    assert x.key == y.key
+    assert all(isinstance(k, int) for k in x.key)
+
+
+def test_unordered_args_share_a_key(graph):
+    a, b = float_.var('a'), float_.var('b')
+    assert (a + b).orig == (b + a).orig
+    assert (a - b).orig != (b - a).orig
+
+
+def test_vars_and_consts(graph):
+    assert float_.var('a').orig == float_.var('a').orig
+    assert float_.var('a').orig != int32_.var('a').orig
+    assert float_.from_const(1.0).orig == float_.from_const(1).orig
+    # 1 and 1.0 render differently, the const token keeps them apart
+    assert _const_token(1) != _const_token(1.0)
+    assert _const_token((1, 2.0)) == _const_token((1, 2.0))
+
+
+def test_signed_zeros_are_kept_apart(graph):
+    a = float_.var('a')
+    assert (a * float_.from_const(-0.0)).orig != (a * float_.from_const(0.0)).orig
+    assert float_.from_const(float('nan')).orig == float_.from_const(float('nan')).orig
+
+
+def test_distinct_graphs_do_not_share_nodes(pd):
+    from speedutils.proc_ctx import new_graph
+
+    with new_graph():
+        x = float_.var('a') + float_.var('b')
+    with new_graph():
+        y = float_.var('a') + float_.var('b')
+    assert x.orig != y.orig
+
+
+def test_values_of_a_closed_block_are_not_reused(graph):
+    outer = float_.from_const(1.5)
+    graph.start_use_block(4.0)
+    inside = float_.from_const(2.5)
+    assert float_.from_const(1.5).orig == outer.orig
+    graph.end_use_block()
+    after = float_.from_const(2.5)
+    assert after.orig != inside.orig
+    assert float_.from_const(2.5).orig == after.orig
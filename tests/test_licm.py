@@ -0,0 +1,91 @@
+from speedutils.licm import hoist_invariants
+from speedutils.loop import Loop
+from speedutils.vtypes import CodeVal, CtlCodeVal, float_, int32_
+
+
+def new_loop():
+    return Loop(exp_use=16.0, start_val=int32_.from_const(0), end_val=int32_.var('n'),
+                shift_len=int32_.from_const(1))
+
+
+def block_of(graph, v):
+    return graph.scopes[graph.get_alias(v).scope_n].block
+
+
+def loop_body(call=False, store=False):
+    # consts built inside the loop put their users there too
+    a = float_.var('a')
+    acc = float_.var('acc')
+    loop = new_loop()
+    with loop as it:
+        if call:
+            CodeVal.stationary_code('touch({});', None, a)
+        inv = float_.var('x') * float_.from_const(2.5)
+        load = float_.load(a, int32_.from_const(7))
+        s = inv + load + float_.load(a, it)
+        if store:
+            s.store(a, it)
+        else:
+            # a reduction into a local, no memory is written
+            bound = acc.bind_scope()
+            CtlCodeVal.stationary_code('{} = {};', None, bound, bound + s)
+    return loop, inv, load
+
+
+def test_invariants_leave_the_loop(graph):
+    loop, inv, load = loop_body()
+    assert block_of(graph, inv) == block_of(graph, load) == loop.block
+    saved = hoist_invariants(graph)
+    assert saved[loop.block] > 0
+    assert block_of(graph, inv) == block_of(graph, load) == 0
+    lines = list(graph.render_code())
+    do = lines.index('do {')
+    assert any('x * ' in l for l in lines[:do])
+    assert any('(a)' in l for l in lines[:do])
+
+
+def test_loads_stay_below_a_call(graph):
+    loop, inv, load = loop_body(call=True)
+    hoist_invariants(graph)
+    assert block_of(graph, inv) == 0
+    assert block_of(graph, load) == loop.block
+
+
+def test_loads_stay_below_stores_of_the_loop(graph):
+    loop, inv, load = loop_body(store=True)
+    hoist_invariants(graph)
+    assert block_of(graph, inv) == 0
+    assert block_of(graph, load) == loop.block
+
+
+def guarded_loop_body():
+    # a runtime trip count, the unrolled block and the remainder may not run
+    a, acc = float_.var('a'), float_.var('acc')
+    loop = Loop(exp_use=16.0, start_val=int32_.from_const(0), end_val=int32_.var('n'),
+                shift_len=int32_.from_const(1), unroll=2)
+
+    def body(it):
+        s = float_.var('x') * float_.from_const(2.5) + float_.load(a, int32_.from_const(7))
+        bound = acc.bind_scope()
+        CtlCodeVal.stationary_code('{} = {};', None, bound, bound + s + float_.load(a, it))
+
+    loop.run(body)
+    return loop
+
+
+def test_nothing_is_hoisted_under_the_guard(graph):
+    guarded_loop_body()
+    hoist_invariants(graph)
+    lines = list(graph.render_code())
+    guard = next(n for n, l in enumerate(lines) if l.startswith('if ('))
+    assert lines[guard].endswith(') do {')
+    assert any('x * ' in l for l in lines[:guard])
+
+
+def test_loads_stay_in_loops_that_may_not_run(graph):
+    loop = guarded_loop_body()
+    assert loop.block in graph.skippable_blocks
+    hoist_invariants(graph)
+    lines = list(graph.render_code())
+    guard = next(n for n, l in enumerate(lines) if l.startswith('if ('))
+    assert not any('(a)' in l for l in lines[:guard])
@@ -0,0 +1,54 @@
+import gc
+
+from speedutils.proc_ctx import new_graph
+from speedutils.vtypes import float_, int32_
+
+
+def test_used_set_follows_stores(graph):
+    a, b = float_.var('a'), float_.var('b')
+    x = a * b
+    assert x.orig not in graph.select_used()
+    st = x.store(float_.var('arr'), int32_.var('i'))
+    used = graph.select_used()
+    assert {x.orig, a.orig, b.orig, st.orig} <= used
+    y = a - b
+    assert y.orig not in graph.select_used()
+
+
+def test_removed_root_is_dropped_on_recompute(graph):
+    a = float_.var('a')
+    arr, i = float_.var('arr'), int32_.var('i')
+    keep = (a + a).store(arr, i)
+    gone = (a * a).store(arr, int32_.var('j'))
+    graph.remove_root(gone)
+    graph.recompute_used()
+    names = [v.op_name for v in graph.used_ordered()]
+    assert 'mulYfloatXfloat' not in names
+    assert keep.orig in graph.select_used()
+
+
+def test_drop_unused_keeps_cse_for_live_copies(pd):
+    with new_graph(drop_unused=True):
+        a, b = float_.var('a'), float_.var('b')
+        x = a * b
+        y = a * b  # a copy of the indexed node
+        assert y.orig == x.orig and y is not x
+        del x
+        gc.collect()
+        y.store(float_.var('arr'), int32_.var('i'))
+        z = a * b
+        assert z.orig == y.orig
+
+
+def test_drop_unused_recompute_keeps_live_nodes(pd):
+    with new_graph(drop_unused=True) as g:
+        a, arr = float_.var('a'), float_.var('arr')
+        (a * a + a).store(arr, int32_.var('i'))
+        (a - a).store(arr, int32_.var('j'))
+        del a, arr
+        gc.collect()
+        before = list(g.render_code())
+        g.recompute_used()
+        gc.collect()
+        assert list(g.render_code()) == before
+        assert len(g.used_ordered()) == 9
@@ -0,0 +1,163 @@
+import re
+
+import pytest
+
+from speedutils.array import Dimension, StoredArray
+from speedutils.func import Func
+from speedutils.loop import ArraysLoop, Loop, LoopFunc
+from speedutils.proc_ctx import func_ctx, proc_ctx
+from speedutils.vtypes import float_, int32_
+
+
+@LoopFunc(name='fill')
+def fill(it_x):
+    func_ctx.get_var('a', float_).store(float_.var('out'), it_x)
+
+
+def gen(loop_dims, unroll=()):
+    return fill.gen_code({'loop_dims': loop_dims, 'block_ddims': (), 'unroll': unroll}).split('\n')
+
+
+def stores(lines):
+    return lines.count('(a)')
+
+
+def body(lines, start):
+    # lines of the loop opened at `start`
+    end = next(n for n in range(start, len(lines)) if lines[n].startswith('}'))
+    return lines[start + 1:end], end
+
+
+def test_const_trip_count_is_unrolled(pd):
+    lines = gen((('x', 10),), (('x', 4),))
+    do = lines.index('do {')
+    inner, end = body(lines, do)
+    # two groups of 4 in the loop, no guard needed, the last 2 straight
+    assert stores(inner) == 4
+    assert not any(l.startswith('if') for l in lines)
+    limit = lines[end].split('< ')[1].rstrip(');')
+    assert f'int32 {limit} = constYint32(7)' in lines
+    assert stores(lines[end + 1:]) == 2
+
+
+def test_short_const_trip_count_is_straight_line(pd):
+    lines = gen((('x', 6),), (('x', 4),))
+    assert not any('while' in l for l in lines)
+    assert stores(lines) == 6
+
+
+def test_runtime_trip_count(pd):
+    lines = gen((('x', 'n'),), (('x', 4),))
+    assert lines[0].endswith('(float a, int32 n) {')
+    guard = next(n for n, l in enumerate(lines) if l.startswith('if ('))
+    assert lines[guard].endswith(') do {')
+    inner, end = body(lines, guard)
+    assert stores(inner) == 4
+    rest = lines.index('while (it_x_1 < n) {')
+    assert rest > end
+    assert stores(body(lines, rest)[0]) == 1
+
+
+def test_runtime_size_outside_a_const_loop(pd):
+    lines = gen((('x', 4), ('x', 'n')))
+    assert lines[0].endswith('(float a, int32 n) {')
+    assert lines[-2] == '} while (it_x_1 < n);'
+    assert stores(lines) == 1
+
+
+def test_runtime_step(pd):
+    lines = gen((('x', 'm'), ('x', 'n')), (('x', 2),))
+    assert lines[0].endswith('(float a, int32 m, int32 n) {')
+    # the outer loop steps over the whole inner one
+    assert any(l.startswith('int32 ') and l.endswith(' = it_x_1 + m') for l in lines)
+
+
+def scaled_loop(end, unroll=4):
+    # a const and its users are built in every copy of the body
+    a = float_.var('a')
+    loop = Loop(start_val=int32_.from_const(0), end_val=end, shift_len=int32_.from_const(1), unroll=unroll)
+
+    def copy(it):
+        (float_.load(a, it) * float_.from_const(2.5)).store(a, it + int32_.from_const(100))
+
+    loop.run(copy)
+    return loop
+
+
+def defined(lines):
+    return {l.split()[1] for l in lines if l.split()[2:3] == ['=']}
+
+
+@pytest.mark.parametrize('runtime', (True, False))
+def test_copies_after_the_loop_do_not_reuse_its_values(graph, runtime):
+    scaled_loop(int32_.var('n') if runtime else int32_.from_const(10))
+    lines = list(graph.render_code())
+    inner, end = body(lines, next(n for n, l in enumerate(lines) if l.endswith('do {')))
+    after = ' '.join(lines[end + 1:])
+    assert after.count('= (a)') == (1 if runtime else 2)
+    assert not any(re.search(rf'\b{n}\b', after) for n in defined(inner))
+
+
+@pytest.mark.parametrize('runtime, exp_use', ((False, 8.0), (True, 4.0)))
+def test_unrolled_body_is_weighted_by_its_trips(graph, runtime, exp_use):
+    # 32 trips are 8 of the body, a runtime count is guessed at one per copy
+    loop = scaled_loop(int32_.var('n') if runtime else int32_.from_const(32))
+    assert {s.exp_use for s in graph.scopes if s.block == loop.block} == {exp_use}
+
+
+X, Y = Dimension('x', 64), Dimension('y', 32)
+
+
+def arrays_loop(**kw):
+    a = StoredArray(float_, (X, Y), 'a')
+    b = StoredArray(float_, (X,), 'b')
+    c = StoredArray(float_, (X, Y), 'c')
+    return ArraysLoop((a, b), (X, Y), outs=(c,), **kw)
+
+
+def test_tiles_fit_the_memory_levels(pd):
+    al = arrays_loop()
+    reg, l1 = al.tiles()
+    assert dict(reg) == {'x': 4, 'y': 1}
+    assert dict(l1) == {'x': 64, 'y': 16}
+    levels = proc_ctx.model.mem_levels
+    assert al._working_set(reg) <= levels[0].size
+    assert al._working_set(l1) <= levels[1].size
+    assert al.tiles(levels[:1]) == (reg, reg)
+
+
+@pytest.mark.parametrize('arrs, order', (
+    ((StoredArray(float_, (X,), 'a'), StoredArray(float_, (Dimension('x', 32),), 'b')), (X,)),
+    ((StoredArray(float_, (Dimension('x', 8), Dimension('x', 8)), 'a'),), (X,)),
+    ((StoredArray(float_, (X,), 'a'),), (Dimension('x', 32),)),
+    ((StoredArray(float_, (X, Y), 'a'),), (X,)),
+))
+def test_bad_arrays_are_rejected(arrs, order):
+    with pytest.raises(ValueError):
+        ArraysLoop(arrs, order)
+
+
+@Func(name='copy')
+def copy():
+    ArraysLoop(
+        (StoredArray(float_, (X, Y), 'a'),), (X, Y),
+        outs=(StoredArray(float_, (X, Y), 'c'),)
+    ).run(lambda ta: ta)
+
+
+def test_run_nests_l1_and_register_loops(pd):
+    # reg tile x:8 y:1, L1 tile x:64 y:16: y in L1 steps, then y and x in register steps
+    lines = copy.gen_code({}).split('\n')
+    assert lines.count('do {') == 3
+    assert [l for l in lines if l.startswith('} while')] == [
+        '} while (it_x_3 < v9);', '} while (it_y_2 < v6);', '} while (it_y_1 < v1);'
+    ]
+    assert sum(l.endswith(' = (a)') for l in lines) == 8
+    assert sum(l.startswith('(v') for l in lines) == 8
+
+
+def test_body_must_return_one_block_per_out(pd):
+    al = arrays_loop()
+    f = Func(name='short').decor(lambda: al.run(lambda ta, tb: ()))
+    with pytest.raises(ValueError, match='returned 0 blocks'):
+        f.gen_code({})
@@ -0,0 +1,91 @@
+from speedutils.memflow import forward_stores
+from speedutils.vtypes import float_, int32_
+
+
+def stores(graph):
+    return [v for v in graph.used_ordered() if v.op_name == 'storYfloat']
+
+
+def loads(graph):
+    return [v for v in graph.used_ordered() if v.op_name == 'loadYfloat' and v.var_name is None]
+
+
+def test_load_after_store_is_forwarded(graph):
+    a, out = float_.var('a'), float_.var('out')
+    i = int32_.var('i')
+    x = float_.var('x')
+    x.store(a, i + int32_.from_const(1))
+    (float_.load(a, i + int32_.from_const(1)) * x).store(out, i)
+    assert forward_stores(graph) == (1, 0)
+    assert not loads(graph)
+    assert len(stores(graph)) == 2
+
+
+def test_other_offsets_are_not_forwarded(graph):
+    a, out = float_.var('a'), float_.var('out')
+    i = int32_.var('i')
+    float_.var('x').store(a, i)
+    float_.load(a, i + int32_.from_const(1)).store(out, i)
+    assert forward_stores(graph) == (0, 0)
+
+
+def test_overwritten_store_is_dead(graph):
+    a, i = float_.var('a'), int32_.var('i')
+    first = float_.var('x').store(a, i)
+    float_.var('y').store(a, i)
+    assert forward_stores(graph) == (0, 1)
+    assert first.orig not in {v.orig for v in stores(graph)}
+
+
+def test_read_store_is_kept(graph):
+    a, out, i = float_.var('a'), float_.var('out'), int32_.var('i')
+    float_.var('x').store(a, i)
+    float_.load(a, int32_.var('j')).store(out, i)  # may read a[i]
+    float_.var('y').store(a, i)
+    assert forward_stores(graph) == (0, 0)
+
+
+def test_arrays_may_alias_by_default(graph):
+    a, b, zero = float_.var('a'), float_.var('b'), int32_.from_const(0)
+    out = float_.var('out')
+    float_.var('x').store(a, zero)
+    float_.load(b, zero).store(out, zero)  # b may be a
+    float_.var('y').store(a, zero)
+    assert forward_stores(graph) == (0, 0)
+    assert len(stores(graph)) == 3
+
+
+def test_alias_at_an_offset_reads_other_indexes(graph):
+    a, b = float_.var('a'), float_.var('b')
+    one = int32_.from_const(1)
+    float_.var('x').store(a, one)
+    float_.load(b, int32_.from_const(0)).store(a, int32_.from_const(5))  # b may be a + 1
+    float_.var('y').store(a, one)
+    assert forward_stores(graph) == (0, 0)
+    assert len(stores(graph)) == 3
+
+
+def test_store_through_alias_is_not_forwarded(graph):
+    a, b, zero = float_.var('a'), float_.var('b'), int32_.from_const(0)
+    float_.var('x').store(a, zero)
+    float_.var('y').store(b, zero)  # may overwrite a[0]
+    float_.load(a, zero).store(float_.var('out'), zero)
+    assert forward_stores(graph) == (0, 0)
+    assert len(loads(graph)) == 1
+
+
+def test_restrict_assumes_distinct_arrays(graph):
+    a, b, zero = float_.var('a'), float_.var('b'), int32_.from_const(0)
+    float_.var('x').store(a, zero)
+    float_.var('y').store(b, zero)
+    float_.load(a, zero).store(float_.var('out'), zero)
+    assert forward_stores(graph, restrict=True) == (1, 0)
+
+
+def test_custom_code_reading_an_array_keeps_stores(graph):
+    a, i = float_.var('a'), int32_.var('i')
+    float_.var('x').store(a, i)
+    peek = float_.from_expr('peek({})', a, op=graph.ops['negYfloat'])
+    peek.store(float_.var('out'), i)
+    float_.var('y').store(a, i)
+    assert forward_stores(graph, restrict=True) == (0, 0)
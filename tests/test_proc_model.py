@@ -0,0 +1,32 @@
+from speedutils.proc_ctx import new_graph, proc
+from speedutils.proc_descr import ProcDescr, SignOp
+from speedutils.proc_model import get_proc_model
+from speedutils.vtypes import float_, int32_
+
+from .conftest import test_pd
+
+
+def test_model_is_shared_per_descr():
+    assert get_proc_model(test_pd) is get_proc_model(test_pd)
+    with proc(test_pd), new_graph() as a, new_graph() as b:
+        assert a.model is b.model
+
+
+def test_derived_descr_does_not_clobber_op_ids():
+    extra = SignOp('sub', '-', (float_, int32_), ret_t=float_, exec_t=1.0, ports=(4,))
+    # shares every Op object of test_pd, in a different order
+    derived = ProcDescr('derived', test_pd.mem_levels, (extra,) + test_pd.ops[::-1])
+    base_model = get_proc_model(test_pd)
+    base_ids = dict(base_model.op_ids)
+    derived_model = get_proc_model(derived)
+
+    assert dict(base_model.op_ids) == base_ids
+    assert derived_model.op_ids != base_model.op_ids
+    assert not any(hasattr(o, 'op_id') for o in derived.ops)
+
+    for pd, model in ((test_pd, base_model), (derived, derived_model)):
+        with proc(pd), new_graph(columnar=True) as g:
+            (float_.var('a') * float_.var('b')).store(float_.var('arr'), int32_.var('i'))
+            nodes = g.used_ordered()
+            _, op_nums, _, _ = g._cols.export(len(g.scopes))
+            assert list(op_nums) == [model.op_ids[v.op.name] for v in nodes]
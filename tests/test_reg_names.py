@@ -0,0 +1,73 @@
+from speedutils.sched import pressure_order
+from speedutils.vtypes import float_, int32_
+
+
+def squares_sum(n):
+    # all loads first, each value stays live until its square is summed
+    a, i = float_.var('a'), int32_.var('i')
+    xs = [float_.load(a, i + int32_.from_const(k)) for k in range(n)]
+    s = float_.from_const(0.0)
+    for x in [x * x for x in xs]:
+        s = s + x
+    s.store(float_.var('out'), i)
+
+
+def test_names_are_reused(graph):
+    a, b = float_.var('a'), float_.var('b')
+    s = a * b
+    for _ in range(5):
+        s = s * a + b
+    s.store(float_.var('out'), int32_.var('i'))
+    nodes = graph.used_ordered()
+    plain = list(graph.render_code())
+    reused = list(graph.render_code(reuse_names=True))
+    assert graph.reg_mapper(nodes).peak == {'float': 1}
+    assert reused[0] == 'float v0;'
+    assert len(reused) == len(plain) + 1
+
+
+def test_loop_values_live_to_loop_end(graph):
+    a, i = float_.var('a'), int32_.var('i')
+    x = float_.load(a, i) * float_.var('b')
+    graph.start_use_block(10)
+    (x * float_.var('c', start_scope=False)).store(a, int32_.var('j'))  # frees x without the loop
+    graph.end_use_block()
+    nodes = graph.used_ordered()
+    mapper = graph.reg_mapper(nodes)
+    names = {}
+    for v in nodes:
+        mapper.set(v, v.var_name)
+        if v.orig in mapper._planned:
+            names[v.orig] = mapper.get(v)
+    x_name = names[x.orig]
+    inner = [v for v in nodes if graph.scopes[v.scope_n].block != graph.scopes[x.scope_n].block]
+    assert all(names.get(v.orig) != x_name for v in inner)
+
+
+def test_order_is_kept_under_the_cap(graph):
+    squares_sum(8)
+    nodes = graph.used_ordered()
+    assert graph.reg_mapper(nodes).max_live <= 16
+    assert pressure_order(graph, range(len(nodes)), 16) == list(range(len(nodes)))
+
+
+def test_live_values_are_capped(graph):
+    squares_sum(24)
+    nodes = graph.used_ordered()
+    assert graph.reg_mapper(nodes).max_live > 16
+    ord = pressure_order(graph, range(len(nodes)), 16)
+    assert sorted(ord) == list(range(len(nodes)))
+    assert graph.reg_mapper(nodes[n] for n in ord).max_live <= 16
+    pos = {nodes[n].orig: p for p, n in enumerate(ord)}
+    for v in nodes:
+        for a in map(graph.get_alias, v.a):
+            assert pos.get(a.orig, -1) < pos[v.orig]
+
+
+def test_render_applies_the_cap(graph):
+    squares_sum(24)
+    code = list(graph.render_code(reuse_names=True))
+    float_names = code[1].rstrip(';').split(', ')
+    assert code[1].startswith('float ')
+    assert len(float_names) <= 16
+    assert len(code) == len(list(graph.render_code())) + 2
@@ -0,0 +1,46 @@
+from speedutils.graphval import GraphVal
+from speedutils.rewrite import CVT_ROUNDTRIP, DEFAULT_RULES, FACTOR_MUL, rewrite_graph
+from speedutils.vtypes import float_, int32_
+
+
+def ops(graph):
+    return [v.op_name for v in graph.used_ordered()]
+
+
+def test_mul_one_built_with_from_op(graph):
+    x = float_.var('x')
+    r = GraphVal.from_op('mul', x, float_.from_const(1.0))
+    r.store(float_.var('arr'), int32_.var('i'))
+    stats = rewrite_graph(graph)
+    assert stats['mul_one'].applied == 1
+    assert 'mulYfloatXfloat' not in ops(graph)
+
+
+def test_factor_mul_is_opt_in(graph):
+    a, b, c = (int32_.var(n) for n in 'abc')
+    (a * b + a * c).store(int32_.var('arr'), int32_.var('i'))
+    assert 'factor_mul' not in rewrite_graph(graph)
+    assert ops(graph).count('mulYint32Xint32') == 2
+
+    stats = rewrite_graph(graph, DEFAULT_RULES + (FACTOR_MUL,))
+    assert stats['factor_mul'].applied == 1 and stats['factor_mul'].saved > 0
+    assert ops(graph).count('mulYint32Xint32') == 1
+
+
+def test_cvt_roundtrip_is_opt_in(graph):
+    x = int32_.var('x')
+    x.cvt(float_).cvt(int32_).store(int32_.var('arr'), int32_.var('i'))
+    assert 'cvt_roundtrip' not in rewrite_graph(graph)
+    assert rewrite_graph(graph, (CVT_ROUNDTRIP,))['cvt_roundtrip'].applied == 1
+    assert not any(n.startswith('cvt') for n in ops(graph))
+
+
+def test_rule_needs_to_pay_off(graph):
+    a, b, c = (int32_.var(n) for n in 'abc')
+    ab, ac = a * b, a * c
+    arr, i = int32_.var('arr'), int32_.var('i')
+    (ab + ac).store(arr, i)
+    # both products stay alive, factoring would only add a multiplication
+    ab.store(arr, int32_.var('j'))
+    ac.store(arr, int32_.var('k'))
+    assert rewrite_graph(graph, (FACTOR_MUL,))['factor_mul'].applied == 0
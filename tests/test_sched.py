@@ -0,0 +1,47 @@
+from speedutils.sched import estimate_cycles, list_schedule
+from speedutils.vtypes import float_, int32_
+
+
+def divs_then_adds():
+    # the source order issues the int chain after the long divs
+    x = float_.var('a') / float_.var('c')
+    x = x / float_.var('c')
+    y = b = int32_.var('b')
+    for _ in range(15):
+        y = y + b
+    x.store(float_.var('out'), int32_.var('i'))
+    y.store(int32_.var('n'), int32_.var('i'))
+
+
+def test_order_is_a_valid_permutation(graph):
+    divs_then_adds()
+    nodes = graph.used_ordered()
+    ord = list_schedule(graph).ord
+    assert sorted(ord) == list(range(len(nodes)))
+    pos = {nodes[n].orig: p for p, n in enumerate(ord)}
+    for v in nodes:
+        for a in map(graph.get_alias, v.a):
+            assert pos[a.orig] < pos[v.orig]
+    stores = [pos[v.orig] for v in nodes if v.op_name.startswith('stor')]
+    assert stores == sorted(stores)
+
+
+def test_latency_is_hidden(graph):
+    divs_then_adds()
+    s = list_schedule(graph)
+    assert s.cycles < s.source_cycles
+    assert estimate_cycles(graph) == s.source_cycles
+    assert estimate_cycles(graph, s.ord) == s.cycles
+
+
+def test_scopes_keep_their_nodes(graph):
+    a, i = float_.var('a'), int32_.var('i')
+    (a * a).store(a, i)
+    graph.start_use_block(8)
+    (float_.var('b', start_scope=False) * a).store(a, int32_.var('j', start_scope=False))
+    graph.end_use_block()
+    (a + a).store(a, i)
+    nodes = graph.used_ordered()
+    ord = list_schedule(graph).ord
+    assert [nodes[n].scope_n for n in ord] == [v.scope_n for v in nodes]
+    assert len({v.scope_n for v in nodes}) == 2
@@ -0,0 +1,52 @@
+import io
+
+from speedutils.func import Func
+from speedutils.sink import BufferSink, FileSink, StreamSink
+from speedutils.vtypes import float_, int32_
+
+
+def test_counts_bytes_and_lines():
+    sink = BufferSink()
+    sink.write('a')
+    sink.write('bé\n')
+    assert sink.getvalue() == 'a\nbé\n'
+    assert (sink.bytes, sink.lines) == (6, 2)
+
+
+def test_write_lines_in_chunks():
+    sink = BufferSink()
+    sink.chunk_lines = 2
+    sink.write_lines(str(n) for n in range(5))
+    assert len(sink._chunks) == 3
+    assert sink.getvalue() == '0\n1\n2\n3\n4\n'
+
+
+def test_nested_sections_count_for_the_outer_one():
+    sink = BufferSink()
+    with sink.section('f'):
+        sink.write('x')
+        with sink.section('g'):
+            sink.write('y')
+    with sink.section('h'):
+        pass
+    assert [(s.name, s.lines) for s in sink.stats] == [('f', 2), ('h', 0)]
+
+
+def test_stream_and_file_sinks(tmp_path):
+    stream = io.StringIO()
+    StreamSink(stream).write_lines(['a', 'b'])
+    assert stream.getvalue() == 'a\nb\n'
+    with FileSink(tmp_path / 'out.c') as sink:
+        sink.write('int x;')
+    assert (tmp_path / 'out.c').read_text() == 'int x;\n'
+
+
+def test_func_gen_writes_to_sink(pd):
+    @Func(name='k')
+    def k():
+        (float_.var('a') + float_.var('b')).store(float_.var('out'), int32_.var('i'))
+
+    sink = BufferSink()
+    k.gen({}, sink=sink)
+    assert sink.getvalue() == k.gen_code({}) + '\n'
+    assert sink.stats[0].name == 'k'
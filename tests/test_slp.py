@@ -0,0 +1,89 @@
+from speedutils.func import Func
+from speedutils.slp import slp_vectorize
+from speedutils.vtypes import float_, int32_
+
+
+def idx(i, k):
+    return i + int32_.from_const(k) if k else i
+
+
+def elementwise(src=('a', 'b')):
+    # out[i + k] = a[i + k] * b[i + k] + c
+    a, b = map(float_.var, src)
+    out, c, i = float_.var('out'), float_.var('c'), int32_.var('i')
+    for k in range(4):
+        (float_.load(a, idx(i, k)) * float_.load(b, idx(i, k)) + c).store(out, idx(i, k))
+
+
+def op_names(graph):
+    return [v.op_name for v in graph.used_ordered()]
+
+
+def test_elementwise_kernel_is_packed(graph):
+    elementwise()
+    stats = slp_vectorize(graph, restrict=True)
+    assert stats.packs == 1 and stats.saved > 0
+    names = op_names(graph)
+    assert names.count('loadYv4f') == 2
+    assert 'mulYv4fXv4f' in names and 'addYv4fXv4f' in names and 'storYv4f' in names
+    assert not any(n.endswith('Xfloat') for n in names if n)
+    assert 'storYfloat' not in names
+
+
+def test_arrays_may_alias_by_default(graph):
+    elementwise()
+    assert slp_vectorize(graph).packs == 0
+    assert op_names(graph).count('storYfloat') == 4
+
+
+def test_values_without_loads_are_packed_by_default(graph):
+    out, i = float_.var('out'), int32_.var('i')
+    for k in range(4):
+        (float_.var(f'x{k}') * float_.var(f'y{k}')).store(out, idx(i, k))
+    assert slp_vectorize(graph).packs == 1
+    names = op_names(graph)
+    assert names.count('concatYv4f') == 2 and 'mulYv4fXv4f' in names
+
+
+def test_lane_used_outside_is_extracted(graph):
+    out, other, i = float_.var('out'), float_.var('other'), int32_.var('i')
+    lanes = [float_.var(f'x{k}') * float_.var(f'y{k}') for k in range(4)]
+    for k, v in enumerate(lanes):
+        v.store(out, idx(i, k))
+    lanes[2].store(other, i)
+    assert slp_vectorize(graph).packs == 1
+    extracts = [v for v in graph.used_ordered() if v.op is not None and v.op.name == 'get_elemYv4f']
+    assert len(extracts) == 1
+    assert extracts[0].code == '{}[2]'
+    assert 'mulYfloatXfloat' not in op_names(graph)
+
+
+def test_dependent_lanes_are_not_packed(graph):
+    out, x, i = float_.var('out'), float_.var('x'), int32_.var('i')
+    y = x
+    for k in range(4):
+        y = y * x  # each lane reads the one before
+        y.store(out, idx(i, k))
+    slp_vectorize(graph)
+    names = op_names(graph)
+    assert names.count('mulYfloatXfloat') == 4
+    assert 'mulYv4fXv4f' not in names
+
+
+def test_loads_of_the_stored_array_block_packing(graph):
+    # out[i + k] = out[i + k] * b[i + k] + c, the loads must stay before the stores
+    elementwise(src=('out', 'b'))
+    assert slp_vectorize(graph, restrict=True).packs == 0
+    assert op_names(graph).count('storYfloat') == 4
+
+
+def test_func_packs_loads_only_when_restrict(pd):
+    class Vectorized(Func):
+        vectorize = True
+
+    class Restricted(Vectorized):
+        restrict = True
+
+    plain, restricted = Vectorized(name='k').decor(elementwise), Restricted(name='k').decor(elementwise)
+    assert 'v4f' not in plain.gen_code({})
+    assert 'v4f' in restricted.gen_code({})
@@ -0,0 +1,74 @@
+import pytest
+
+from speedutils.func import Func
+from speedutils.proc_ctx import func_ctx
+from speedutils.tune import TuningDB, loop_space, set_default_tuning_db, tune
+from speedutils.vtypes import float_, int32_
+
+from .conftest import test_pd
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = TuningDB(tmp_path / 'tune.json')
+    set_default_tuning_db(db)
+    yield db
+    set_default_tuning_db(None)
+
+
+def test_loop_space_keeps_splits_inside(pd):
+    space = loop_space({'x': 16, 'y': 8}, block_sizes={'x': (1, 4, 3)}, splits={'y': (2, 4, 8)})
+    # 3 does not divide 16, 8 is the whole of y
+    assert {c['block_ddims'] for c in space} == {(), (('x', 4),)}
+    for c in space:
+        dims = c['loop_dims']
+        for n, size in dims:
+            if n == 'y' and size != 8:
+                assert dims.index(('y', size)) < dims.index(('y', 8))
+    assert sum(1 for c in space if len(c['loop_dims']) == 3) == 2 * 2 * 3
+    assert len(loop_space({'x': 16, 'y': 8}, reorder=False)) == 1
+
+
+def test_loop_space_runtime_sizes(pd):
+    space = loop_space({'x': 'n'}, block_sizes={'x': (1, 4)}, splits={'x': (8,)})
+    assert [c['loop_dims'] for c in space] == [
+        (('x', 'n'),), (('x', 8), ('x', 'n')), (('x', 'n'),), (('x', 8), ('x', 'n'))
+    ]
+
+
+def test_db_round_trip(db):
+    db.put('k', test_pd, {'loop_dims': (('x', 4), ('x', 16)), 'u': 2}, 10.0)
+    again = TuningDB(db.path)
+    assert again.get('k', test_pd) == {'loop_dims': (('x', 4), ('x', 16)), 'u': 2}
+    assert again.get('other', test_pd) is None
+
+
+def test_concurrent_saves_are_merged(tmp_path):
+    a, b = TuningDB(tmp_path / 'tune.json'), TuningDB(tmp_path / 'tune.json')
+    a.put('f', test_pd, {'u': 1}, 1.0)
+    b.put('g', test_pd, {'u': 2}, 2.0)
+    merged = TuningDB(tmp_path / 'tune.json')
+    assert merged.get('f', test_pd) == {'u': 1}
+    assert merged.get('g', test_pd) == {'u': 2}
+    assert b.get('f', test_pd) == {'u': 1}
+
+
+@Func(name='scaled')
+def scaled():
+    c = func_ctx.get_var('c', float_, const=True)
+    (float_.var('a') * c).store(float_.var('out'), int32_.var('i'))
+
+
+def test_tuned_opts_are_applied(pd, db):
+    db.put('scaled', test_pd, {'c': 3.0}, 1.0)
+    assert '3.0' in scaled.gen_code({})
+    # explicit opts win
+    code = scaled.gen_code({'c': 5.0})
+    assert '5.0' in code and '3.0' not in code
+
+
+def test_tune_stores_the_best(pd, db):
+    result = tune(scaled, [{'c': 1.5}, {'c': 2.5}], score=lambda f, o: o['c'], jobs=1, progress=None)
+    assert result.opts == {'c': 1.5}
+    assert len(result.trials) == 2
+    assert db.get('scaled', test_pd) == {'c': 1.5}